@@ -1,24 +1,44 @@
 # api/main.py
-from fastapi import FastAPI, HTTPException, Depends, Header, UploadFile, File, Query
+from fastapi import (
+    FastAPI, HTTPException, Depends, Header, Cookie, UploadFile, File, Query, Request, Response, BackgroundTasks
+)
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional, Tuple, Dict
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Any, List, Optional, Tuple, Dict
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime
 import io
-import re
+import os
+import time
 
 from pypdf import PdfReader
 
 from apps.db import (
-    get_conn, ensure_user, create_or_get_document,
-    delete_document_chunks, insert_chunks, insert_embeddings,
-    grant_owner, insert_retrieval_trace
+    get_conn, get_read_conn, note_write, ensure_user, create_or_get_document,
+    delete_document_chunks,
+    grant_owner, insert_retrieval_trace, get_corpus_version, bump_corpus_versions,
+    insert_retrieval_traces, vector_literal, embedding_table, READ_YOUR_WRITES_TTL_S
+)
+from apps import metrics
+from apps.metrics import stage, current_timer, ITEMS
+from apps.search_cache import SearchCache, search_cache, SEARCH_CACHE_ENABLED
+from apps.trace_retention import ensure_partitions
+from apps.rerank import reranker, rerank_order, RERANK_CANDIDATES
+from apps.slowlog import SlowRequestProbe, record_slow_request, list_slow_requests
+from apps.embeddings import (
+    embed_texts, EMBEDDING_MODEL, EMBEDDING_DIM, MAX_SEQ_TOKENS, MODEL_LOAD_SECONDS, PROVIDER
 )
-from apps.embeddings import embed_texts, EMBEDDING_MODEL
-from ingest.pii import redact_and_report
+from apps.openai_embed import EmbeddingError, InputTooLongError
+from ingest.pii import redact_and_report, get_analyzer, PROFILES
+from ingest.chunking import chunk_text, ChunkStats
+from ingest.dedup import plan_chunks, write_chunks
 
-app = FastAPI(title="Secure-RAG API")
+async def _label_route(request: Request) -> None:
+    # runs once routing has matched: label stage and DB metrics by route template, like the HTTP ones
+    current_timer().route = getattr(request.scope.get("route"), "path", "unmatched")
+
+app = FastAPI(title="Secure-RAG API", dependencies=[Depends(_label_route)])
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,8 +48,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Write-LSN"],
+)
+
+# load the default redaction profile's models up front, not on the first ingest
+get_analyzer()
+
+# ---------- metrics ----------
+MODEL_INFO = metrics.Gauge("securerag_embedding_model_info", "Loaded embedding model", ("provider", "model"))
+MODEL_INFO.set(1, provider=PROVIDER, model=EMBEDDING_MODEL)
+metrics.Gauge("securerag_embedding_dim", "Embedding dimension", fn=lambda: EMBEDDING_DIM)
+metrics.Gauge("securerag_embedding_max_seq_tokens", "Model max sequence length", fn=lambda: MAX_SEQ_TOKENS)
+metrics.Gauge("securerag_embedding_model_load_seconds", "Model load time at startup", fn=lambda: MODEL_LOAD_SECONDS)
+CHUNK_TOKENS = metrics.Histogram(
+    "securerag_chunk_tokens", "Tokens per ingested chunk",
+    buckets=(16, 32, 64, 128, 192, 256, 320, 384, 512),
 )
 
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    # the route is not known before routing; _label_route fills it in
+    timer = metrics.start_request("unmatched")
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        # label by route template, not raw path, to keep cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        elapsed = time.perf_counter() - t0
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=str(status))
+        metrics.HTTP_LATENCY.observe(elapsed, route=route, method=request.method)
+    if metrics.SERVER_TIMING:
+        response.headers["Server-Timing"] = ", ".join(
+            filter(None, [timer.server_timing(), f"total;dur={elapsed * 1000.0:.1f}"])
+        )
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.exception_handler(EmbeddingError)
+async def embedding_error_handler(request: Request, exc: EmbeddingError):
+    # the embedding provider is down or misconfigured; nothing was written
+    return JSONResponse(status_code=503, content={"detail": f"Embedding failed: {exc}"})
+
+@app.exception_handler(InputTooLongError)
+async def input_too_long_handler(request: Request, exc: InputTooLongError):
+    # e.g. a /search query over the model's input limit: retrying will not help
+    return JSONResponse(status_code=400, content={"detail": f"Input too long: {exc}"})
+
+# ---------- trace partitions ----------
+@app.on_event("startup")
+def ensure_trace_partitions():
+    # traces of a month without its partition would pile up in retrieval_trace_default
+    try:
+        with get_conn() as conn:
+            ensure_partitions(conn)
+    except Exception as e:
+        print(f"WARN: could not ensure retrieval_trace partitions: {e}")
+
 # ---------- auth ----------
 async def get_current_user(authorization: str = Header(None)) -> Tuple[UUID, str]:
     if not authorization or not authorization.startswith("Bearer "):
@@ -38,11 +118,28 @@ async def get_current_user(authorization: str = Header(None)) -> Tuple[UUID, str
     if not email:
         raise HTTPException(status_code=401, detail="Empty email token")
 
-    with get_conn() as conn:
-        user_id = ensure_user(conn, email=email, display_name=email)
-        conn.commit()
+    with stage("auth"):
+        with get_conn() as conn:
+            user_id = ensure_user(conn, email=email, display_name=email)
+            conn.commit()
     return user_id, email
 
+# ---------- read-your-writes ----------
+# /ingest returns the commit's LSN (cookie + header); the caller's next reads,
+# on whichever API process they land, wait for a replica that has replayed it
+WRITE_LSN_COOKIE = "securerag_write_lsn"
+WRITE_LSN_HEADER = "X-Write-LSN"
+
+def read_after_lsn(cookie_lsn: Optional[str] = Cookie(None, alias=WRITE_LSN_COOKIE),
+                   header_lsn: Optional[str] = Header(None, alias=WRITE_LSN_HEADER)) -> Optional[str]:
+    return header_lsn or cookie_lsn
+
+def _return_write_lsn(response: Response, lsn: Optional[str]) -> None:
+    if not lsn:
+        return
+    response.headers[WRITE_LSN_HEADER] = lsn
+    response.set_cookie(WRITE_LSN_COOKIE, lsn, max_age=int(READ_YOUR_WRITES_TTL_S), httponly=True, samesite="lax")
+
 class LoginRequest(BaseModel):
     email: str
 
@@ -66,15 +163,26 @@ class IngestRequest(BaseModel):
     title: str
     text: str
     source_key: Optional[str] = None
+    redaction_profile: Optional[str] = None   # fast | balanced | strict; default REDACTION_PROFILE
 
 class IngestResponse(BaseModel):
     doc_id: UUID
     chunks: int
     status: str
 
+class SearchFilters(BaseModel):
+    # all given conditions must hold (on the hit's document); /search only
+    doc_ids: Optional[List[UUID]] = None
+    source_key_prefix: Optional[str] = None
+    created_after: Optional[datetime] = None    # inclusive
+    created_before: Optional[datetime] = None   # exclusive
+    title_contains: Optional[str] = None        # case-insensitive substring
+
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    rerank: Optional[bool] = None   # None = server default (RERANK_ENABLED); /search only
+    filters: Optional[SearchFilters] = None
 
 class SearchHit(BaseModel):
     rank: int
@@ -82,11 +190,18 @@ class SearchHit(BaseModel):
     score: float         # cosine similarity
     title: str
     snippet: str
+    rerank_score: Optional[float] = None   # cross-encoder score, when reranked
 
 class SearchResponse(BaseModel):
     hits: List[SearchHit]
     trace_id: Optional[int] = None
 
+class SearchBatchRequest(BaseModel):
+    queries: List[SearchRequest]
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse]   # same order as the request's queries
+
 # Security stats models
 class RedactionSummaryRow(BaseModel):
     entity_type: str
@@ -104,25 +219,8 @@ class SecurityRunRow(BaseModel):
     micro_precision: float
     micro_recall: float
     micro_f1: float
-
-# ---------- simple chunker ----------
-_SENT_SPLIT = re.compile(r"(?<=[\.!?])\s+|\n{2,}")
-
-def simple_sent_chunk(text: str, max_len: int = 800) -> List[str]:
-    parts = [p.strip() for p in _SENT_SPLIT.split(text) if p.strip()]
-    chunks: List[str] = []
-    buf = ""
-    for p in parts:
-        if not buf:
-            buf = p
-        elif len(buf) + 1 + len(p) <= max_len:
-            buf = f"{buf} {p}"
-        else:
-            chunks.append(buf)
-            buf = p
-    if buf:
-        chunks.append(buf)
-    return chunks
+    profile: Optional[str] = None
+    docs_per_sec: Optional[float] = None
 
 # ---------- helper: redaction log insert ----------
 def _insert_redaction_counts(conn, doc_id: UUID, chunk_id: UUID, counts: Dict[str, int]) -> None:
@@ -139,47 +237,71 @@ def _insert_redaction_counts(conn, doc_id: UUID, chunk_id: UUID, counts: Dict[st
 
 # ---------- JSON ingest ----------
 @app.post("/ingest", response_model=IngestResponse)
-def ingest(req: IngestRequest, current: Tuple[UUID, str] = Depends(get_current_user)):
+def ingest(req: IngestRequest, response: Response, current: Tuple[UUID, str] = Depends(get_current_user)):
     if not req.text.strip():
         raise HTTPException(status_code=400, detail="Empty text")
 
+    if req.redaction_profile is not None and req.redaction_profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"redaction_profile must be one of {', '.join(PROFILES)}")
+
     user_id, _ = current
     title = req.title.strip() or "Untitled"
     source_key = (req.source_key or f"manual/{title.lower().replace(' ', '-')}" )
 
-    chunks_plain = simple_sent_chunk(req.text, max_len=800)
+    chunk_stats = ChunkStats()
+    with stage("chunk"):
+        chunks_plain = chunk_text(req.text, stats=chunk_stats)
+    for n in chunk_stats.lengths:
+        CHUNK_TOKENS.observe(n)
+    ITEMS.inc(len(chunk_stats.lengths), route="/ingest", kind="chunks")
+    ITEMS.inc(sum(chunk_stats.lengths), route="/ingest", kind="tokens")
+    ITEMS.inc(chunk_stats.split_sentences, route="/ingest", kind="split_sentences")
 
     # Redact + collect entity counts per chunk
     redacted_list: List[str] = []
     counts_list: List[Dict[str, int]] = []
-    for c in chunks_plain:
-        rc, counts = redact_and_report(c)
-        redacted_list.append(rc)
-        counts_list.append(counts)
+    with stage("redact"):
+        for c in chunks_plain:
+            rc, counts = redact_and_report(c, profile=req.redaction_profile)
+            redacted_list.append(rc)
+            counts_list.append(counts)
 
     if not redacted_list:
         raise HTTPException(400, detail="No usable content")
 
-    with get_conn() as conn:
-        doc_id, is_new = create_or_get_document(conn, owner_user_id=user_id, title=title, source_key=source_key)
-        # replace existing chunks/embeddings for this doc_id
-        delete_document_chunks(conn, doc_id)
-        chunk_ids = insert_chunks(conn, doc_id, redacted_list)
-        vecs = embed_texts(redacted_list)
-        insert_embeddings(conn, chunk_ids=chunk_ids, vectors=vecs, model_name=EMBEDDING_MODEL)
-        grant_owner(conn, doc_id, user_id)
+    with stage("dedup"):
+        with get_conn() as conn:
+            plan = plan_chunks(conn, redacted_list, exclude_source_key=source_key)
+    ITEMS.inc(plan.duplicates, route="/ingest", kind="near_duplicates")
 
-        # log PII counts per chunk
-        for chunk_id, counts in zip(chunk_ids, counts_list):
-            _insert_redaction_counts(conn, doc_id, chunk_id, counts)
+    # near-duplicates share their canonical chunk's vector
+    with stage("embed"):
+        vecs = embed_texts([redacted_list[i] for i in plan.canonical])
 
-        conn.commit()
+    with stage("db_write"):
+        with get_conn() as conn:
+            doc_id, is_new = create_or_get_document(conn, owner_user_id=user_id, title=title, source_key=source_key)
+            # replace existing chunks/embeddings for this doc_id
+            delete_document_chunks(conn, doc_id)
+            chunk_ids = write_chunks(conn, doc_id, redacted_list, plan, vecs, EMBEDDING_MODEL, embed_texts)
+            grant_owner(conn, doc_id, user_id)
+            bump_corpus_versions(conn, doc_id)
+
+            # log PII counts per chunk
+            for chunk_id, counts in zip(chunk_ids, counts_list):
+                _insert_redaction_counts(conn, doc_id, chunk_id, counts)
+
+            conn.commit()
+            # the user's next reads wait for a replica that has this commit
+            _return_write_lsn(response, note_write(conn, user_id))
+    ITEMS.inc(route="/ingest", kind="documents")
 
     return IngestResponse(doc_id=doc_id, chunks=len(chunk_ids), status=("created" if is_new else "replaced"))
 
 # ---------- File ingest ----------
 @app.post("/ingest_file", response_model=IngestResponse)
-async def ingest_file(file: UploadFile = File(...), current: Tuple[UUID, str] = Depends(get_current_user)):
+async def ingest_file(response: Response, file: UploadFile = File(...), redaction_profile: Optional[str] = Query(None),
+                      current: Tuple[UUID, str] = Depends(get_current_user)):
     name = file.filename or "upload"
     fn_lower = name.lower()
 
@@ -187,79 +309,396 @@ async def ingest_file(file: UploadFile = File(...), current: Tuple[UUID, str] =
     content_type = (file.content_type or "").lower()
     full_text = ""
 
-    if fn_lower.endswith(".pdf") or "pdf" in content_type:
-        reader = PdfReader(io.BytesIO(data))
-        full_text = "\n".join((page.extract_text() or "") for page in reader.pages)
-    elif fn_lower.endswith(".txt") or content_type.startswith("text/"):
-        full_text = data.decode("utf-8", errors="ignore")
-    else:
-        raise HTTPException(status_code=400, detail="Only .pdf and .txt supported for now")
+    with stage("extract"):
+        if fn_lower.endswith(".pdf") or "pdf" in content_type:
+            reader = PdfReader(io.BytesIO(data))
+            full_text = "\n".join((page.extract_text() or "") for page in reader.pages)
+        elif fn_lower.endswith(".txt") or content_type.startswith("text/"):
+            full_text = data.decode("utf-8", errors="ignore")
+        else:
+            raise HTTPException(status_code=400, detail="Only .pdf and .txt supported for now")
 
     if not full_text.strip():
         raise HTTPException(400, detail="No text extracted")
 
-    req = IngestRequest(title=name, text=full_text, source_key=f"upload/{fn_lower.replace(' ', '-')}")
-    return ingest(req, current)
+    req = IngestRequest(title=name, text=full_text, source_key=f"upload/{fn_lower.replace(' ', '-')}",
+                        redaction_profile=redaction_profile)
+    return ingest(req, response, current)
 
 # ---------- Search ----------
-@app.post("/search", response_model=SearchResponse)
-def search(req: SearchRequest, current: Tuple[UUID, str] = Depends(get_current_user)):
-    if not req.query.strip():
-        raise HTTPException(status_code=400, detail="Empty query")
-
-    user_id, _ = current
-    [qvec] = embed_texts([req.query])
-
-    dim = len(qvec)
+# Filtered searches that match at most this many chunks rank them exactly
+# (no ANN index); broader filters stay on the ivfflat scan.
+SEARCH_FILTER_EXACT_MAX = int(os.getenv("SEARCH_FILTER_EXACT_MAX", "20000"))
+# probes for broad filtered scans when pgvector has no iterative index scans (< 0.8)
+SEARCH_FILTER_PROBES = int(os.getenv("SEARCH_FILTER_PROBES", "20"))
+
+_ACL = """(d.owner_user_id = %s
+             OR EXISTS (SELECT 1 FROM document_acl a WHERE a.doc_id = d.doc_id AND a.user_id = %s))"""
+
+# A vector serves its canonical chunk and all near-duplicates of it (chunk.dup_of).
+# Pick one member the user may read, preferring the canonical, so each vector
+# yields at most one hit and never one from a document outside the user's ACL.
+def _visible_member(doc_filter: str = "") -> str:
+    return f"""
+    CROSS JOIN LATERAL (
+      SELECT c.chunk_id, c.redacted_text, d.title
+      FROM chunk c
+      JOIN document d ON d.doc_id = c.doc_id
+      WHERE COALESCE(c.dup_of, c.chunk_id) = emb.chunk_id
+        AND {_ACL}{doc_filter}
+      ORDER BY (c.dup_of IS NOT NULL), c.chunk_id
+      LIMIT 1
+    ) c"""
+
+_VISIBLE_MEMBER = _visible_member()
+
+def _filter_sql(f: Optional[SearchFilters]) -> Tuple[str, list]:
+    """SQL conditions on document d (each starting with AND) and their params."""
+    if f is None:
+        return "", []
+    sql, params = [], []
+    if f.doc_ids is not None:
+        sql.append("d.doc_id = ANY(%s)")
+        params.append(f.doc_ids)
+    if f.source_key_prefix:
+        sql.append("d.source_key LIKE %s")
+        params.append(_like_escape(f.source_key_prefix) + "%")
+    if f.created_after is not None:
+        sql.append("d.created_at >= %s")
+        params.append(f.created_after)
+    if f.created_before is not None:
+        sql.append("d.created_at < %s")
+        params.append(f.created_before)
+    if f.title_contains:
+        sql.append("d.title ILIKE %s")
+        params.append("%" + _like_escape(f.title_contains) + "%")
+    return "".join(f"\n        AND {c}" for c in sql), params
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _search_sql(dim: int, doc_filter: str = "", exact: bool = False, table: str = "chunk_embedding") -> str:
+    """
+    ANN query over `table` (see apps.db.embedding_table). With exact=True the vectors are limited up front to those of
+    chunks matching doc_filter (found through the document/chunk indexes) and
+    ranked by a full sort instead of the ivfflat index. A filtered ivfflat scan
+    may return rows slightly out of order (iterative scans), so it is re-sorted.
+    """
     placeholder = ",".join(["%s"] * dim)
-
+    cand = ""
+    source = f"{table} emb"
+    if exact:
+        cand = f""",
+    cand AS MATERIALIZED (
+      SELECT DISTINCT COALESCE(c.dup_of, c.chunk_id) AS emb_id
+      FROM document d
+      JOIN chunk c ON c.doc_id = d.doc_id
+      WHERE {_ACL}{doc_filter}
+    )"""
+        # OFFSET 0 keeps the planner from ordering through the ivfflat index
+        source = f"(SELECT e.* FROM {table} e JOIN cand ON e.chunk_id = cand.emb_id OFFSET 0) emb"
     sql = f"""
     WITH q AS (
       SELECT ARRAY[{placeholder}]::vector AS v
-    )
+    ){cand}
     SELECT
       c.chunk_id,
       -- convert L2 distance to cosine similarity for unit vectors: cos = 1 - (d^2)/2
       (1.0 - ((emb.embedding <-> q.v) * (emb.embedding <-> q.v)) / 2.0) AS score,
-      d.title,
+      c.title,
       CASE
         WHEN length(c.redacted_text) > 400 THEN substring(c.redacted_text for 400) || '…'
         ELSE c.redacted_text
       END AS snippet,
       (emb.embedding <-> q.v) AS dist
-    FROM chunk_embedding emb
-    JOIN chunk c ON c.chunk_id = emb.chunk_id
-    JOIN document d ON d.doc_id = c.doc_id
-    LEFT JOIN document_acl a ON a.doc_id = d.doc_id
+    FROM {source}
     JOIN q ON TRUE
-    WHERE d.owner_user_id = %s OR a.user_id = %s
+    {_visible_member(doc_filter)}
+    WHERE emb.model_name = %s
     ORDER BY dist ASC
-    LIMIT %s;
+    LIMIT %s
     """
+    if doc_filter and not exact:
+        return f"SELECT * FROM ({sql}) r ORDER BY r.dist;"
+    return sql.rstrip() + ";\n"
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, (*qvec, user_id, user_id, req.top_k))
-            rows = cur.fetchall()
+def _count_filtered(conn, user_id: UUID, doc_filter: str, filter_params: list, limit: int) -> int:
+    """Chunks the user can see that match the filters, counted up to limit + 1."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT count(*) FROM (
+              SELECT 1
+              FROM document d
+              JOIN chunk c ON c.doc_id = d.doc_id
+              WHERE {_ACL}{doc_filter}
+              LIMIT %s
+            ) s;
+        """, (user_id, user_id, *filter_params, limit + 1))
+        return cur.fetchone()[0]
+
+_iterative_scan: Optional[bool] = None
+
+def _enable_filtered_ann(conn) -> Dict[str, str]:
+    """
+    Keep scanning ivfflat lists until LIMIT rows pass the filters (pgvector
+    >= 0.8); on older versions fall back to more probes. Transaction-local;
+    returns the settings applied, so a slow-request EXPLAIN can replay them.
+    """
+    global _iterative_scan
+    with conn.cursor() as cur:
+        if _iterative_scan is None:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+            row = cur.fetchone()
+            version = tuple(int(x) for x in row[0].split(".")[:2]) if row else (0, 0)
+            _iterative_scan = version >= (0, 8)
+        if _iterative_scan:
+            cur.execute("SET LOCAL ivfflat.iterative_scan = relaxed_order;")
+            return {"ivfflat.iterative_scan": "relaxed_order"}
+        cur.execute(f"SET LOCAL ivfflat.probes = {int(SEARCH_FILTER_PROBES)};")
+        return {"ivfflat.probes": str(int(SEARCH_FILTER_PROBES))}
+
+def _chunk_texts(conn, chunk_ids: List[UUID]) -> Dict[UUID, str]:
+    """Full redacted text of rerank candidates (the ANN query only returns snippets)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT chunk_id, redacted_text FROM chunk WHERE chunk_id = ANY(%s);", (chunk_ids,))
+        return dict(cur.fetchall())
+
+@app.post("/search", response_model=SearchResponse)
+def search(req: SearchRequest, background: BackgroundTasks,
+           current: Tuple[UUID, str] = Depends(get_current_user),
+           after_lsn: Optional[str] = Depends(read_after_lsn)):
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
 
-    resp_hits: List[SearchHit] = []
-    trace_hits = []
-    for i, (chunk_id, score, title, snippet, _dist) in enumerate(rows, start=1):
-        resp_hits.append(SearchHit(
-            rank=i,
-            chunk_id=chunk_id,
-            score=float(score),
-            title=title,
-            snippet=snippet
-        ))
-        trace_hits.append((chunk_id, float(score)))
-
-    with get_conn() as trace_conn:
-        trace_id = insert_retrieval_trace(trace_conn, user_id, req.query, req.top_k, trace_hits)
-        trace_conn.commit()
+    probe = SlowRequestProbe("/search")
+    try:
+        user_id, _ = current
+        use_rerank = reranker is not None and req.rerank is not False
+        doc_filter, filter_params = _filter_sql(req.filters)
+        cache_key = SearchCache.key(user_id, req.query, req.top_k,
+                                    (EMBEDDING_MODEL, reranker.model_name if use_rerank else None,
+                                     (doc_filter, repr(filter_params)) if doc_filter else None))
+        sql = params = None
+        settings: Dict[str, str] = {}
+
+        with get_read_conn(user_id, after_lsn) as conn:
+            served_by = conn.server
+            with stage("cache_lookup"):
+                # read the version before searching: a concurrent ingest can only make the entry stale
+                version = get_corpus_version(conn, user_id)
+                rows = search_cache.get(cache_key, version) if SEARCH_CACHE_ENABLED else None
+
+            if rows is None:
+                with stage("embed"):
+                    [qvec] = embed_texts([req.query])
+
+                # reranking draws its top_k from a wider candidate set
+                n_fetch = max(req.top_k, RERANK_CANDIDATES) if use_rerank else req.top_k
+                exact = False
+                if doc_filter:
+                    with stage("filter"):
+                        exact = _count_filtered(conn, user_id, doc_filter, filter_params,
+                                                SEARCH_FILTER_EXACT_MAX) <= SEARCH_FILTER_EXACT_MAX
+                        if not exact:
+                            settings = _enable_filtered_ann(conn)
+                    ITEMS.inc(route="/search", kind="filtered_exact" if exact else "filtered_ann")
+                    member = (user_id, user_id, *filter_params)
+                    params = (*qvec, *(member if exact else ()), *member, EMBEDDING_MODEL, n_fetch)
+                else:
+                    params = (*qvec, user_id, user_id, EMBEDDING_MODEL, n_fetch)
+
+                with stage("ann_sql"):
+                    table = embedding_table(conn, EMBEDDING_MODEL)
+                    with conn.cursor() as cur:
+                        sql = _search_sql(len(qvec), doc_filter, exact=exact, table=table)
+                        cur.execute(sql, params)
+                        rows = cur.fetchall()
+                        # a model cutover may have moved our vectors since the last lookup
+                        if not rows and embedding_table(conn, EMBEDDING_MODEL, refresh=True) != table:
+                            table = embedding_table(conn, EMBEDDING_MODEL)
+                            sql = _search_sql(len(qvec), doc_filter, exact=exact, table=table)
+                            cur.execute(sql, params)
+                            rows = cur.fetchall()
+
+                complete = True
+                if use_rerank and rows:
+                    with stage("rerank"):
+                        scores, outcome = reranker.score(
+                            req.query, [r[0] for r in rows], lambda ids: _chunk_texts(conn, ids)
+                        )
+                        rows = rerank_order(rows, scores)[:req.top_k]
+                    # results degraded by the budget depend on load; don't pin them in the cache
+                    complete = outcome in ("full", "cached")
+                if SEARCH_CACHE_ENABLED and complete:
+                    search_cache.put(cache_key, version, rows)
+
+        resp_hits: List[SearchHit] = []
+        trace_hits = []
+        for i, row in enumerate(rows, start=1):
+            chunk_id, score, title, snippet = row[:4]
+            resp_hits.append(SearchHit(
+                rank=i,
+                chunk_id=chunk_id,
+                score=float(score),
+                title=title,
+                snippet=snippet,
+                rerank_score=(row[5] if len(row) > 5 else None),
+            ))
+            trace_hits.append((chunk_id, float(score)))
+
+        timer = current_timer()
+        with stage("trace_write"):
+            with get_conn() as trace_conn:
+                trace_id = insert_retrieval_trace(
+                    trace_conn, user_id, req.query, req.top_k, trace_hits, stage_timings=timer.as_ms()
+                )
+                trace_conn.commit()
+        ITEMS.inc(route="/search", kind="queries")
+        ITEMS.inc(len(trace_hits), route="/search", kind="hits")
+    finally:
+        # stop the profiler even if the handler raised; auth ran as a dependency before it started
+        slow_ms = probe.finish(extra_ms=current_timer().as_ms().get("auth", 0.0))
+    if slow_ms is not None:
+        background.add_task(
+            record_slow_request, "/search", user_id, req.query, req.top_k, slow_ms,
+            timer.as_ms(), sql, params, settings, probe.profile(), trace_id, served_by,
+        )
 
     return SearchResponse(hits=resp_hits, trace_id=trace_id)
 
+# ---------- Batch search ----------
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "64"))
+
+# One round trip for all queries: each (vector, top_k) pair drives a LATERAL
+# ANN lookup with the same model/ACL predicate as /search.
+_SEARCH_BATCH_SQL_TEMPLATE = """
+WITH q AS (
+  SELECT t.ord, t.v::vector AS v, t.k
+  FROM unnest(%s::text[], %s::int[]) WITH ORDINALITY AS t(v, k, ord)
+)
+SELECT q.ord, h.chunk_id, h.score, h.title, h.snippet, h.dist
+FROM q
+CROSS JOIN LATERAL (
+  SELECT
+    c.chunk_id,
+    (1.0 - ((emb.embedding <-> q.v) * (emb.embedding <-> q.v)) / 2.0) AS score,
+    c.title,
+    CASE
+      WHEN length(c.redacted_text) > 400 THEN substring(c.redacted_text for 400) || '…'
+      ELSE c.redacted_text
+    END AS snippet,
+    (emb.embedding <-> q.v) AS dist
+  FROM {table} emb
+  """ + _VISIBLE_MEMBER + """
+  WHERE emb.model_name = %s
+  ORDER BY dist ASC
+  LIMIT q.k
+) h
+ORDER BY q.ord, h.dist;
+"""
+
+def _search_batch_sql(table: str) -> str:
+    return _SEARCH_BATCH_SQL_TEMPLATE.replace("{table}", table)
+
+@app.post("/search_batch", response_model=SearchBatchResponse)
+def search_batch(req: SearchBatchRequest, current: Tuple[UUID, str] = Depends(get_current_user),
+                 after_lsn: Optional[str] = Depends(read_after_lsn)):
+    if not req.queries:
+        raise HTTPException(status_code=400, detail="No queries")
+    if len(req.queries) > SEARCH_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SEARCH_BATCH_MAX} queries per batch")
+    if any(not q.query.strip() for q in req.queries):
+        raise HTTPException(status_code=400, detail="Empty query")
+    if any(q.filters is not None for q in req.queries):
+        raise HTTPException(status_code=400, detail="filters are only supported by /search")
+    if any(q.rerank for q in req.queries):
+        raise HTTPException(status_code=400, detail="rerank is only supported by /search")
+
+    user_id, _ = current
+    n = len(req.queries)
+    rows_by_query: List[Optional[list]] = [None] * n
+    keys = [SearchCache.key(user_id, q.query, q.top_k, (EMBEDDING_MODEL,)) for q in req.queries]
+
+    with get_read_conn(user_id, after_lsn) as conn:
+        with stage("cache_lookup"):
+            version = get_corpus_version(conn, user_id)
+            if SEARCH_CACHE_ENABLED:
+                rows_by_query = [search_cache.get(k, version) for k in keys]
+        todo = [i for i in range(n) if rows_by_query[i] is None]
+
+        if todo:
+            with stage("embed"):
+                vecs = embed_texts([req.queries[i].query for i in todo])
+            for i in todo:
+                rows_by_query[i] = []
+            with stage("ann_sql"):
+                params = ([vector_literal(v) for v in vecs], [req.queries[i].top_k for i in todo],
+                          user_id, user_id, EMBEDDING_MODEL)
+                table = embedding_table(conn, EMBEDDING_MODEL)
+                with conn.cursor() as cur:
+                    cur.execute(_search_batch_sql(table), params)
+                    found = cur.fetchall()
+                    # a model cutover may have moved our vectors since the last lookup
+                    if not found and embedding_table(conn, EMBEDDING_MODEL, refresh=True) != table:
+                        cur.execute(_search_batch_sql(embedding_table(conn, EMBEDDING_MODEL)), params)
+                        found = cur.fetchall()
+                    for ord_, chunk_id, score, title, snippet, dist in found:
+                        rows_by_query[todo[ord_ - 1]].append((chunk_id, score, title, snippet, dist))
+            if SEARCH_CACHE_ENABLED:
+                for i in todo:
+                    search_cache.put(keys[i], version, rows_by_query[i])
+
+    trace_items = []
+    for q, rows in zip(req.queries, rows_by_query):
+        trace_items.append((q.query, q.top_k, [(r[0], float(r[1])) for r in rows]))
+
+    timer = current_timer()
+    with stage("trace_write"):
+        with get_conn() as trace_conn:
+            trace_ids = insert_retrieval_traces(trace_conn, user_id, trace_items, stage_timings=timer.as_ms())
+            trace_conn.commit()
+    ITEMS.inc(n, route="/search_batch", kind="queries")
+    ITEMS.inc(sum(len(r) for r in rows_by_query), route="/search_batch", kind="hits")
+
+    results = []
+    for rows, trace_id in zip(rows_by_query, trace_ids):
+        hits = [
+            SearchHit(rank=i, chunk_id=chunk_id, score=float(score), title=title, snippet=snippet)
+            for i, (chunk_id, score, title, snippet, _dist) in enumerate(rows, start=1)
+        ]
+        results.append(SearchResponse(hits=hits, trace_id=trace_id))
+    return SearchBatchResponse(results=results)
+
+# ---------- Slow requests ----------
+class SlowRequestRow(BaseModel):
+    slow_id: int
+    created_at: datetime
+    route: str
+    user_id: Optional[UUID]
+    query_text: str
+    top_k: int
+    total_ms: float
+    stage_timings: Dict[str, float]
+    plan: Optional[Any] = None
+    profile: Optional[Dict[str, Any]] = None
+    trace_id: Optional[int] = None
+    served_by: Optional[str] = None     # server that ran the search: primary or a replica name
+    plan_server: Optional[str] = None   # server the plan was captured on (primary if that replica was unreachable)
+
+@app.get("/slow_requests", response_model=List[SlowRequestRow])
+def slow_requests(current: Tuple[UUID, str] = Depends(get_current_user),
+                  limit: int = Query(50, ge=1, le=500)):
+    user_id, email = current
+    rows = list_slow_requests(user_id, email, limit)
+    return [
+        SlowRequestRow(
+            slow_id=r[0], created_at=r[1], route=r[2], user_id=r[3], query_text=r[4],
+            top_k=r[5], total_ms=float(r[6]), stage_timings=r[7] or {}, plan=r[8],
+            profile=r[9], trace_id=r[10], served_by=r[11], plan_server=r[12],
+        )
+        for r in rows
+    ]
+
 # ---------- Leaderboard (Recall@K) ----------
 class LeaderboardRow(BaseModel):
     eval_id: int
@@ -281,8 +720,9 @@ class LeaderboardResponse(BaseModel):
     rows: List[LeaderboardRow]
 
 @app.get("/leaderboard", response_model=LeaderboardResponse)
-def leaderboard(current: Tuple[UUID, str] = Depends(get_current_user), limit: int = 200):
-    with get_conn() as conn:
+def leaderboard(current: Tuple[UUID, str] = Depends(get_current_user), limit: int = 200,
+                after_lsn: Optional[str] = Depends(read_after_lsn)):
+    with get_read_conn(current[0], after_lsn) as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT COALESCE(AVG(recall_at_k), 0.0)::float, COUNT(*), MAX(created_at)
@@ -321,9 +761,10 @@ def leaderboard(current: Tuple[UUID, str] = Depends(get_current_user), limit: in
 
 # ---------- Security stats ----------
 @app.get("/security_stats", response_model=SecurityStats)
-def security_stats(current: Tuple[UUID, str] = Depends(get_current_user)):
+def security_stats(current: Tuple[UUID, str] = Depends(get_current_user),
+                   after_lsn: Optional[str] = Depends(read_after_lsn)):
     def _fetch_rows(where: str = "", params: tuple = ()) -> List[RedactionSummaryRow]:
-        with get_conn() as conn:
+        with get_read_conn(current[0], after_lsn) as conn:
             with conn.cursor() as cur:
                 cur.execute(f"""
                     SELECT entity_type, COALESCE(SUM(count),0)::bigint
@@ -341,12 +782,13 @@ def security_stats(current: Tuple[UUID, str] = Depends(get_current_user)):
     return SecurityStats(totals=totals, last_7d=last_7d, last_24h=last_24h)
 
 @app.get("/security_runs", response_model=List[SecurityRunRow])
-def security_runs(current: Tuple[UUID, str] = Depends(get_current_user), limit: int = Query(20, ge=1, le=200)):
-    with get_conn() as conn:
+def security_runs(current: Tuple[UUID, str] = Depends(get_current_user), limit: int = Query(20, ge=1, le=200),
+                  after_lsn: Optional[str] = Depends(read_after_lsn)):
+    with get_read_conn(current[0], after_lsn) as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT r.run_id, r.created_at, r.notes,
-                       o.micro_precision, o.micro_recall, o.micro_f1
+                       o.micro_precision, o.micro_recall, o.micro_f1, r.profile, r.docs_per_sec
                 FROM pii_eval_run r
                 JOIN pii_eval_overall o USING (run_id)
                 ORDER BY r.created_at DESC
@@ -356,7 +798,8 @@ def security_runs(current: Tuple[UUID, str] = Depends(get_current_user), limit:
     out = [
         SecurityRunRow(
             run_id=r[0], created_at=r[1], notes=r[2],
-            micro_precision=float(r[3]), micro_recall=float(r[4]), micro_f1=float(r[5])
+            micro_precision=float(r[3]), micro_recall=float(r[4]), micro_f1=float(r[5]),
+            profile=r[6], docs_per_sec=(float(r[7]) if r[7] is not None else None)
         )
         for r in rows
     ]
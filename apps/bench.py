@@ -0,0 +1,41 @@
+# apps/bench.py
+"""
+Helpers shared by the measurement scripts (scripts/load_test.py,
+scripts/eval_recall.py, scripts/index_maintenance.py) and apps/vector_index.py:
+the default held-out query files, loading query texts from them, and the
+nearest-rank percentile used for every p50/p95/p99 they report.
+"""
+import glob
+import json
+import os
+import random
+from typing import List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUERIES = sorted(glob.glob(os.path.join(ROOT, "datasets", "*", "queries.jsonl"))
+                         + glob.glob(os.path.join(ROOT, "samples", "*gold*.json")))
+
+
+def percentile(xs: Sequence[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p * len(xs)))] if xs else 0.0
+
+
+def load_queries(paths: Sequence[str], n: Optional[int] = None, seed: int = 0) -> List[str]:
+    """Query texts from BEIR queries.jsonl ({"text": ...} per line) and gold files ([{"query": ...}]).
+
+    With n, a fixed sample of n distinct queries, so repeated runs compare like with like.
+    """
+    out = []
+    for path in paths:
+        with open(path, "r") as f:
+            if path.endswith(".jsonl"):
+                out.extend(json.loads(line)["text"] for line in f if line.strip())
+            else:
+                out.extend(item["query"] for item in json.load(f))
+    out = [q for q in out if q.strip()]
+    if n is None:
+        return out
+    out = sorted(set(out))
+    return random.Random(seed).sample(out, min(n, len(out)))
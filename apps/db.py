@@ -1,15 +1,252 @@
 # apps/db.py
+import itertools
 import os
 import psycopg
+import threading
 import uuid
-from typing import List, Tuple, Optional
+import time
+from typing import Dict, List, Tuple, Optional
 from dotenv import load_dotenv
+from psycopg.types.json import Jsonb
+
+from apps.metrics import Counter, Gauge, Histogram, current_timer
 
 load_dotenv()
-DSN = os.getenv("POSTGRES_DSN")
+DSN = os.getenv("POSTGRES_DSN")  # primary: all writes, and reads when no replica qualifies
+
+# Read replicas (comma-separated DSNs). Reads that go through get_read_conn use a
+# replica whose replay lag is under REPLICA_MAX_LAG_MS, and which has replayed
+# the user's own last write (read-your-writes), else the primary.
+REPLICA_DSNS = [d.strip() for d in os.getenv("POSTGRES_REPLICA_DSNS", "").split(",") if d.strip()]
+REPLICA_MAX_LAG_MS = float(os.getenv("REPLICA_MAX_LAG_MS", "2000"))
+REPLICA_STATUS_TTL_S = float(os.getenv("REPLICA_STATUS_TTL_S", "1.0"))     # how long a lag reading is trusted
+REPLICA_RETRY_S = float(os.getenv("REPLICA_RETRY_S", "5.0"))               # back-off after a failed connect
+READ_YOUR_WRITES_TTL_S = float(os.getenv("READ_YOUR_WRITES_TTL_S", "60"))  # how long a user's write LSN is tracked
+EMBEDDING_TABLE_TTL_S = float(os.getenv("EMBEDDING_TABLE_TTL_S", "5"))      # how long embedding_table() trusts a lookup
+
+DB_CONNECTS = Counter("securerag_db_connects_total", "Postgres connections opened")
+DB_CONNECT_LATENCY = Histogram("securerag_db_connect_seconds", "Time to open a Postgres connection")
+DB_CONNECTIONS_OPEN = Gauge("securerag_db_connections_open", "Postgres connections currently open")
+DB_QUERIES = Counter("securerag_db_queries_total", "SQL statements executed, by request route and target",
+                     ("route", "target"))
+DB_READ_ROUTING = Counter(
+    "securerag_db_read_routing_total",
+    "Read connections by outcome (replica, or the reason a replica was passed over: lag, down, read_your_writes)",
+    ("outcome",),
+)
+REPLICA_LAG = Gauge("securerag_db_replica_lag_ms", "Last observed replay lag per replica", ("replica",))
+
+
+class _CountingCursor(psycopg.Cursor):
+    """Counts statements per request route (see apps.metrics.start_request) and target."""
+
+    def _count(self) -> None:
+        DB_QUERIES.inc(route=current_timer().route, target=getattr(self.connection, "target", "primary"))
+
+    def execute(self, *args, **kwargs):
+        self._count()
+        return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._count()
+        return super().executemany(*args, **kwargs)
+
+    def copy(self, *args, **kwargs):
+        self._count()
+        return super().copy(*args, **kwargs)
+
+
+class _TrackedConnection(psycopg.Connection):
+    """psycopg connection that keeps the open-connections gauge up to date."""
+    target = "primary"   # metrics label: primary or replica
+    server = "primary"   # which server: primary, or the replica's name (see connect_server)
+
+    def close(self) -> None:
+        if not self.closed:
+            DB_CONNECTIONS_OPEN.dec()
+        super().close()
+
+
+def _connect(dsn: str, target: str, server: Optional[str] = None) -> _TrackedConnection:
+    t0 = time.perf_counter()
+    conn = _TrackedConnection.connect(dsn, cursor_factory=_CountingCursor)
+    conn.target = target
+    conn.server = server or target
+    DB_CONNECT_LATENCY.observe(time.perf_counter() - t0)
+    DB_CONNECTS.inc()
+    DB_CONNECTIONS_OPEN.inc()
+    return conn
+
 
 def get_conn():
-    return psycopg.connect(DSN)
+    """Connection to the primary."""
+    return _connect(DSN, "primary")
+
+
+# ---------- read routing ----------
+def parse_lsn(lsn: Optional[str]) -> Optional[int]:
+    """'16/B374D848' -> comparable int."""
+    if not lsn:
+        return None
+    hi, lo = lsn.split("/")
+    return (int(hi, 16) << 32) | int(lo, 16)
+
+
+class _Replica:
+    def __init__(self, name: str, dsn: str):
+        self.name = name
+        self.dsn = dsn
+        self.lag_ms = 0.0
+        self.replay_lsn: Optional[int] = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+
+    def refresh(self, conn) -> None:
+        """Read lag and replay position on conn (one round trip)."""
+        with conn.cursor() as cur:
+            # an idle primary writes no WAL, so "no replay pending" counts as zero lag;
+            # a server that is not in recovery (a stand-in copy) has no replay position
+            cur.execute("""
+                SELECT pg_last_wal_replay_lsn()::text,
+                       CASE WHEN NOT pg_is_in_recovery()
+                              OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) * 1000, 0)
+                       END::float8;
+            """)
+            lsn, lag_ms = cur.fetchone()
+        conn.commit()
+        self.replay_lsn, self.lag_ms, self.checked_at = parse_lsn(lsn), lag_ms, time.monotonic()
+        REPLICA_LAG.set(lag_ms, replica=self.name)
+        _saw_lsn(self.replay_lsn)
+
+
+_replicas = [_Replica(f"replica{i}", dsn) for i, dsn in enumerate(REPLICA_DSNS)]
+_next_replica = itertools.count()
+_write_lsn: Dict[uuid.UUID, Tuple[int, float]] = {}   # user_id -> (LSN after their last write, when)
+_newest_lsn = 0   # highest WAL position this process has seen (its own writes, replica replay)
+_routing_lock = threading.Lock()
+
+
+def _saw_lsn(lsn: Optional[int]) -> None:
+    global _newest_lsn
+    if lsn is not None:
+        with _routing_lock:
+            _newest_lsn = max(_newest_lsn, lsn)
+
+
+def note_write(conn, user_id) -> Optional[str]:
+    """
+    Call right after committing a user's write on the primary: their reads are
+    then only served by replicas that have replayed past it. Tracked in-process
+    for READ_YOUR_WRITES_TTL_S; the LSN is also returned (None without replicas)
+    so the API can hand it to the client, whose next request may land on another
+    process and passes it back to get_read_conn.
+    """
+    if not _replicas:
+        return None
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()::text;")
+        lsn_text = cur.fetchone()[0]
+    conn.commit()
+    _saw_lsn(parse_lsn(lsn_text))
+    now = time.monotonic()
+    with _routing_lock:
+        _write_lsn[user_id] = (parse_lsn(lsn_text), now)
+        for uid in [u for u, (_, at) in _write_lsn.items() if now - at > READ_YOUR_WRITES_TTL_S]:
+            del _write_lsn[uid]
+    return lsn_text
+
+
+def _pending_lsn(user_id) -> Optional[int]:
+    if user_id is None:
+        return None
+    with _routing_lock:
+        entry = _write_lsn.get(user_id)
+        if entry is None:
+            return None
+        lsn, at = entry
+        if time.monotonic() - at > READ_YOUR_WRITES_TTL_S:
+            del _write_lsn[user_id]
+            return None
+        return lsn
+
+
+def _client_lsn(lsn: Optional[str]) -> Optional[int]:
+    try:
+        return parse_lsn(lsn)
+    except ValueError:  # malformed value from a client: ignore it
+        return None
+
+
+def get_read_conn(user_id=None, after_lsn: Optional[str] = None):
+    """
+    Connection for read-only work: the next replica (round robin) that is up,
+    within REPLICA_MAX_LAG_MS and past both user_id's last write seen by this
+    process and after_lsn (an LSN note_write returned to the client, possibly in
+    another process); otherwise the primary. Never write through it.
+    """
+    if not _replicas:
+        return get_conn()
+    client_lsn = _client_lsn(after_lsn)
+    if client_lsn is not None and client_lsn > _newest_lsn:
+        # written through another process and not yet seen replayed anywhere (or a bogus
+        # value): only the primary is known to have it, so don't probe every replica
+        DB_READ_ROUTING.inc(outcome="read_your_writes")
+        DB_READ_ROUTING.inc(outcome="primary")
+        return get_conn()
+    pending = [x for x in (_pending_lsn(user_id), client_lsn) if x is not None]
+    min_lsn = max(pending) if pending else None
+    start = next(_next_replica)
+    now = time.monotonic()
+    for i in range(len(_replicas)):
+        replica = _replicas[(start + i) % len(_replicas)]
+        if replica.down_until > now:
+            DB_READ_ROUTING.inc(outcome="down")
+            continue
+        if now - replica.checked_at < REPLICA_STATUS_TTL_S and replica.lag_ms > REPLICA_MAX_LAG_MS:
+            DB_READ_ROUTING.inc(outcome="lag")
+            continue
+        try:
+            conn = _connect(replica.dsn, "replica", replica.name)
+        except psycopg.OperationalError:
+            replica.down_until = now + REPLICA_RETRY_S
+            DB_READ_ROUTING.inc(outcome="down")
+            continue
+        try:
+            stale = now - replica.checked_at >= REPLICA_STATUS_TTL_S
+            if stale or (min_lsn is not None and (replica.replay_lsn or 0) < min_lsn):
+                replica.refresh(conn)
+        except psycopg.Error:
+            conn.close()
+            replica.down_until = now + REPLICA_RETRY_S
+            DB_READ_ROUTING.inc(outcome="down")
+            continue
+        if replica.lag_ms > REPLICA_MAX_LAG_MS:
+            outcome = "lag"
+        elif min_lsn is not None and (replica.replay_lsn is None or replica.replay_lsn < min_lsn):
+            outcome = "read_your_writes"
+        else:
+            DB_READ_ROUTING.inc(outcome="replica")
+            return conn
+        conn.close()
+        DB_READ_ROUTING.inc(outcome=outcome)
+    DB_READ_ROUTING.inc(outcome="primary")
+    return get_conn()
+
+
+def connect_server(server: str):
+    """
+    Connection to a specific server by conn.server name, e.g. to re-run a query
+    where it was served. Falls back to the primary if the replica is unknown or
+    down; check conn.server to see where you are.
+    """
+    for replica in _replicas:
+        if replica.name == server:
+            try:
+                return _connect(replica.dsn, "replica", replica.name)
+            except psycopg.OperationalError:
+                break
+    return get_conn()
 
 def ensure_user(conn, email: str, display_name: str) -> uuid.UUID:
     with conn.cursor() as cur:
@@ -37,6 +274,54 @@ def grant_owner(conn, doc_id, user_id):
             VALUES (%s, %s, 'owner')
             ON CONFLICT (doc_id, user_id) DO UPDATE SET role='owner';
         """, (doc_id, user_id))
+    # the grantee's visible corpus changed
+    bump_user_corpus_version(conn, user_id)
+
+def grant_viewers(conn, doc_id, user_ids) -> None:
+    """Share doc_id read-only with user_ids (existing grants, incl. owner, are kept)."""
+    if not user_ids:
+        return
+    with conn.cursor() as cur:
+        cur.executemany("""
+            INSERT INTO document_acl (doc_id, user_id, role)
+            VALUES (%s, %s, 'viewer')
+            ON CONFLICT (doc_id, user_id) DO NOTHING;
+        """, [(doc_id, u) for u in user_ids])
+    bump_corpus_versions(conn, doc_id)
+
+def get_corpus_version(conn, user_id) -> int:
+    """Current corpus version of a user (0 if they never had a change)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM user_corpus_version WHERE user_id = %s;", (user_id,))
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_user_corpus_version(conn, user_id) -> None:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO user_corpus_version (user_id, version)
+            VALUES (%s, 1)
+            ON CONFLICT (user_id) DO UPDATE
+              SET version = user_corpus_version.version + 1, updated_at = NOW();
+        """, (user_id,))
+
+def bump_corpus_versions(conn, doc_id) -> None:
+    """
+    Invalidate cached searches of everyone who can see doc_id (owner + ACL).
+    Call in the same transaction that changes the document's chunks/embeddings.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO user_corpus_version (user_id, version)
+            SELECT u, 1 FROM (
+              SELECT owner_user_id AS u FROM document WHERE doc_id = %s AND owner_user_id IS NOT NULL
+              UNION
+              SELECT user_id FROM document_acl WHERE doc_id = %s
+            ) s
+            ORDER BY u  -- stable lock order across concurrent ingests
+            ON CONFLICT (user_id) DO UPDATE
+              SET version = user_corpus_version.version + 1, updated_at = NOW();
+        """, (doc_id, doc_id))
 
 def insert_chunks(conn, doc_id, texts):
     ids = []
@@ -53,12 +338,13 @@ def insert_chunks(conn, doc_id, texts):
 
 def insert_embeddings(conn, chunk_ids, vectors, model_name: str):
     assert len(chunk_ids) == len(vectors)
+    table = embedding_table(conn, model_name)
     with conn.cursor() as cur:
         for cid, vec in zip(chunk_ids, vectors):
             dim = len(vec)
             placeholder = ",".join(["%s"] * dim)
             cur.execute(
-                f"INSERT INTO chunk_embedding (chunk_id, embedding, model_name) "
+                f"INSERT INTO {table} (chunk_id, embedding, model_name) "
                 f"VALUES (%s, ARRAY[{placeholder}]::vector, %s) "
                 f"ON CONFLICT (chunk_id) DO UPDATE "
                 f"SET embedding = EXCLUDED.embedding, model_name = EXCLUDED.model_name;",
@@ -97,8 +383,41 @@ def create_or_get_document(conn, owner_user_id: int, title: str, source_key: str
 def delete_document_chunks(conn, doc_id: int) -> None:
     """
     Remove all chunks & embeddings for a given document.
+    Canonical chunks that other documents' near-duplicates point at hand their
+    embedding and LSH rows to one of those duplicates first.
     """
     with conn.cursor() as cur:
+        # Writers take FOR KEY SHARE on a canonical (lock_chunks) before pointing
+        # dup_of at it; FOR UPDATE waits for those transactions, so every
+        # duplicate is visible to the heir query below, and later writers find
+        # the rows gone and embed their chunks themselves.
+        cur.execute("SELECT chunk_id FROM chunk WHERE doc_id = %s FOR UPDATE;", (doc_id,))
+        cur.execute("""
+            SELECT DISTINCT ON (c.dup_of) c.dup_of, c.chunk_id
+            FROM chunk c
+            JOIN chunk o ON o.chunk_id = c.dup_of
+            WHERE o.doc_id = %s AND c.doc_id <> %s
+            ORDER BY c.dup_of, c.chunk_id;
+        """, (doc_id, doc_id))
+        heirs = cur.fetchall()
+        if heirs:
+            params = ([h[0] for h in heirs], [h[1] for h in heirs])
+            cur.execute("SELECT t FROM unnest(%s::text[]) t WHERE to_regclass('public.' || t) IS NOT NULL;",
+                        (list(EMBEDDING_TABLES),))
+            # mid-migration the heir needs its vectors for both models
+            tables = [r[0] for r in cur.fetchall()] + ["chunk_minhash", "chunk_lsh"]
+            for table in tables:
+                cur.execute(f"""
+                    UPDATE {table} t SET chunk_id = h.new_id
+                    FROM unnest(%s::uuid[], %s::uuid[]) AS h(old_id, new_id)
+                    WHERE t.chunk_id = h.old_id;
+                """, params)
+            cur.execute("""
+                UPDATE chunk c
+                SET dup_of = CASE WHEN c.chunk_id = h.new_id THEN NULL ELSE h.new_id END
+                FROM unnest(%s::uuid[], %s::uuid[]) AS h(old_id, new_id)
+                WHERE c.dup_of = h.old_id AND c.doc_id <> %s;
+            """, (*params, doc_id))
         cur.execute("""
             DELETE FROM chunk_embedding
             WHERE chunk_id IN (SELECT chunk_id FROM chunk WHERE doc_id = %s);
@@ -106,23 +425,188 @@ def delete_document_chunks(conn, doc_id: int) -> None:
         cur.execute("DELETE FROM chunk WHERE doc_id = %s;", (doc_id,))
 
     
-def insert_retrieval_trace(conn, user_id, query_text: str, top_k: int, hits):
+def insert_retrieval_trace(conn, user_id, query_text: str, top_k: int, hits, stage_timings=None):
     """
     hits: list of (chunk_id, score) ordered by rank
+    stage_timings: optional {stage: milliseconds} recorded with the trace
     Returns trace_id
     """
     with conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO retrieval_trace (user_id, query_text, top_k, created_at)
-            VALUES (%s, %s, %s, NOW())
-            RETURNING trace_id;
-        """, (user_id, query_text, top_k))
-        trace_id = cur.fetchone()[0]
+            INSERT INTO retrieval_trace (user_id, query_text, top_k, stage_timings, created_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            RETURNING trace_id, created_at;
+        """, (user_id, query_text, top_k, Jsonb(stage_timings) if stage_timings else None))
+        trace_id, created_at = cur.fetchone()
 
+        # hits carry the trace's created_at: both tables are partitioned on it
         for rank, (cid, score) in enumerate(hits, start=1):
             cur.execute("""
-                INSERT INTO retrieval_trace_hit (trace_id, rank, chunk_id, score)
-                VALUES (%s, %s, %s, %s);
-            """, (trace_id, rank, cid, score))
+                INSERT INTO retrieval_trace_hit (trace_id, rank, chunk_id, score, created_at)
+                VALUES (%s, %s, %s, %s, %s);
+            """, (trace_id, rank, cid, score, created_at))
 
     return trace_id
+
+
+def vector_literal(vec) -> str:
+    """pgvector text form '[x1,x2,...]' (one bind parameter instead of one per dimension)."""
+    return "[" + ",".join(repr(float(x)) for x in vec) + "]"
+
+
+def insert_retrieval_traces(conn, user_id, queries, stage_timings=None):
+    """
+    Bulk version of insert_retrieval_trace.
+    queries: list of (query_text, top_k, hits) with hits = [(chunk_id, score), ...] by rank
+    Returns trace_ids in the same order as queries.
+    """
+    if not queries:
+        return []
+    timings = Jsonb(stage_timings) if stage_timings else None
+    with conn.cursor() as cur:
+        # reserve ids up front so the id <-> query mapping does not depend on RETURNING order
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('retrieval_trace', 'trace_id')) "
+            "FROM generate_series(1, %s);",
+            (len(queries),),
+        )
+        trace_ids = [r[0] for r in cur.fetchall()]
+
+        cur.execute("""
+            INSERT INTO retrieval_trace (trace_id, user_id, query_text, top_k, stage_timings, created_at)
+            SELECT t.trace_id, %s, t.query_text, t.top_k, %s, NOW()
+            FROM unnest(%s::bigint[], %s::text[], %s::int[]) AS t(trace_id, query_text, top_k);
+        """, (user_id, timings, trace_ids, [q for q, _, _ in queries], [k for _, k, _ in queries]))
+
+        h_trace, h_rank, h_chunk, h_score = [], [], [], []
+        for trace_id, (_, _, hits) in zip(trace_ids, queries):
+            for rank, (cid, score) in enumerate(hits, start=1):
+                h_trace.append(trace_id)
+                h_rank.append(rank)
+                h_chunk.append(cid)
+                h_score.append(score)
+        if h_trace:
+            # NOW() is the transaction start time, i.e. the traces' created_at
+            cur.execute("""
+                INSERT INTO retrieval_trace_hit (trace_id, rank, chunk_id, score, created_at)
+                SELECT t.*, NOW() FROM unnest(%s::bigint[], %s::int[], %s::uuid[], %s::float8[]) AS t;
+            """, (h_trace, h_rank, h_chunk, h_score))
+
+    return trace_ids
+
+
+def ivfflat_lists(n_rows: int) -> int:
+    """pgvector's guidance for ivfflat `lists`: rows/1000 up to 1M rows, sqrt(rows) beyond."""
+    if n_rows <= 1_000_000:
+        return max(1, n_rows // 1000)
+    return int(n_rows ** 0.5)
+
+
+# ---------- embedding tables ----------
+# scripts/reembed.py migrates to a new model through chunk_embedding_next and
+# keeps the old vectors in chunk_embedding_prev after the swap, until
+# drop-prev. While it runs, API instances on either model read and write the
+# table that holds their model's vectors, so none of them loses its results.
+EMBEDDING_TABLES = ("chunk_embedding", "chunk_embedding_prev", "chunk_embedding_next")
+_embedding_tables: Dict[str, Tuple[str, float]] = {}  # model -> (table, looked up at)
+
+
+def embedding_table(conn, model_name: str, refresh: bool = False) -> str:
+    """The table holding model_name's vectors (chunk_embedding if none does yet)."""
+    now = time.monotonic()
+    hit = _embedding_tables.get(model_name)
+    if hit and not refresh and now - hit[1] < EMBEDDING_TABLE_TTL_S:
+        return hit[0]
+    table = EMBEDDING_TABLES[0]
+    with conn.cursor() as cur:
+        for name in EMBEDDING_TABLES:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"public.{name}",))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE model_name = %s);", (model_name,))
+            if cur.fetchone()[0]:
+                table = name
+                break
+    _embedding_tables[model_name] = (table, now)
+    return table
+
+
+def copy_chunks(conn, doc_id, texts, ids=None, dup_of=None) -> List[uuid.UUID]:
+    """
+    Bulk-load chunks with COPY (no commit); ids are generated client-side
+    unless given. dup_of: optional canonical chunk id per chunk (near-duplicates).
+    """
+    ids = ids or [uuid.uuid4() for _ in texts]
+    dup_of = dup_of or [None] * len(texts)
+    with conn.cursor() as cur:
+        with cur.copy("COPY chunk (chunk_id, doc_id, ord, redacted_text, dup_of) FROM STDIN") as cp:
+            for ord_i, (cid, txt, dup) in enumerate(zip(ids, texts, dup_of)):
+                cp.write_row((cid, doc_id, ord_i, txt, dup))
+    return ids
+
+
+def copy_embeddings(conn, chunk_ids, vectors, model_name: str) -> None:
+    """Bulk-load embeddings for freshly inserted chunks with COPY (no commit)."""
+    assert len(chunk_ids) == len(vectors)
+    table = embedding_table(conn, model_name)
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {table} (chunk_id, embedding, model_name) FROM STDIN") as cp:
+            for cid, vec in zip(chunk_ids, vectors):
+                cp.write_row((cid, vector_literal(vec), model_name))
+
+
+def insert_redaction_logs(conn, doc_id, chunk_ids, counts_list) -> None:
+    """One redaction_log row per (chunk, entity type) with a non-zero count."""
+    rows = [
+        (doc_id, cid, et, cnt)
+        for cid, counts in zip(chunk_ids, counts_list)
+        for et, cnt in (counts or {}).items() if cnt > 0
+    ]
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        cur.executemany("""
+            INSERT INTO redaction_log (doc_id, chunk_id, entity_type, count)
+            VALUES (%s, %s, %s, %s);
+        """, rows)
+
+
+def copy_minhash(conn, chunk_ids, sigs, band_keys) -> None:
+    """MinHash signatures and LSH band buckets of canonical chunks (no commit)."""
+    with conn.cursor() as cur:
+        with cur.copy("COPY chunk_minhash (chunk_id, sig) FROM STDIN") as cp:
+            for cid, sig in zip(chunk_ids, sigs):
+                cp.write_row((cid, sig))
+        with cur.copy("COPY chunk_lsh (band, bucket, chunk_id) FROM STDIN") as cp:
+            for cid, keys in zip(chunk_ids, band_keys):
+                for band, bucket in enumerate(keys):
+                    cp.write_row((band, bucket, cid))
+
+
+def near_dup_candidates(conn, bands, buckets, exclude_source_key: Optional[str] = None):
+    """
+    Canonical chunks sharing an LSH bucket with the probes.
+    Returns ([(band, bucket, chunk_id)], {chunk_id: sig}).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT t.band, t.bucket, l.chunk_id
+            FROM unnest(%s::smallint[], %s::bigint[]) AS t(band, bucket)
+            JOIN chunk_lsh l ON l.band = t.band AND l.bucket = t.bucket
+            JOIN chunk c ON c.chunk_id = l.chunk_id
+            JOIN document d ON d.doc_id = c.doc_id
+            WHERE %s::text IS NULL OR d.source_key IS DISTINCT FROM %s;
+        """, (bands, buckets, exclude_source_key, exclude_source_key))
+        rows = cur.fetchall()
+        if not rows:
+            return [], {}
+        cur.execute("SELECT chunk_id, sig FROM chunk_minhash WHERE chunk_id = ANY(%s);",
+                    (list({r[2] for r in rows}),))
+        return rows, dict(cur.fetchall())
+
+
+def lock_chunks(conn, chunk_ids) -> set:
+    """Ids that still exist, locked against deletion until the transaction ends."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT chunk_id FROM chunk WHERE chunk_id = ANY(%s) FOR KEY SHARE;", (list(chunk_ids),))
+        return {r[0] for r in cur.fetchall()}
@@ -0,0 +1,192 @@
+# apps/embed_pool.py
+"""
+Multi-process embedding pool for bulk and re-index jobs (hf provider).
+
+Each worker process pins its torch intra-op threads, loads the model once
+(by importing apps.embeddings) and then serves ranges of a job. Texts travel
+to the workers as one UTF-8 blob + offsets in shared memory and vectors come
+back through a shared float32 matrix, so only tiny (lo, hi) task tuples are
+pickled. Rows are written in place, which keeps input order for free.
+
+    with EmbeddingPool(workers=4, threads_per_worker=2) as pool:
+        vecs = pool.embed_texts(texts)
+"""
+import atexit
+import os
+import queue
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+
+EMBED_POOL_WORKERS = int(os.getenv("EMBED_POOL_WORKERS", "0"))       # 0: batch tools embed in-process; pool auto-sizes
+EMBED_POOL_THREADS = int(os.getenv("EMBED_POOL_THREADS", "2"))       # torch threads per worker
+EMBED_POOL_TASK_SIZE = int(os.getenv("EMBED_POOL_TASK_SIZE", "512"))  # texts per task
+
+_READY = "ready"
+_DONE = "done"
+_ERROR = "error"
+
+
+def _worker_main(tasks, results, threads: int) -> None:
+    # must happen before torch is imported by apps.embeddings
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        from apps import embeddings
+        if embeddings.PROVIDER != "hf":
+            raise RuntimeError("EmbeddingPool requires EMBEDDING_PROVIDER=hf")
+        results.put((_READY, os.getpid(), embeddings.EMBEDDING_DIM))
+    except Exception as e:  # report and die; the parent raises
+        results.put((_ERROR, os.getpid(), repr(e)))
+        return
+
+    attached = {}
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, names, n, dim, lo, hi = task
+        try:
+            if attached.get("job") != job_id:
+                for shm in attached.get("shms", ()):
+                    shm.close()
+                shms = [SharedMemory(name=nm) for nm in names]
+                attached = {"job": job_id, "shms": shms}
+            blob_shm, off_shm, out_shm = attached["shms"]
+            offsets = np.ndarray((n + 1,), dtype=np.int64, buffer=off_shm.buf)
+            out = np.ndarray((n, dim), dtype=np.float32, buffer=out_shm.buf)
+            blob = blob_shm.buf
+            texts = [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(lo, hi)]
+            for row, vec in enumerate(embeddings.iter_embed_texts(texts), start=lo):
+                out[row] = vec
+            del offsets, out, blob
+            results.put((_DONE, job_id, hi - lo))
+        except Exception as e:
+            results.put((_ERROR, job_id, repr(e)))
+    for shm in attached.get("shms", ()):
+        shm.close()
+
+
+class EmbeddingPool:
+    """A fixed set of embedding worker processes; see module docstring."""
+
+    def __init__(self, workers: Optional[int] = None, threads_per_worker: Optional[int] = None,
+                 task_size: int = EMBED_POOL_TASK_SIZE):
+        self.threads = threads_per_worker or EMBED_POOL_THREADS
+        self.workers = workers or EMBED_POOL_WORKERS or max(1, (os.cpu_count() or 1) // self.threads)
+        self.task_size = task_size
+        self._job = 0
+        ctx = get_context("spawn")  # never fork a process that may hold torch/tokenizer threads
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._procs = [
+            ctx.Process(target=_worker_main, args=(self._tasks, self._results, self.threads), daemon=True)
+            for _ in range(self.workers)
+        ]
+        for p in self._procs:
+            p.start()
+        self.dim = None
+        ready = 0
+        while ready < len(self._procs):
+            try:
+                kind, pid, payload = self._results.get(timeout=5)
+            except queue.Empty:
+                # killed (OOM, signal) or crashed before it could report
+                dead = [(p.pid, p.exitcode) for p in self._procs if not p.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"embedding workers exited during startup (pid, exitcode): {dead}")
+                continue
+            if kind == _ERROR:
+                self.close()
+                raise RuntimeError(f"embedding worker {pid} failed to start: {payload}")
+            self.dim = payload
+            ready += 1
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return an (n, dim) float32 matrix of embeddings, rows in input order."""
+        n = len(texts)
+        if n == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        self._job += 1
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+        blob_shm = SharedMemory(create=True, size=max(1, int(offsets[-1])))
+        off_shm = SharedMemory(create=True, size=offsets.nbytes)
+        out_shm = SharedMemory(create=True, size=n * self.dim * 4)
+        shms = (blob_shm, off_shm, out_shm)
+        try:
+            blob_shm.buf[:offsets[-1]] = b"".join(encoded)
+            del encoded
+            np.ndarray(offsets.shape, dtype=np.int64, buffer=off_shm.buf)[:] = offsets
+            names = tuple(s.name for s in shms)
+
+            pending = 0
+            for lo in range(0, n, self.task_size):
+                self._tasks.put((self._job, names, n, self.dim, lo, min(n, lo + self.task_size)))
+                pending += 1
+            while pending:
+                try:
+                    kind, job_id, payload = self._results.get(timeout=5)
+                except queue.Empty:
+                    dead = [p.pid for p in self._procs if not p.is_alive()]
+                    if dead:
+                        raise RuntimeError(f"embedding workers died: {dead}")
+                    continue
+                if job_id != self._job:
+                    continue  # leftovers from an earlier, failed job
+                if kind == _ERROR:
+                    raise RuntimeError(f"embedding worker failed: {payload}")
+                pending -= 1
+
+            out = np.ndarray((n, self.dim), dtype=np.float32, buffer=out_shm.buf)
+            result = out.copy()
+            del out
+            return result
+        finally:
+            for s in shms:
+                s.close()
+                s.unlink()
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Drop-in replacement for apps.embeddings.embed_texts."""
+        return self.embed(texts).tolist()
+
+    def close(self) -> None:
+        for p in self._procs:
+            if p.is_alive():
+                self._tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_pool: Optional[EmbeddingPool] = None
+
+
+def get_pool() -> EmbeddingPool:
+    """Process-wide pool sized from EMBED_POOL_WORKERS / EMBED_POOL_THREADS."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = EmbeddingPool()
+        atexit.register(_default_pool.close)
+    return _default_pool
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """embed_texts-compatible entry point backed by the default pool."""
+    return get_pool().embed_texts(texts)
@@ -0,0 +1,130 @@
+# apps/embed_scheduler.py
+"""
+Length-bucketed batch scheduler for local embedding models.
+
+Texts are processed in windows of EMBED_WINDOW inputs. Inside a window they are
+sorted by token length, so each batch holds similarly sized texts, and batch
+sizes are chosen so that (batch_size * longest_in_batch) stays under a padded
+token budget. Vectors are yielded back in the original input order, one window
+at a time, so huge documents never sit in memory as a single encode() call.
+"""
+import os
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+EMBED_TOKEN_BUDGET = int(os.getenv("EMBED_TOKEN_BUDGET", "16384"))  # padded tokens per batch
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "128"))
+EMBED_WINDOW = int(os.getenv("EMBED_WINDOW", "2048"))
+
+EncodeFn = Callable[[List[str]], List[List[float]]]
+CountFn = Callable[[List[str]], List[int]]
+
+
+class EmbedStats:
+    """Throughput and padding accounting for one or more scheduled runs."""
+
+    def __init__(self):
+        self.texts = 0
+        self.batches = 0
+        self.tokens = 0          # real tokens fed to the model
+        self.padded_tokens = 0   # tokens including padding (batch_size * longest)
+        self.seconds = 0.0       # time spent inside encode()
+        self.truncated = 0       # texts longer than the model's sequence limit (cut by encode())
+
+    def record(self, lengths: Sequence[int], seconds: float, truncated: int = 0) -> None:
+        self.texts += len(lengths)
+        self.truncated += truncated
+        self.batches += 1
+        self.tokens += sum(lengths)
+        self.padded_tokens += len(lengths) * max(lengths)
+        self.seconds += seconds
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    @property
+    def padding_waste(self) -> float:
+        """Fraction of computed token positions that were padding."""
+        return 1.0 - (self.tokens / self.padded_tokens) if self.padded_tokens else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "texts": self.texts,
+            "batches": self.batches,
+            "tokens": self.tokens,
+            "padded_tokens": self.padded_tokens,
+            "seconds": round(self.seconds, 3),
+            "tokens_per_sec": round(self.tokens_per_sec, 1),
+            "texts_per_sec": round(self.texts / self.seconds, 1) if self.seconds else 0.0,
+            "padding_waste": round(self.padding_waste, 4),
+            "truncated": self.truncated,
+            "truncation_rate": round(self.truncated / self.texts, 4) if self.texts else 0.0,
+        }
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int = EMBED_TOKEN_BUDGET,
+                 max_batch: int = EMBED_MAX_BATCH) -> List[List[int]]:
+    """
+    Group input indices into batches of similar length.
+    Each batch satisfies len(batch) * max(length) <= token_budget (a single
+    over-budget text still gets its own batch) and len(batch) <= max_batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    for i in order:
+        # sorted ascending, so the newcomer is the longest in the batch
+        if cur and ((len(cur) + 1) * lengths[i] > token_budget or len(cur) >= max_batch):
+            batches.append(cur)
+            cur = []
+        cur.append(i)
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _windows(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    buf: List[str] = []
+    for t in texts:
+        buf.append(t)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def iter_embeddings(
+    texts: Iterable[str],
+    encode_fn: EncodeFn,
+    count_fn: CountFn,
+    max_tokens: int,
+    special_tokens: int = 0,
+    token_budget: int = EMBED_TOKEN_BUDGET,
+    max_batch: int = EMBED_MAX_BATCH,
+    window: int = EMBED_WINDOW,
+    stats: Optional[EmbedStats] = None,
+) -> Iterator[List[float]]:
+    """
+    Yield one vector per input text, in input order.
+
+    encode_fn embeds a list of texts as a single forward pass; count_fn returns
+    per-text token counts without special tokens; max_tokens is the model's
+    sequence limit including the special_tokens encode() adds (longer texts
+    are truncated by the model, so they only cost max_tokens).
+    """
+    for win in _windows(texts, window):
+        # counted on the exact texts being embedded (i.e. after redaction)
+        full = [n + special_tokens for n in count_fn(win)]
+        lengths = [min(n, max_tokens) for n in full]
+        out: List[Optional[List[float]]] = [None] * len(win)
+        for batch in plan_batches(lengths, token_budget, max_batch):
+            t0 = time.perf_counter()
+            vecs = encode_fn([win[i] for i in batch])
+            if stats is not None:
+                stats.record([lengths[i] for i in batch], time.perf_counter() - t0,
+                             truncated=sum(1 for i in batch if full[i] > max_tokens))
+            for i, v in zip(batch, vecs):
+                out[i] = v
+        yield from out
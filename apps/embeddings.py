@@ -1,38 +1,123 @@
 import os
-from typing import List
+import time
+from typing import Iterable, Iterator, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
+from apps.embed_scheduler import EmbedStats, iter_embeddings
+from apps.openai_embed import EmbeddingError
+
 PROVIDER = os.getenv("EMBEDDING_PROVIDER", "hf")
 
 if PROVIDER == "openai":
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
     from openai import OpenAI
+    from apps.openai_embed import OpenAIEmbedder
     api_key = os.getenv("OPENAI_API_KEY")
-    openai_client = OpenAI(api_key=api_key) if api_key else None
+    # retries are handled (and counted) by OpenAIEmbedder; OPENAI_BASE_URL is honoured by the SDK
+    openai_client = OpenAI(api_key=api_key, max_retries=0) if api_key else None
     local_model = None
+    MODEL_LOAD_SECONDS = 0.0
+    # text-embedding-3-* accept up to 8191 input tokens
+    MAX_SEQ_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "8191"))
+    SPECIAL_TOKENS = 0  # the limit counts input tokens only
+    openai_embedder = (OpenAIEmbedder(openai_client, EMBEDDING_MODEL, EMBEDDING_DIM, MAX_SEQ_TOKENS)
+                       if openai_client else None)
 
 elif PROVIDER == "hf":
     HF_MODEL = os.getenv("HF_MODEL", "sentence-transformers/all-mpnet-base-v2")
     HF_DIM = int(os.getenv("HF_DIM", "768"))
     from sentence_transformers import SentenceTransformer
+    _t0 = time.perf_counter()
     local_model = SentenceTransformer(HF_MODEL)
+    MODEL_LOAD_SECONDS = time.perf_counter() - _t0
     EMBEDDING_MODEL = HF_MODEL   
     EMBEDDING_DIM = HF_DIM
     openai_client = None
+    openai_embedder = None
+    # anything past this is silently truncated by encode() (384 for mpnet)
+    MAX_SEQ_TOKENS = int(local_model.max_seq_length)
+    # [CLS]/[SEP] (or equivalent) that encode() adds; they count against MAX_SEQ_TOKENS
+    SPECIAL_TOKENS = int(local_model.tokenizer.num_special_tokens_to_add())
+
+# tiktoken counts tokens for the openai provider (in requirements.txt); without it
+# counts are estimated, see count_tokens
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_tiktoken_enc = None
+_warned_estimate = False
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """
+    Return the number of model tokens in each text (excluding special tokens).
+    Without a tokenizer, falls back to a conservative estimate of one token per
+    2 UTF-8 bytes: dense or numeric text runs well under 4 chars/token, and an
+    undercount would let oversize inputs past the limit and the TPM budget.
+    """
+    global _tiktoken_enc, _warned_estimate
+    if not texts:
+        return []
+
+    if PROVIDER == "hf" and local_model:
+        enc = local_model.tokenizer(
+            list(texts),
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return [len(ids) for ids in enc["input_ids"]]
 
+    if PROVIDER == "openai" and tiktoken is not None:
+        if _tiktoken_enc is None:
+            try:
+                _tiktoken_enc = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+            except KeyError:
+                _tiktoken_enc = tiktoken.get_encoding("cl100k_base")
+        return [len(ids) for ids in _tiktoken_enc.encode_batch(list(texts))]
+
+    if not _warned_estimate:
+        _warned_estimate = True
+        print(f"WARN: no tokenizer for EMBEDDING_PROVIDER={PROVIDER}; estimating tokens as UTF-8 bytes / 2"
+              + (" (pip install tiktoken)" if PROVIDER == "openai" else ""))
+    return [max(1, len(t.encode("utf-8")) // 2) for t in texts]
+
+
+def _encode_batch(texts: List[str]) -> List[List[float]]:
+    """One forward pass of the local model over an already-scheduled batch."""
+    return local_model.encode(
+        texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False
+    ).tolist()
+
+
+def iter_embed_texts(texts: Iterable[str], stats: Optional[EmbedStats] = None) -> Iterator[List[float]]:
+    """
+    Stream embeddings in input order. For the hf provider inputs are
+    length-bucketed into padding-minimizing batches (see apps.embed_scheduler).
+    """
+    if PROVIDER == "hf" and local_model:
+        yield from iter_embeddings(
+            texts, _encode_batch, count_tokens, MAX_SEQ_TOKENS, SPECIAL_TOKENS, stats=stats
+        )
+        return
+    yield from embed_texts(list(texts))
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Return embeddings for a list of texts, depending on provider."""
-    if PROVIDER == "openai" and openai_client:
-        resp = openai_client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
-        return [d.embedding for d in resp.data]
+def embed_texts(texts: List[str], stats: Optional[EmbedStats] = None) -> List[List[float]]:
+    """
+    Return embeddings for a list of texts, depending on provider.
+    Raises EmbeddingError rather than returning placeholder vectors.
+    """
+    if PROVIDER == "openai":
+        if openai_embedder is None:
+            raise EmbeddingError("EMBEDDING_PROVIDER=openai but OPENAI_API_KEY is not set")
+        return openai_embedder.embed(texts, count_tokens(texts))
 
     if PROVIDER == "hf" and local_model:
-        return local_model.encode(texts, normalize_embeddings=True).tolist()
+        return list(iter_embed_texts(texts, stats=stats))
 
-    # fallback
-    dim = HF_DIM if PROVIDER == "hf" else EMBEDDING_DIM
-    return [[0.0] * dim for _ in texts]
+    raise EmbeddingError(f"Unsupported EMBEDDING_PROVIDER={PROVIDER!r} (expected hf or openai)")
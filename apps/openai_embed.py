@@ -0,0 +1,176 @@
+# apps/openai_embed.py
+"""
+Batching layer for the OpenAI embeddings API (EMBEDDING_PROVIDER=openai).
+
+Inputs are cut, in order, into batches of at most OPENAI_EMBED_BATCH_TOKENS
+tokens and OPENAI_EMBED_BATCH_INPUTS inputs. Batches run concurrently on
+OPENAI_EMBED_CONCURRENCY threads, shared by all callers in the process, and
+each request first takes its tokens from a tokens-per-minute bucket
+(OPENAI_EMBED_TPM). Rate limits, timeouts, connection errors and 5xx answers
+are retried with capped exponential backoff and full jitter, honouring
+Retry-After. Anything that still fails, or a malformed answer (wrong count or
+dimension), raises EmbeddingError: callers never get placeholder vectors.
+
+Point OPENAI_BASE_URL at scripts/openai_stub.py to exercise this locally.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import List, Optional, Sequence, Tuple
+
+from apps.metrics import Counter
+
+OPENAI_EMBED_BATCH_TOKENS = int(os.getenv("OPENAI_EMBED_BATCH_TOKENS", "100000"))  # API cap: 300k per request
+OPENAI_EMBED_BATCH_INPUTS = int(os.getenv("OPENAI_EMBED_BATCH_INPUTS", "2048"))    # API cap: 2048 inputs
+OPENAI_EMBED_CONCURRENCY = int(os.getenv("OPENAI_EMBED_CONCURRENCY", "4"))
+OPENAI_EMBED_TPM = int(os.getenv("OPENAI_EMBED_TPM", "1000000"))                   # 0 = no client-side limit
+OPENAI_EMBED_MAX_RETRIES = int(os.getenv("OPENAI_EMBED_MAX_RETRIES", "6"))
+OPENAI_EMBED_BACKOFF_S = float(os.getenv("OPENAI_EMBED_BACKOFF_S", "0.5"))
+OPENAI_EMBED_MAX_BACKOFF_S = float(os.getenv("OPENAI_EMBED_MAX_BACKOFF_S", "30"))
+
+OPENAI_REQUESTS = Counter(
+    "securerag_openai_embed_requests_total",
+    "OpenAI embedding requests by outcome (ok, retried, failed)",
+    ("outcome",),
+)
+OPENAI_TOKENS = Counter("securerag_openai_embed_tokens_total", "Tokens sent to the OpenAI embeddings API")
+
+
+class EmbeddingError(RuntimeError):
+    """Embeddings could not be produced; nothing should be written for these texts."""
+
+
+class InputTooLongError(EmbeddingError):
+    """Some inputs exceed the model's input limit: the caller's fault, not the provider's."""
+
+    def __init__(self, indices: Sequence[int], limit: int):
+        self.indices = list(indices)
+        self.limit = limit
+        super().__init__(f"{len(self.indices)} input(s) exceed {limit} tokens (first: #{self.indices[0]})")
+
+
+class TokenRateLimiter:
+    """Token bucket refilled continuously at tokens_per_minute / 60 per second."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> float:
+        """Block until tokens are available; returns seconds waited."""
+        if self.capacity <= 0:
+            return 0.0
+        # a batch larger than the whole bucket waits for a full bucket
+        tokens = min(float(tokens), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return waited
+                delay = (tokens - self.available) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def plan_batches(token_counts: Sequence[int], max_tokens: int = OPENAI_EMBED_BATCH_TOKENS,
+                 max_inputs: int = OPENAI_EMBED_BATCH_INPUTS) -> List[Tuple[int, int]]:
+    """Consecutive [lo, hi) ranges within both budgets, in input order."""
+    batches = []
+    lo, used = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > lo and (used + n > max_tokens or i - lo >= max_inputs):
+            batches.append((lo, i))
+            lo, used = i, 0
+        used += n
+    if lo < len(token_counts):
+        batches.append((lo, len(token_counts)))
+    return batches
+
+
+def _retry_after(err) -> Optional[float]:
+    response = getattr(err, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class OpenAIEmbedder:
+    def __init__(self, client, model: str, dim: int, max_input_tokens: int,
+                 concurrency: int = OPENAI_EMBED_CONCURRENCY, tokens_per_minute: int = OPENAI_EMBED_TPM,
+                 max_retries: int = OPENAI_EMBED_MAX_RETRIES, batch_tokens: int = OPENAI_EMBED_BATCH_TOKENS,
+                 batch_inputs: int = OPENAI_EMBED_BATCH_INPUTS):
+        import openai
+        # transient failures worth another attempt; everything else (400, 401, ...) is final
+        self._retryable = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.max_input_tokens = max_input_tokens
+        self.max_retries = max_retries
+        self.batch_tokens = batch_tokens
+        self.batch_inputs = batch_inputs
+        self.limiter = TokenRateLimiter(tokens_per_minute)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="openai-embed")
+
+    def _request(self, texts: List[str], tokens: int) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                resp = self.client.embeddings.create(model=self.model, input=texts)
+            except self._retryable as e:
+                if attempt == self.max_retries:
+                    OPENAI_REQUESTS.inc(outcome="failed")
+                    raise EmbeddingError(f"OpenAI embeddings failed after {attempt + 1} attempts: {e!r}") from e
+                OPENAI_REQUESTS.inc(outcome="retried")
+                backoff = random.uniform(0, min(OPENAI_EMBED_MAX_BACKOFF_S, OPENAI_EMBED_BACKOFF_S * 2 ** attempt))
+                time.sleep(max(backoff, _retry_after(e) or 0.0))
+                continue
+            except Exception as e:
+                OPENAI_REQUESTS.inc(outcome="failed")
+                raise EmbeddingError(f"OpenAI embeddings request rejected: {e!r}") from e
+
+            data = sorted(resp.data, key=lambda d: d.index)
+            if len(data) != len(texts) or any(len(d.embedding) != self.dim for d in data):
+                OPENAI_REQUESTS.inc(outcome="failed")
+                raise EmbeddingError(
+                    f"OpenAI returned {len(data)} embeddings for {len(texts)} inputs "
+                    f"(expected dimension {self.dim})"
+                )
+            OPENAI_REQUESTS.inc(outcome="ok")
+            OPENAI_TOKENS.inc(tokens)
+            return [d.embedding for d in data]
+        raise AssertionError("unreachable")
+
+    def embed(self, texts: List[str], token_counts: Sequence[int]) -> List[List[float]]:
+        """Embeddings in input order; raises EmbeddingError if any batch fails."""
+        if not texts:
+            return []
+        too_long = [i for i, n in enumerate(token_counts) if n > self.max_input_tokens]
+        if too_long:
+            raise InputTooLongError(too_long, self.max_input_tokens)
+        batches = plan_batches(token_counts, self.batch_tokens, self.batch_inputs)
+        futures = [
+            self._pool.submit(self._request, texts[lo:hi], sum(token_counts[lo:hi]))
+            for lo, hi in batches
+        ]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in done if f.exception() is not None), None)
+        if failed is not None:
+            for f in pending:
+                f.cancel()
+            raise failed.exception()
+        out: List[List[float]] = []
+        for f in futures:
+            out.extend(f.result())
+        return out
@@ -0,0 +1,167 @@
+# apps/rerank.py
+"""
+Optional cross-encoder reranking of /search ANN candidates (CPU, batched).
+
+Each call gets a latency budget (RERANK_BUDGET_MS). The expected cost per
+(query, chunk) pair is tracked as an EWMA of observed batch times, so under
+CPU contention the number of candidates scored shrinks, and if even
+RERANK_MIN_CANDIDATES do not fit, reranking is skipped. Calls beyond
+RERANK_MAX_CONCURRENCY are skipped rather than queued. Scores are cached per
+(normalized query, chunk_id); chunk text never changes under a chunk_id
+(re-ingest creates new chunks), so entries only need LRU bounding.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from apps.metrics import Counter, Gauge, Histogram
+from apps.search_cache import normalize_query
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_MIN_CANDIDATES = int(os.getenv("RERANK_MIN_CANDIDATES", "10"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "16"))
+RERANK_MAX_CONCURRENCY = int(os.getenv("RERANK_MAX_CONCURRENCY", "2"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "100000"))
+
+# sentence-transformers is only installed with the hf extras
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+RERANK_CALLS = Counter(
+    "securerag_rerank_total",
+    "Rerank calls by outcome (full, partial = budget ran out, skipped_budget, skipped_busy, cached)",
+    ("outcome",),
+)
+RERANK_PAIRS = Histogram(
+    "securerag_rerank_pairs", "Pairs scored by the cross-encoder per call",
+    buckets=(0, 5, 10, 20, 30, 50, 75, 100, 200),
+)
+
+
+class Reranker:
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH,
+                 max_concurrency: int = RERANK_MAX_CONCURRENCY, cache_size: int = RERANK_CACHE_SIZE):
+        t0 = time.perf_counter()
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.load_seconds = time.perf_counter() - t0
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, UUID], float]" = OrderedDict()
+        self.cache_size = cache_size
+        self.ms_per_pair = 0.0
+        self._warm_up()
+
+    def _warm_up(self) -> None:
+        """First call pays one-off allocation costs; also seeds the cost estimate."""
+        pairs = [("warm up query", "warm up passage " * 32)] * self.batch_size
+        self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        t0 = time.perf_counter()
+        self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        self.ms_per_pair = (time.perf_counter() - t0) * 1000.0 / len(pairs)
+
+    def _observe(self, ms: float, n: int) -> None:
+        with self._lock:
+            self.ms_per_pair = 0.8 * self.ms_per_pair + 0.2 * (ms / n)
+
+    def _cache_get(self, key) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, items: List[Tuple[Tuple[str, UUID], float]]) -> None:
+        with self._lock:
+            for key, score in items:
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, query: str, chunk_ids: Sequence[UUID],
+              load_texts: Callable[[List[UUID]], Dict[UUID, str]],
+              budget_ms: float = RERANK_BUDGET_MS,
+              min_candidates: int = RERANK_MIN_CANDIDATES) -> Tuple[Dict[UUID, float], str]:
+        """
+        Cross-encoder scores for as many candidates (in ANN order) as the budget
+        allows; load_texts is only called for pairs missing from the cache.
+        Returns ({chunk_id: score}, outcome); candidates missing from the dict
+        were not scored.
+        """
+        qn = normalize_query(query)
+        scores: Dict[UUID, float] = {}
+        todo: List[UUID] = []
+        for cid in chunk_ids:
+            cached = self._cache_get((qn, cid))
+            if cached is None:
+                todo.append(cid)
+            else:
+                scores[cid] = cached
+        if not todo:
+            RERANK_CALLS.inc(outcome="cached")
+            RERANK_PAIRS.observe(0)
+            return scores, "cached"
+
+        affordable = int(budget_ms / self.ms_per_pair) if self.ms_per_pair > 0 else len(todo)
+        if affordable < min(len(todo), min_candidates):
+            RERANK_CALLS.inc(outcome="skipped_budget")
+            return scores, "skipped_budget"
+        if not self._slots.acquire(blocking=False):
+            RERANK_CALLS.inc(outcome="skipped_busy")
+            return scores, "skipped_busy"
+
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        scored = 0
+        try:
+            texts = load_texts(todo[:affordable])
+            todo = [cid for cid in todo[:affordable] if cid in texts]
+            for i in range(0, len(todo), self.batch_size):
+                batch = todo[i:i + self.batch_size]
+                t0 = time.perf_counter()
+                if t0 + self.ms_per_pair * len(batch) / 1000.0 > deadline:
+                    break
+                out = self.model.predict([(query, texts[cid]) for cid in batch],
+                                         batch_size=len(batch), show_progress_bar=False)
+                self._observe((time.perf_counter() - t0) * 1000.0, len(batch))
+                fresh = [(cid, float(s)) for cid, s in zip(batch, out)]
+                scores.update(fresh)
+                self._cache_put([((qn, cid), s) for cid, s in fresh])
+                scored += len(batch)
+        finally:
+            self._slots.release()
+
+        RERANK_PAIRS.observe(scored)
+        outcome = "full" if len(scores) == len(chunk_ids) else "partial"
+        RERANK_CALLS.inc(outcome=outcome)
+        return scores, outcome
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def rerank_order(rows: List[tuple], scores: Dict[UUID, float]) -> List[tuple]:
+    """
+    Scored rows by cross-encoder score, then unscored rows in ANN order.
+    Each row gains its rerank score (or None) as a trailing element.
+    """
+    scored = sorted((r for r in rows if r[0] in scores), key=lambda r: scores[r[0]], reverse=True)
+    rest = [r for r in rows if r[0] not in scores]
+    return [(*r, scores[r[0]]) for r in scored] + [(*r, None) for r in rest]
+
+
+reranker: Optional[Reranker] = Reranker() if RERANK_ENABLED and CrossEncoder is not None else None
+
+if reranker is not None:
+    Gauge("securerag_rerank_ms_per_pair", "Current cross-encoder cost estimate per pair (ms)",
+          fn=lambda: reranker.ms_per_pair)
+    Gauge("securerag_rerank_cache_entries", "Cached (query, chunk) rerank scores", fn=lambda: len(reranker))
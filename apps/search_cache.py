@@ -0,0 +1,119 @@
+# apps/search_cache.py
+"""
+In-process /search result cache.
+
+Entries are keyed by (user, normalized query, top_k, search params) and carry
+the user's corpus version (user_corpus_version) read *before* the search ran.
+A lookup with a different current version is treated as stale and evicted, so
+ingests and ACL grants invalidate a user's cached results without any explicit
+purge. Memory is bounded by entry count and an approximate byte budget (LRU),
+and entries also expire after a TTL.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from apps.metrics import Counter, Gauge
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1") == "1"
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEARCH_CACHE_TTL_S = float(os.getenv("SEARCH_CACHE_TTL_S", "300"))
+
+CACHE_LOOKUPS = Counter(
+    "securerag_search_cache_lookups_total",
+    "Search cache lookups by outcome (hit, miss, stale = corpus version changed, expired)",
+    ("outcome",),
+)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(q: str) -> str:
+    return _WS.sub(" ", q).strip().casefold()
+
+
+def _approx_size(value: Any) -> int:
+    """Rough deep size of a list of hit tuples (strings dominate)."""
+    size = sys.getsizeof(value)
+    for item in value:
+        size += sys.getsizeof(item)
+        if isinstance(item, tuple):
+            size += sum(sys.getsizeof(x) for x in item)
+    return size
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SEARCH_CACHE_MAX_BYTES, ttl_s: float = SEARCH_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # key -> (corpus_version, stored_at, value, size)
+        self._data: "OrderedDict[Hashable, Tuple[int, float, Any, int]]" = OrderedDict()
+
+    @staticmethod
+    def key(user_id, query: str, top_k: int, params: Tuple = ()) -> Hashable:
+        return (str(user_id), normalize_query(query), int(top_k), params)
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                outcome, value = "miss", None
+            elif entry[0] != version:
+                self._evict(key)
+                outcome, value = "stale", None
+            elif time.monotonic() - entry[1] > self.ttl_s:
+                self._evict(key)
+                outcome, value = "expired", None
+            else:
+                self._data.move_to_end(key)
+                outcome, value = "hit", entry[2]
+        CACHE_LOOKUPS.inc(outcome=outcome)
+        return value
+
+    def put(self, key: Hashable, version: int, value: List[Any]) -> None:
+        size = _approx_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._evict(key)
+            self._data[key] = (version, time.monotonic(), value, size)
+            self.bytes += size
+            while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+                self._evict(next(iter(self._data)))
+
+    def _evict(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[3]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+search_cache = SearchCache()
+
+
+def _hit_ratio() -> float:
+    hits = CACHE_LOOKUPS.value(outcome="hit")
+    total = hits + sum(CACHE_LOOKUPS.value(outcome=o) for o in ("miss", "stale", "expired"))
+    return hits / total if total else 0.0
+
+
+Gauge("securerag_search_cache_entries", "Entries in the search cache", fn=lambda: len(search_cache))
+Gauge("securerag_search_cache_bytes", "Approximate bytes held by the search cache", fn=lambda: search_cache.bytes)
+Gauge("securerag_search_cache_hit_ratio", "Search cache hits / lookups since start", fn=_hit_ratio)
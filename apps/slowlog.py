@@ -0,0 +1,166 @@
+# apps/slowlog.py
+"""
+Slow-request capture for /search.
+
+Every request that takes longer than SLOW_REQUEST_MS is recorded in
+slow_request_log with its query, user, top_k, stage timings and an EXPLAIN
+(ANALYZE, BUFFERS) of the ANN/ACL query. A fraction (SLOW_REQUEST_SAMPLE_RATE)
+of requests also run with a lightweight sampling profiler on the handler
+thread; their records carry the Python profile too. The EXPLAIN is re-run after the response is sent, inside a
+read-only transaction with a statement timeout, and always rolled back.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from psycopg.types.json import Jsonb
+
+from apps.db import get_conn, connect_server
+from apps.metrics import Counter
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "0.1"))
+SLOW_REQUEST_PROFILE_HZ = float(os.getenv("SLOW_REQUEST_PROFILE_HZ", "200"))
+SLOW_PROFILE_MAX_S = float(os.getenv("SLOW_PROFILE_MAX_S", "60"))  # profiler self-stops after this
+SLOW_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_EXPLAIN_TIMEOUT_MS", "10000"))
+# emails allowed to list every user's slow requests (others see only their own)
+SLOW_LOG_ADMINS = {e.strip().lower() for e in os.getenv("SLOW_LOG_ADMINS", "").split(",") if e.strip()}
+
+SLOW_RECORDED = Counter("securerag_slow_requests_total", "Slow requests captured", ("route",))
+
+_PROFILE_TOP = 50  # distinct stacks kept per profile
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed rate from a helper thread."""
+
+    def __init__(self, thread_id: Optional[int] = None, hz: float = SLOW_REQUEST_PROFILE_HZ):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = 1.0 / hz
+        self.stacks: _Counter = _Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slowlog-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        # bounded, so a handler that dies before stop() cannot leak a sampling thread
+        deadline = time.monotonic() + SLOW_PROFILE_MAX_S
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Collapsed stacks (flamegraph format), most frequent first."""
+        return {
+            "interval_ms": round(self.interval * 1000.0, 3),
+            "samples": self.samples,
+            "stacks": [{"stack": s, "count": c} for s, c in self.stacks.most_common(_PROFILE_TOP)],
+        }
+
+
+class SlowRequestProbe:
+    """Per-request handle: checks the threshold, and owns the profiler if sampled.
+
+    Call finish() in a finally block so the profiler stops when the handler raises.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.t0 = time.perf_counter()
+        self.sampled = random.random() < SLOW_REQUEST_SAMPLE_RATE
+        self.profiler = SamplingProfiler().start() if self.sampled else None
+
+    def finish(self, extra_ms: float = 0.0) -> Optional[float]:
+        """Stop profiling; return total ms if the request was slow."""
+        if self.profiler is not None:
+            self.profiler.stop()
+        total_ms = (time.perf_counter() - self.t0) * 1000.0 + extra_ms
+        return total_ms if total_ms >= SLOW_REQUEST_MS else None
+
+    def profile(self) -> Optional[Dict[str, Any]]:
+        """The profiler's summary, or None if the request was not sampled."""
+        return self.profiler.summary() if self.profiler is not None else None
+
+
+def explain_analyze(sql: str, params: Sequence[Any], settings: Optional[Dict[str, str]] = None,
+                    server: str = "primary") -> Tuple[Any, str]:
+    """
+    EXPLAIN (ANALYZE, BUFFERS) a read query without letting it change anything,
+    under the same transaction-local settings (e.g. ivfflat.*) it originally ran
+    with, on the server that served it if still reachable. Returns (plan, server
+    the EXPLAIN ran on).
+    """
+    with connect_server(server) as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION READ ONLY;")
+                cur.execute(f"SET LOCAL statement_timeout = {SLOW_EXPLAIN_TIMEOUT_MS};")
+                for name, value in (settings or {}).items():
+                    cur.execute("SELECT set_config(%s, %s, true);", (name, value))
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0]
+        finally:
+            conn.rollback()
+        return plan, conn.server
+
+
+def record_slow_request(route: str, user_id, query_text: str, top_k: int, total_ms: float,
+                        stage_timings: Dict[str, float], sql: Optional[str], params: Sequence[Any],
+                        settings: Optional[Dict[str, str]], profile: Optional[Dict[str, Any]],
+                        trace_id: Optional[int], served_by: str = "primary") -> None:
+    """Background task: capture the plan (none for a cache hit) and persist one slow_request_log row."""
+    plan = plan_server = None
+    if sql is not None:
+        try:
+            plan, plan_server = explain_analyze(sql, params, settings, served_by)
+        except Exception as e:  # a failed EXPLAIN should not lose the rest of the record
+            plan = {"error": repr(e)}
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO slow_request_log
+                  (route, user_id, query_text, top_k, total_ms, stage_timings, plan, profile, trace_id,
+                   served_by, plan_server)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+            """, (route, user_id, query_text, top_k, total_ms, Jsonb(stage_timings),
+                  Jsonb(plan) if plan is not None else None, Jsonb(profile) if profile else None, trace_id,
+                  served_by, plan_server))
+        conn.commit()
+    SLOW_RECORDED.inc(route=route)
+
+
+def list_slow_requests(user_id, email: str, limit: int) -> List[tuple]:
+    where, params = "", ()
+    if email.lower() not in SLOW_LOG_ADMINS:
+        where, params = "WHERE user_id = %s", (user_id,)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT slow_id, created_at, route, user_id, query_text, top_k, total_ms,
+                       stage_timings, plan, profile, trace_id, served_by, plan_server
+                FROM slow_request_log
+                {where}
+                ORDER BY created_at DESC
+                LIMIT %s;
+            """, (*params, limit))
+            return cur.fetchall()
@@ -0,0 +1,536 @@
+# apps/snapshot.py
+"""
+Corpus snapshots: users, documents, ACLs, redacted chunks, embeddings and the
+near-dup/ingest bookkeeping, as column files that numpy can memory-map
+(scripts/snapshot.py exports and restores them).
+
+  manifest.json                          format version, model, dim, dtype, rows, file sizes and sha256
+  <table>/<column>.npy                   fixed-width columns: uuid (n, 16) uint8, ints, datetime64[us],
+                                         int8[] (n, width)
+  <table>/<column>.bin + .offsets.npy    text: UTF-8 back to back, n + 1 int64 offsets
+  <table>/<column>.null.npy              bool mask, only for columns that hold NULLs
+  chunk_embedding/embedding.npy          (n, dim) float32 or float16; row i is chunk_id[i]
+
+Both directions use binary COPY and encode/decode the wire format here, so
+values are never converted to Python UUIDs, datetimes or strs; embeddings are
+fixed-size records converted a block at a time with numpy. Export reads every table in
+one REPEATABLE READ snapshot. Import runs in one transaction: TRUNCATE, drop
+the secondary indexes, COPY ... FREEZE, recreate the indexes (ivfflat lists
+sized to the restored rows).
+"""
+import hashlib
+import json
+import mmap
+import re
+import struct
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from psycopg import IsolationLevel, sql
+
+from apps.db import ivfflat_lists
+
+FORMAT = "securerag-snapshot"
+FORMAT_VERSION = 1
+
+# (table, ((column, kind), ...)) in load order; chunk_embedding is stored separately
+CORPUS_TABLES = (
+    ("app_user", (("user_id", "uuid"), ("email", "text"), ("display_name", "text"),
+                  ("created_at", "timestamptz"))),
+    ("document", (("doc_id", "uuid"), ("owner_user_id", "uuid"), ("title", "text"),
+                  ("source_key", "text"), ("created_at", "timestamptz"))),
+    ("document_acl", (("doc_id", "uuid"), ("user_id", "uuid"), ("role", "text"))),
+    ("chunk", (("chunk_id", "uuid"), ("doc_id", "uuid"), ("ord", "int4"), ("redacted_text", "text"),
+               ("dup_of", "uuid"), ("created_at", "timestamptz"))),
+    ("chunk_minhash", (("chunk_id", "uuid"), ("sig", "int8[]"))),
+    ("chunk_lsh", (("band", "int2"), ("bucket", "int8"), ("chunk_id", "uuid"))),
+    ("redaction_log", (("doc_id", "uuid"), ("chunk_id", "uuid"), ("entity_type", "text"),
+                       ("count", "int4"), ("created_at", "timestamptz"))),
+    ("ingest_checkpoint", (("source_key", "text"), ("content_sha", "text"), ("doc_id", "uuid"),
+                           ("chunks", "int4"), ("updated_at", "timestamptz"))),
+)
+EMBEDDING_TABLE = "chunk_embedding"
+LOAD_ORDER = ("app_user", "document", "document_acl", "chunk", EMBEDDING_TABLE,
+              "chunk_minhash", "chunk_lsh", "redaction_log", "ingest_checkpoint")
+
+_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_HEADER = _SIGNATURE + b"\x00\x00\x00\x00" + b"\x00\x00\x00\x00"  # flags, header extension length
+_TRAILER = b"\xff\xff"
+_NULL = b"\xff\xff\xff\xff"
+_PG_EPOCH_US = 946_684_800_000_000  # 2000-01-01 (Postgres timestamp zero) in Unix microseconds
+_INT8_OID = 20
+_FIXED = {"uuid": 16, "int2": 2, "int4": 4, "int8": 8, "timestamptz": 8}
+_INT = {"int2": "i2", "int4": "i4", "int8": "i8"}
+_WRITE_BLOCK = 8 << 20
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+# ---------- binary COPY wire format ----------
+def _header_len(buf) -> Optional[int]:
+    if len(buf) < 19:
+        return None
+    if bytes(buf[:11]) != _SIGNATURE:
+        raise SnapshotError("Not a binary COPY stream")
+    end = 19 + int.from_bytes(buf[15:19], "big")
+    return end if len(buf) >= end else None
+
+
+def copy_rows(blocks: Iterable[bytes]) -> Iterator[List[Optional[bytes]]]:
+    """Raw fields (None for NULL) of each row of a binary COPY TO stream."""
+    buf = bytearray()
+    pos = None
+    for block in blocks:
+        buf += block
+        if pos is None:
+            pos = _header_len(buf)
+            if pos is None:
+                continue
+        n = len(buf)
+        while pos + 2 <= n:
+            nf = int.from_bytes(buf[pos:pos + 2], "big", signed=True)
+            if nf == -1:
+                return
+            p, fields = pos + 2, []
+            for _ in range(nf):
+                if p + 4 > n:
+                    break
+                ln = int.from_bytes(buf[p:p + 4], "big", signed=True)
+                p += 4
+                if ln < 0:
+                    fields.append(None)
+                    continue
+                if p + ln > n:
+                    break
+                fields.append(buf[p:p + ln])
+                p += ln
+            else:
+                yield fields
+                pos = p
+                continue
+            break  # row continues in the next block
+        del buf[:pos]
+        pos = 0
+    raise SnapshotError("COPY stream ended without a trailer")
+
+
+def _copy_records(blocks: Iterable[bytes], dtype: np.dtype) -> Iterator[np.ndarray]:
+    """Blocks of fixed-size rows of a binary COPY TO stream, as structured arrays."""
+    buf = bytearray()
+    started = False
+    for block in blocks:
+        buf += block
+        if not started:
+            end = _header_len(buf)
+            if end is None:
+                continue
+            del buf[:end]
+            started = True
+        n = len(buf) // dtype.itemsize * dtype.itemsize
+        if n:
+            yield np.frombuffer(bytes(buf[:n]), dtype)
+            del buf[:n]
+    if bytes(buf) != _TRAILER:
+        raise SnapshotError("COPY stream ended without a trailer")
+
+
+def _embedding_record(dim: int, model: Optional[bytes] = None) -> np.dtype:
+    """One binary COPY row of (chunk_id, embedding[, model_name], created_at); pgvector sends int16 dim, int16 0, float4s."""
+    fields = [("nf", ">i2"), ("l_id", ">i4"), ("id", "u1", (16,)),
+              ("l_vec", ">i4"), ("dim", ">i2"), ("unused", ">i2"), ("vec", ">f4", (dim,))]
+    if model is not None:
+        fields += [("l_model", ">i4"), ("model", f"S{len(model)}")]
+    fields += [("l_ts", ">i4"), ("ts", ">i8")]
+    return np.dtype(fields)
+
+
+def _decode_int8_array(field) -> bytes:
+    """Big-endian int8 values of a one-dimensional int8[] without NULLs."""
+    if int.from_bytes(field[0:4], "big") == 0:
+        return b""
+    if int.from_bytes(field[0:4], "big") != 1 or int.from_bytes(field[4:8], "big") != 0:
+        raise SnapshotError("Only one-dimensional arrays without NULLs are supported")
+    n = int.from_bytes(field[12:16], "big")
+    return np.frombuffer(bytes(field), dtype=[("len", ">i4"), ("v", ">i8")], offset=20, count=n)["v"].tobytes()
+
+
+# ---------- columns ----------
+class _ColumnWriter:
+    def __init__(self, directory: Path, name: str, kind: str):
+        self.dir, self.name, self.kind = directory, name, kind
+        self.nulls = bytearray()
+        self.data = bytearray()
+        self.width = None
+        if kind == "text":
+            self.blob = open(directory / f"{name}.bin", "wb")
+            self.offsets = array("q", [0])
+            self.pos = 0
+
+    def add(self, field) -> None:
+        self.nulls.append(field is None)
+        if self.kind == "text":
+            if field is not None:
+                self.blob.write(field)
+                self.pos += len(field)
+            self.offsets.append(self.pos)
+        elif self.kind == "int8[]":
+            if field is None:
+                raise SnapshotError(f"NULL in array column {self.name}")
+            values = _decode_int8_array(field)
+            if self.width is None:
+                self.width = len(values) // 8
+            elif len(values) != self.width * 8:
+                raise SnapshotError(f"Arrays of different lengths in {self.name}")
+            self.data += values
+        else:
+            self.data += field if field is not None else bytes(_FIXED[self.kind])
+
+    def finish(self) -> dict:
+        n = len(self.nulls)
+        path = self.dir / f"{self.name}.npy"
+        if self.kind == "text":
+            self.blob.close()
+            np.save(self.dir / f"{self.name}.offsets.npy", np.frombuffer(self.offsets, dtype=np.int64))
+        elif self.kind == "int8[]":
+            np.save(path, np.frombuffer(self.data, ">i8").astype("<i8").reshape(n, self.width or 0))
+        elif self.kind == "uuid":
+            np.save(path, np.frombuffer(self.data, np.uint8).reshape(n, 16))
+        elif self.kind == "timestamptz":
+            np.save(path, (np.frombuffer(self.data, ">i8").astype("<i8") + _PG_EPOCH_US).view("datetime64[us]"))
+        else:
+            np.save(path, np.frombuffer(self.data, ">" + _INT[self.kind]).astype("<" + _INT[self.kind]))
+        nulls = np.frombuffer(self.nulls, dtype=bool)
+        nullable = bool(nulls.any())
+        if nullable:
+            np.save(self.dir / f"{self.name}.null.npy", nulls)
+        return {"name": self.name, "kind": self.kind, "nullable": nullable}
+
+
+class TextColumn:
+    """Memory-mapped text column: raw(i) -> UTF-8 bytes, [i] -> str."""
+
+    def __init__(self, path: Path, name: str):
+        self.offsets = np.load(path / f"{name}.offsets.npy", mmap_mode="r")
+        self._file = open(path / f"{name}.bin", "rb")
+        size = self._file.seek(0, 2)
+        self.blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+
+def read_column(path, table: str, column: dict):
+    """(values, null mask or None): a numpy memmap, or a TextColumn for text."""
+    directory = Path(path) / table
+    name = column["name"]
+    if column["kind"] == "text":
+        values = TextColumn(directory, name)
+    else:
+        values = np.load(directory / f"{name}.npy", mmap_mode="r")
+    nulls = np.load(directory / f"{name}.null.npy", mmap_mode="r") if column.get("nullable") else None
+    return values, nulls
+
+
+def read_manifest(path) -> dict:
+    with open(Path(path) / "manifest.json", "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT or manifest.get("version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')} v{manifest.get('version')}")
+    return manifest
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_WRITE_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def check_files(path, manifest: dict, verify: bool = False) -> None:
+    """Every file is present with its recorded size (and sha256 if verify)."""
+    root = Path(path)
+    for rel, meta in manifest["files"].items():
+        p = root / rel
+        if not p.exists() or p.stat().st_size != meta["bytes"]:
+            raise SnapshotError(f"{rel} is missing or has the wrong size")
+        if verify and _sha256(p) != meta["sha256"]:
+            raise SnapshotError(f"{rel} does not match its checksum")
+
+
+# ---------- export ----------
+def _export_table(cur, directory: Path, table: str, columns) -> dict:
+    directory.mkdir(parents=True)
+    writers = [_ColumnWriter(directory, name, kind) for name, kind in columns]
+    stmt = sql.SQL("COPY (SELECT {} FROM {}) TO STDOUT (FORMAT binary)").format(
+        sql.SQL(", ").join(sql.Identifier(name) for name, _ in columns), sql.Identifier(table))
+    rows = 0
+    with cur.copy(stmt) as cp:
+        for fields in copy_rows(cp):
+            for w, field in zip(writers, fields):
+                w.add(field)
+            rows += 1
+    return {"rows": rows, "columns": [w.finish() for w in writers]}
+
+
+def _export_embeddings(cur, directory: Path, model: str, dtype: str) -> dict:
+    directory.mkdir(parents=True)
+    cur.execute("SELECT COUNT(*), MAX(vector_dims(embedding)) FROM chunk_embedding WHERE model_name = %s;", (model,))
+    n, dim = cur.fetchone()
+    if not n:
+        raise SnapshotError(f"No embeddings for model {model!r}")
+    open_memmap = np.lib.format.open_memmap
+    ids = open_memmap(directory / "chunk_id.npy", "w+", np.uint8, (n, 16))
+    vecs = open_memmap(directory / "embedding.npy", "w+", np.dtype(dtype), (n, dim))
+    created = open_memmap(directory / "created_at.npy", "w+", "datetime64[us]", (n,))
+    record = _embedding_record(dim)
+    i = 0
+    with cur.copy("COPY (SELECT chunk_id, embedding, created_at FROM chunk_embedding WHERE model_name = %s) "
+                  "TO STDOUT (FORMAT binary)", (model,)) as cp:
+        for rec in _copy_records(cp, record):
+            if (rec["nf"] != 3).any() or (rec["dim"] != dim).any() or i + len(rec) > n:
+                raise SnapshotError("Unexpected embedding rows in COPY stream")
+            j = i + len(rec)
+            ids[i:j] = rec["id"]
+            vecs[i:j] = rec["vec"]
+            created[i:j] = (rec["ts"].astype("<i8") + _PG_EPOCH_US).view("datetime64[us]")
+            i = j
+    if i != n:
+        raise SnapshotError(f"Expected {n} embeddings, read {i}")
+    for a in (ids, vecs, created):
+        a.flush()
+    return {"rows": n, "model_name": model, "dim": dim, "dtype": dtype, "columns": [
+        {"name": "chunk_id", "kind": "uuid", "nullable": False},
+        {"name": "embedding", "kind": "vector", "nullable": False},
+        {"name": "created_at", "kind": "timestamptz", "nullable": False},
+    ]}
+
+
+def export_snapshot(conn, out_dir, model: str, dtype: str = "float32",
+                    progress: Callable[[str], None] = print) -> dict:
+    """Write the corpus to out_dir (must not exist or be empty); returns the manifest."""
+    out = Path(out_dir)
+    if out.exists() and any(out.iterdir()):
+        raise SnapshotError(f"{out} is not empty")
+    out.mkdir(parents=True, exist_ok=True)
+    # every table from the same MVCC snapshot
+    conn.isolation_level = IsolationLevel.REPEATABLE_READ
+    conn.read_only = True
+    tables = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT current_setting('server_version'), "
+                    "(SELECT extversion FROM pg_extension WHERE extname = 'vector');")
+        server_version, pgvector = cur.fetchone()
+        for table, columns in CORPUS_TABLES:
+            tables[table] = _export_table(cur, out / table, table, columns)
+            progress(f"{table:18s} {tables[table]['rows']:>12,d} rows")
+        emb = _export_embeddings(cur, out / EMBEDDING_TABLE, model, dtype)
+        tables[EMBEDDING_TABLE] = {k: emb[k] for k in ("rows", "columns")}
+        progress(f"{EMBEDDING_TABLE:18s} {emb['rows']:>12,d} rows ({emb['dim']}-d {dtype})")
+    conn.rollback()
+
+    files = {}
+    for p in sorted(out.rglob("*")):
+        if p.is_file():
+            files[p.relative_to(out).as_posix()] = {"bytes": p.stat().st_size, "sha256": _sha256(p)}
+    manifest = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "source": {"server_version": server_version, "pgvector": pgvector},
+        "model_name": model,
+        "dim": emb["dim"],
+        "dtype": dtype,
+        "tables": tables,
+        "files": files,
+    }
+    with open(out / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ---------- import ----------
+class _Int8ArrayEncoder:
+    """Binary int8[] fields of rows of an (n, width) array, encoded a block of rows at a time."""
+
+    BLOCK = 65536
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        self.width = values.shape[1]
+        self.header = struct.pack(">iiiii", 1, 0, _INT8_OID, self.width, 1)
+        self.block, self.raw = None, b""
+
+    def __call__(self, i: int) -> bytes:
+        block, size = i // self.BLOCK, self.width * 12
+        if block != self.block:
+            rows = self.values[block * self.BLOCK:(block + 1) * self.BLOCK]
+            rec = np.empty(rows.shape, dtype=[("len", ">i4"), ("v", ">i8")])
+            rec["len"] = 8
+            rec["v"] = rows
+            self.block, self.raw = block, rec.tobytes()
+        j = i - block * self.BLOCK
+        return self.header + self.raw[j * size:(j + 1) * size]
+
+
+def _field_getter(path: Path, table: str, column: dict) -> Callable[[int], Optional[bytes]]:
+    """Binary COPY field (without length) of row i."""
+    values, nulls = read_column(path, table, column)
+    kind = column["kind"]
+    if kind == "text":
+        get = values.raw
+    else:
+        if kind == "int8[]":
+            get = _Int8ArrayEncoder(values)
+        else:
+            size = _FIXED[kind]
+            if kind == "uuid":
+                raw = np.ascontiguousarray(values).tobytes()
+            elif kind == "timestamptz":
+                raw = (values.view("<i8") - _PG_EPOCH_US).astype(">i8").tobytes()
+            else:
+                raw = values.astype(">" + _INT[kind]).tobytes()
+            get = lambda i: raw[i * size:(i + 1) * size]
+    if nulls is None:
+        return get
+    null = nulls.tolist()
+    return lambda i: None if null[i] else get(i)
+
+
+def _import_table(cur, path: Path, table: str, meta: dict) -> None:
+    columns = meta["columns"]
+    getters = [_field_getter(path, table, c) for c in columns]
+    stmt = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT binary, FREEZE)").format(
+        sql.Identifier(table), sql.SQL(", ").join(sql.Identifier(c["name"]) for c in columns))
+    nf = struct.pack(">h", len(columns))
+    with cur.copy(stmt) as cp:
+        out = bytearray(_HEADER)
+        for i in range(meta["rows"]):
+            out += nf
+            for get in getters:
+                field = get(i)
+                if field is None:
+                    out += _NULL
+                else:
+                    out += len(field).to_bytes(4, "big")
+                    out += field
+            if len(out) >= _WRITE_BLOCK:
+                cp.write(out)
+                out = bytearray()
+        out += _TRAILER
+        cp.write(out)
+
+
+def _import_embeddings(cur, path: Path, manifest: dict) -> None:
+    directory = path / EMBEDDING_TABLE
+    ids = np.load(directory / "chunk_id.npy", mmap_mode="r")
+    vecs = np.load(directory / "embedding.npy", mmap_mode="r")
+    created = np.load(directory / "created_at.npy", mmap_mode="r")
+    model, dim = manifest["model_name"].encode("utf-8"), manifest["dim"]
+    record = _embedding_record(dim, model)
+    step = max(1, _WRITE_BLOCK // record.itemsize)
+    with cur.copy("COPY chunk_embedding (chunk_id, embedding, model_name, created_at) "
+                  "FROM STDIN (FORMAT binary, FREEZE)") as cp:
+        cp.write(_HEADER)
+        for lo in range(0, len(ids), step):
+            hi = min(lo + step, len(ids))
+            rec = np.zeros(hi - lo, record)
+            rec["nf"] = 4
+            rec["l_id"] = 16
+            rec["id"] = ids[lo:hi]
+            rec["l_vec"] = 4 + 4 * dim
+            rec["dim"] = dim
+            rec["vec"] = vecs[lo:hi]
+            rec["l_model"] = len(model)
+            rec["model"] = model
+            rec["l_ts"] = 8
+            rec["ts"] = created[lo:hi].view("<i8") - _PG_EPOCH_US
+            cp.write(rec.tobytes())
+        cp.write(_TRAILER)
+
+
+def _secondary_indexes(cur, tables) -> List[Tuple[str, str]]:
+    """(name, CREATE INDEX statement) of indexes that do not back a constraint."""
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid::regclass::text = ANY(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+        ORDER BY c.relname;
+    """, (list(tables),))
+    return cur.fetchall()
+
+
+def import_snapshot(conn, path, replace: bool = False, verify: bool = False,
+                    maintenance_work_mem: str = "1GB", progress: Callable[[str], None] = print) -> Dict[str, int]:
+    """
+    Restore a snapshot in one transaction (commits). Refuses non-empty tables
+    unless replace; TRUNCATE ... CASCADE also empties tables that reference the
+    corpus (traces, slow request log, corpus versions). Returns ivfflat lists per rebuilt index.
+    """
+    path = Path(path)
+    manifest = read_manifest(path)
+    check_files(path, manifest, verify)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT atttypmod FROM pg_attribute
+            WHERE attrelid = 'chunk_embedding'::regclass AND attname = 'embedding';
+        """)
+        dim = cur.fetchone()[0]
+        if dim > 0 and dim != manifest["dim"]:
+            raise SnapshotError(f"Snapshot has {manifest['dim']}-d vectors, chunk_embedding.embedding is vector({dim})")
+        if not replace:
+            for table in LOAD_ORDER:
+                cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {});").format(sql.Identifier(table)))
+                if cur.fetchone()[0]:
+                    raise SnapshotError(f"{table} is not empty; pass replace to overwrite")
+
+        cur.execute(sql.SQL("SET LOCAL maintenance_work_mem = {};").format(sql.Literal(maintenance_work_mem)))
+        indexes = _secondary_indexes(cur, LOAD_ORDER)
+        for name, _ in indexes:
+            cur.execute(sql.SQL("DROP INDEX {};").format(sql.Identifier(name)))
+        # COPY FREEZE needs the table truncated in this transaction
+        cur.execute(sql.SQL("TRUNCATE {} CASCADE;").format(
+            sql.SQL(", ").join(sql.Identifier(t) for t in LOAD_ORDER)))
+
+        for table in LOAD_ORDER:
+            meta = manifest["tables"][table]
+            if table == EMBEDDING_TABLE:
+                _import_embeddings(cur, path, manifest)
+            else:
+                _import_table(cur, path, table, meta)
+            progress(f"loaded  {table:18s} {meta['rows']:>12,d} rows")
+
+        lists = {}
+        n_vectors = manifest["tables"][EMBEDDING_TABLE]["rows"]
+        for name, ddl in indexes:
+            if " USING ivfflat " in ddl:
+                lists[name] = ivfflat_lists(n_vectors)
+                ddl = re.sub(r"lists\s*=\s*'?\d+'?", f"lists='{lists[name]}'", ddl)
+            cur.execute(ddl)
+            progress(f"indexed {name}")
+
+        # invalidate /search caches of running API processes
+        cur.execute("""
+            INSERT INTO user_corpus_version (user_id, version)
+            SELECT user_id, (EXTRACT(EPOCH FROM now()) * 1000)::bigint FROM app_user;
+        """)
+    conn.commit()
+
+    with conn.cursor() as cur:
+        for table in LOAD_ORDER:
+            cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+    conn.commit()
+    return lists
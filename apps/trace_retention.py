@@ -0,0 +1,212 @@
+# apps/trace_retention.py
+"""
+Monthly partitions of retrieval_trace / retrieval_trace_hit, plus retention and
+compaction (run from scripts/trace_maintenance.py; the API only creates
+upcoming partitions at startup).
+
+Layouts of a month, newest to oldest:
+  live       hits are rows in retrieval_trace_hit_pYYYY_MM
+  compacted  hits are folded into retrieval_trace.hit_chunk_ids / hit_scores
+             (ordered by rank) and the hit partition is dropped
+  expired    both partitions are dropped (TRACE_RETENTION_DAYS)
+
+The retrieval_trace_hits view reads both layouts. Rows that arrive for a month
+without a partition land in the *_default partitions and are moved out the
+next time partitions are ensured.
+"""
+import datetime as dt
+import os
+import re
+from typing import List, Optional, Tuple
+
+TRACE_RETENTION_DAYS = int(os.getenv("TRACE_RETENTION_DAYS", "180"))          # 0 = keep forever
+TRACE_COMPACT_AFTER_DAYS = int(os.getenv("TRACE_COMPACT_AFTER_DAYS", "30"))   # 0 = never compact
+TRACE_PARTITIONS_AHEAD = int(os.getenv("TRACE_PARTITIONS_AHEAD", "2"))
+
+TRACE = "retrieval_trace"
+HIT = "retrieval_trace_hit"
+_LOCK_KEY = 0x7472616365  # pg_advisory_xact_lock key shared by all maintenance steps
+
+_PART_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def _month(d: dt.date) -> dt.date:
+    return dt.date(d.year, d.month, 1)
+
+
+def _add_months(d: dt.date, n: int) -> dt.date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return dt.date(d.year + y, m + 1, 1)
+
+
+def partition_name(parent: str, month: dt.date) -> str:
+    return f"{parent}_p{month.year:04d}_{month.month:02d}"
+
+
+def _lock(cur) -> None:
+    cur.execute("SET LOCAL lock_timeout = '5s';")
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (_LOCK_KEY,))
+
+
+def list_partitions(conn, parent: str) -> List[Tuple[str, dt.date]]:
+    """Monthly partitions of parent as (name, first day of month), oldest first."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass;
+        """, (parent,))
+        out = []
+        for (name,) in cur.fetchall():
+            m = _PART_RE.search(name)
+            if m and name.startswith(parent + "_p"):
+                out.append((name, dt.date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(out, key=lambda p: p[1])
+
+
+def _create_month(cur, parent: str, month: dt.date) -> bool:
+    """Create one monthly partition, moving matching rows out of the default partition."""
+    name = partition_name(parent, month)
+    cur.execute("SELECT to_regclass(%s);", (name,))
+    if cur.fetchone()[0] is not None:
+        return False
+    lo, hi = month, _add_months(month, 1)
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {parent}_default WHERE created_at >= %s AND created_at < %s);", (lo, hi))
+    stray = cur.fetchone()[0]
+    if stray:
+        cur.execute(f"CREATE TEMP TABLE _trace_moved (LIKE {parent}) ON COMMIT DROP;")
+        cur.execute(f"""
+            WITH d AS (
+              DELETE FROM {parent}_default WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO _trace_moved SELECT * FROM d;
+        """, (lo, hi))
+    cur.execute(f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM ({_lit(lo)}) TO ({_lit(hi)});")
+    if stray:
+        cur.execute(f"INSERT INTO {parent} SELECT * FROM _trace_moved;")
+        cur.execute("DROP TABLE _trace_moved;")
+    return True
+
+
+def _lit(d: dt.date) -> str:
+    return f"'{d.isoformat()}'"
+
+
+def ensure_partitions(conn, months_ahead: int = TRACE_PARTITIONS_AHEAD, today: Optional[dt.date] = None) -> List[str]:
+    """
+    Create partitions from the oldest month still sitting in the default
+    partitions (e.g. right after migration 010) through months_ahead.
+    """
+    this_month = _month(today or dt.date.today())
+    created = []
+    with conn.cursor() as cur:
+        _lock(cur)
+        cur.execute(f"SELECT MIN(created_at) FROM {TRACE}_default;")
+        oldest = cur.fetchone()[0]
+        cur.execute(f"SELECT MIN(created_at) FROM {HIT}_default;")
+        oldest_hit = cur.fetchone()[0]
+        starts = [this_month] + [_month(t.date()) for t in (oldest, oldest_hit) if t is not None]
+        month = min(starts)
+        last = _add_months(this_month, months_ahead)
+        while month <= last:
+            for parent in (TRACE, HIT):
+                if _create_month(cur, parent, month):
+                    created.append(partition_name(parent, month))
+            month = _add_months(month, 1)
+    conn.commit()
+    return created
+
+
+def compact(conn, older_than_days: int = TRACE_COMPACT_AFTER_DAYS, today: Optional[dt.date] = None) -> List[str]:
+    """
+    Fold the hit rows of every month that ended more than older_than_days ago
+    into per-trace arrays. The trace partition is rebuilt (not updated in
+    place), so no dead tuples are left behind; one transaction per month.
+    """
+    if older_than_days <= 0:
+        return []
+    cutoff = (today or dt.date.today()) - dt.timedelta(days=older_than_days)
+    done = []
+    for hit_name, month in list_partitions(conn, HIT):
+        lo, hi = month, _add_months(month, 1)
+        if hi > cutoff:
+            break
+        name = partition_name(TRACE, month)
+        tmp = name + "_c"
+        with conn.cursor() as cur:
+            _lock(cur)
+            cur.execute(f"CREATE TABLE {tmp} (LIKE {TRACE} INCLUDING DEFAULTS);")
+            # matches the partition bound, so ATTACH skips the validation scan
+            cur.execute(f"ALTER TABLE {tmp} ADD CONSTRAINT {tmp}_range "
+                        f"CHECK (created_at >= {_lit(lo)} AND created_at < {_lit(hi)});")
+            cur.execute(f"""
+                INSERT INTO {tmp} (trace_id, user_id, query_text, top_k, stage_timings, created_at,
+                                   hit_chunk_ids, hit_scores)
+                SELECT t.trace_id, t.user_id, t.query_text, t.top_k, t.stage_timings, t.created_at,
+                       COALESCE(h.chunk_ids, t.hit_chunk_ids, '{{}}'),
+                       COALESCE(h.scores, t.hit_scores, '{{}}')
+                FROM {name} t
+                LEFT JOIN (
+                  SELECT trace_id,
+                         array_agg(chunk_id ORDER BY rank) AS chunk_ids,
+                         array_agg(score ORDER BY rank) AS scores
+                  FROM {hit_name}
+                  GROUP BY trace_id
+                ) h ON h.trace_id = t.trace_id;
+            """)
+            cur.execute(f"ALTER TABLE {TRACE} DETACH PARTITION {name};")
+            cur.execute(f"DROP TABLE {name};")
+            cur.execute(f"ALTER TABLE {HIT} DETACH PARTITION {hit_name};")
+            cur.execute(f"DROP TABLE {hit_name};")
+            cur.execute(f"ALTER TABLE {tmp} RENAME TO {name};")
+            cur.execute(f"ALTER TABLE {TRACE} ATTACH PARTITION {name} "
+                        f"FOR VALUES FROM ({_lit(lo)}) TO ({_lit(hi)});")
+        conn.commit()
+        done.append(name)
+    return done
+
+
+def drop_expired(conn, retention_days: int = TRACE_RETENTION_DAYS, today: Optional[dt.date] = None) -> List[str]:
+    """Drop whole monthly partitions (both tables) that ended more than retention_days ago."""
+    if retention_days <= 0:
+        return []
+    cutoff = (today or dt.date.today()) - dt.timedelta(days=retention_days)
+    dropped = []
+    with conn.cursor() as cur:
+        _lock(cur)
+        for parent in (HIT, TRACE):
+            for name, month in list_partitions(conn, parent):
+                if _add_months(month, 1) > cutoff:
+                    break
+                cur.execute(f"DROP TABLE {name};")
+                dropped.append(name)
+    conn.commit()
+    return dropped
+
+
+def partition_stats(conn) -> List[Tuple[str, str, int]]:
+    """(partition, layout, bytes incl. indexes/toast) for every trace partition."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, p.relname, pg_total_relation_size(c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname IN (%s, %s)
+            ORDER BY c.relname;
+        """, (TRACE, HIT))
+        rows = cur.fetchall()
+    hit_months = {m for _, m in list_partitions(conn, HIT)}
+    out = []
+    for name, parent, size in rows:
+        m = _PART_RE.search(name)
+        if parent == HIT:
+            layout = "hits"
+        elif m is None:
+            layout = "default"
+        else:
+            month = dt.date(int(m.group(1)), int(m.group(2)), 1)
+            layout = "live" if month in hit_months else "compacted"
+        out.append((name, layout, size))
+    return out
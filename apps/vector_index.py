@@ -0,0 +1,290 @@
+# apps/vector_index.py
+"""
+Maintenance of the ivfflat index on chunk_embedding (run from
+scripts/index_maintenance.py, once or on a schedule).
+
+ivfflat centroids are computed when the index is built and never move, so an
+index built on an empty or small table serves a grown corpus with too few,
+badly placed lists. Each check records:
+  growth  rows now vs. rows at the last rebuild
+  lists   the index's lists vs. ivfflat_lists(rows)
+  drift   self-recall@k of the index on vectors added since the last rebuild
+          (their exact neighbours vs. what the index returns)
+and rebuilds when any of them is past its threshold: ALTER INDEX ... SET
+(lists = n) then REINDEX CONCURRENTLY, so searches keep using the old index
+until the new one is ready. ivfflat.probes is set to sqrt(lists) for the
+database (INDEX_SET_PROBES) so recall holds as lists grow. Recall@k and
+latency on a held-out query set are measured before and after, and every
+check, rebuild and prewarm is logged in vector_index_maintenance.
+"""
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from psycopg import sql
+
+from apps.bench import percentile
+from apps.db import ivfflat_lists
+
+INDEX_GROWTH_FACTOR = float(os.getenv("INDEX_GROWTH_FACTOR", "2.0"))      # rebuild when rows grew this much
+INDEX_LISTS_TOLERANCE = float(os.getenv("INDEX_LISTS_TOLERANCE", "2.0"))  # ... or lists are off by this factor
+INDEX_MIN_RECALL = float(os.getenv("INDEX_MIN_RECALL", "0.9"))            # ... or self-recall on new rows drops below
+INDEX_SAMPLE = int(os.getenv("INDEX_SAMPLE", "50"))                       # vectors/queries per measurement
+INDEX_EVAL_K = int(os.getenv("INDEX_EVAL_K", "10"))
+INDEX_MAINTENANCE_WORK_MEM = os.getenv("INDEX_MAINTENANCE_WORK_MEM", "1GB")
+INDEX_SET_PROBES = os.getenv("INDEX_SET_PROBES", "1") == "1"
+INDEX_PREWARM = os.getenv("INDEX_PREWARM", "1") == "1"
+
+TABLE = "chunk_embedding"
+_LOCK_KEY = 0x766563696478  # pg_try_advisory_lock key: one maintenance run at a time
+
+
+class IndexStats:
+    def __init__(self, name: str, lists: int, rows: int, probes: int,
+                 rows_at_build: Optional[int], lists_at_build: Optional[int], built_at):
+        self.name = name
+        self.lists = lists
+        self.rows = rows
+        self.probes = probes
+        self.rows_at_build = rows_at_build
+        self.lists_at_build = lists_at_build
+        self.built_at = built_at
+
+    @property
+    def target_lists(self) -> int:
+        return ivfflat_lists(self.rows)
+
+
+def try_lock(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(%s);", (_LOCK_KEY,))
+        return cur.fetchone()[0]
+
+
+def unlock(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock(%s);", (_LOCK_KEY,))
+
+
+def find_index(conn) -> Tuple[str, int]:
+    """(name, lists) of the ivfflat index on chunk_embedding."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, COALESCE(
+                     (SELECT split_part(o, '=', 2)::int FROM unnest(c.reloptions) o WHERE o LIKE 'lists=%%'),
+                     100)  -- pgvector's default
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE i.indrelid = %s::regclass AND am.amname = 'ivfflat' AND i.indisvalid
+            ORDER BY c.relname
+            LIMIT 1;
+        """, (TABLE,))
+        row = cur.fetchone()
+    if row is None:
+        raise RuntimeError(f"No ivfflat index on {TABLE}")
+    return row[0], int(row[1])
+
+
+def live_model(conn) -> Optional[str]:
+    """model_name of the vectors in chunk_embedding (one model; see scripts/reembed.py)."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT model_name FROM {TABLE} LIMIT 1;")
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def current_probes(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT current_setting('ivfflat.probes', true);")
+        value = cur.fetchone()[0]
+    return int(value) if value else 1
+
+
+def index_stats(conn, model: str) -> IndexStats:
+    name, lists = find_index(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE model_name = %s;", (model,))
+        rows = cur.fetchone()[0]
+        cur.execute("""
+            SELECT n_rows, lists_after, created_at FROM vector_index_maintenance
+            WHERE index_name = %s AND action = 'rebuild'
+            ORDER BY created_at DESC LIMIT 1;
+        """, (name,))
+        last = cur.fetchone()
+    last = last or (None, None, None)
+    return IndexStats(name, lists, rows, current_probes(conn), *last)
+
+
+# ---------- measurement ----------
+def sample_vectors(conn, model: str, n: int, since=None) -> List[str]:
+    """Random stored vectors (as pgvector text), optionally only those added after `since`."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT embedding::text FROM {TABLE}
+            WHERE model_name = %s AND (%s::timestamptz IS NULL OR created_at > %s)
+            ORDER BY random() LIMIT %s;
+        """, (model, since, since, n))
+        return [r[0] for r in cur.fetchall()]
+
+
+def exact_neighbours(conn, model: str, vectors: Sequence[str], k: int) -> List[List]:
+    """True top-k per query vector; OFFSET 0 keeps the planner off the ANN index."""
+    out = []
+    with conn.cursor() as cur:
+        for v in vectors:
+            cur.execute(f"""
+                SELECT chunk_id FROM (SELECT chunk_id, embedding FROM {TABLE} WHERE model_name = %s OFFSET 0) e
+                ORDER BY e.embedding <-> %s::vector LIMIT %s;
+            """, (model, v, k))
+            out.append([r[0] for r in cur.fetchall()])
+    return out
+
+
+def ann_neighbours(conn, model: str, vectors: Sequence[str], k: int,
+                   probes: Optional[int] = None) -> Tuple[List[List], List[float]]:
+    """Index top-k per query vector, and the latency (ms) of each lookup."""
+    out, latencies = [], []
+    with conn.cursor() as cur:
+        if probes:
+            cur.execute(f"SET ivfflat.probes = {int(probes)};")
+        for v in vectors:
+            t0 = time.perf_counter()
+            cur.execute(f"""
+                SELECT chunk_id FROM {TABLE} WHERE model_name = %s
+                ORDER BY embedding <-> %s::vector LIMIT %s;
+            """, (model, v, k))
+            out.append([r[0] for r in cur.fetchall()])
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+        if probes:
+            cur.execute("RESET ivfflat.probes;")
+    return out, latencies
+
+
+def recall_at_k(conn, model: str, vectors: Sequence[str], truth: Sequence[Sequence], k: int,
+                probes: Optional[int] = None) -> Dict[str, float]:
+    """Mean recall@k of the index against `truth`, with p50/p95 lookup latency."""
+    got, latencies = ann_neighbours(conn, model, vectors, k, probes)
+    recalls = [len(set(g) & set(t)) / len(t) for g, t in zip(got, truth) if t]
+    return {
+        "recall": sum(recalls) / len(recalls) if recalls else 1.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def drift_recall(conn, stats: IndexStats, model: str, n: int = INDEX_SAMPLE, k: int = INDEX_EVAL_K) -> Optional[float]:
+    """Self-recall@k on vectors added since the last rebuild (all vectors if never rebuilt)."""
+    vectors = sample_vectors(conn, model, n, since=stats.built_at)
+    if not vectors:
+        return None
+    truth = exact_neighbours(conn, model, vectors, k)
+    return recall_at_k(conn, model, vectors, truth, k)["recall"]
+
+
+def needs_rebuild(stats: IndexStats, drift: Optional[float]) -> Optional[str]:
+    """Why the index should be rebuilt, or None."""
+    if stats.rows == 0:
+        return None
+    if stats.lists_at_build and stats.lists != stats.lists_at_build:
+        # reloption changed but the REINDEX that goes with it never finished
+        return f"index has lists={stats.lists} set but was built with {stats.lists_at_build}"
+    ratio = stats.target_lists / stats.lists
+    if ratio >= INDEX_LISTS_TOLERANCE or ratio <= 1.0 / INDEX_LISTS_TOLERANCE:
+        return f"lists {stats.lists} vs {stats.target_lists} for {stats.rows} rows"
+    if stats.rows_at_build and stats.rows >= INDEX_GROWTH_FACTOR * stats.rows_at_build:
+        return f"rows grew {stats.rows_at_build} -> {stats.rows}"
+    if drift is not None and drift < INDEX_MIN_RECALL:
+        return f"self-recall on new rows {drift:.3f} < {INDEX_MIN_RECALL}"
+    return None
+
+
+# ---------- actions (autocommit connection) ----------
+def probes_for(lists: int) -> int:
+    return max(1, round(lists ** 0.5))
+
+
+def _set_lists(cur, name: str, lists: int) -> None:
+    # catalog-only change, but takes an exclusive lock; don't queue behind long queries
+    cur.execute("SET lock_timeout = '5s';")
+    cur.execute(sql.SQL("ALTER INDEX {} SET (lists = {});").format(sql.Identifier(name), sql.Literal(int(lists))))
+    cur.execute("RESET lock_timeout;")
+
+
+def drop_invalid(conn, name: str) -> List[str]:
+    """Drop what a failed REINDEX CONCURRENTLY of `name` left behind (invalid name_ccnew / name_ccold)."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass AND NOT i.indisvalid AND c.relname LIKE %s;
+        """, (TABLE, name.replace("_", r"\_") + r"\_cc%"))
+        names = [r[0] for r in cur.fetchall()]
+        for n in names:
+            cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(n)))
+    return names
+
+
+def rebuild(conn, name: str, lists: int, lists_before: int) -> None:
+    """Re-cluster the index with `lists` lists without blocking searches or ingest.
+
+    If the REINDEX fails, the invalid copy is dropped and the index gets its old
+    lists back, so the reloption keeps describing the centroids actually in use.
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SET maintenance_work_mem = {};").format(sql.Literal(INDEX_MAINTENANCE_WORK_MEM)))
+        _set_lists(cur, name, lists)
+        try:
+            cur.execute(sql.SQL("REINDEX INDEX CONCURRENTLY {};").format(sql.Identifier(name)))
+        except Exception:
+            try:
+                drop_invalid(conn, name)
+                _set_lists(cur, name, lists_before)
+            except Exception as e:  # the next run retries the cleanup; keep the original error
+                print(f"Cleanup after failed REINDEX of {name} failed: {e!r}", flush=True)
+            raise
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(TABLE)))
+
+
+def set_database_probes(conn, probes: int) -> None:
+    """Default ivfflat.probes for new sessions (the API opens one per request)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT current_database();")
+        db_name = cur.fetchone()[0]
+        cur.execute(sql.SQL("ALTER DATABASE {} SET ivfflat.probes = {};").format(
+            sql.Identifier(db_name), sql.Literal(int(probes))))
+
+
+def postmaster_start(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_postmaster_start_time();")
+        return cur.fetchone()[0]
+
+
+def needs_prewarm(conn, name: str) -> bool:
+    """True if the index was not prewarmed since the server last started."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT MAX(postmaster_start) FROM vector_index_maintenance
+            WHERE index_name = %s AND action = 'prewarm';
+        """, (name,))
+        last = cur.fetchone()[0]
+    return last is None or last < postmaster_start(conn)
+
+
+def prewarm(conn, name: str) -> int:
+    """Load the index into shared buffers (pg_prewarm); returns blocks read."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_prewarm(%s::regclass);", (name,))
+        return cur.fetchone()[0]
+
+
+def log_run(conn, **fields) -> None:
+    cols = list(fields)
+    with conn.cursor() as cur:
+        cur.execute(
+            sql.SQL("INSERT INTO vector_index_maintenance ({}) VALUES ({});").format(
+                sql.SQL(", ").join(map(sql.Identifier, cols)),
+                sql.SQL(", ").join(sql.Placeholder() * len(cols)),
+            ),
+            [fields[c] for c in cols],
+        )
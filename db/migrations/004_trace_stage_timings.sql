@@ -0,0 +1,6 @@
+-- 004_trace_stage_timings.sql
+
+-- per-stage latencies (ms) of the /search request that produced the trace,
+-- e.g. {"auth": 1.2, "embed": 14.8, "ann_sql": 22.4}
+ALTER TABLE retrieval_trace
+  ADD COLUMN IF NOT EXISTS stage_timings JSONB;
@@ -0,0 +1,68 @@
+-- 010_trace_partitioning.sql
+
+-- Convert retrieval_trace / retrieval_trace_hit to monthly range partitions.
+-- Existing rows are copied into the default partitions; the next
+-- `python scripts/trace_maintenance.py` (or API start) moves them into monthly
+-- partitions. Run during a quiet period: /search writes block while this runs.
+BEGIN;
+
+LOCK TABLE retrieval_trace, retrieval_trace_hit IN ACCESS EXCLUSIVE MODE;
+
+-- evals outlive their traces once retention drops a partition
+ALTER TABLE retrieval_eval DROP CONSTRAINT IF EXISTS retrieval_eval_trace_id_fkey;
+
+ALTER TABLE retrieval_trace_hit RENAME TO retrieval_trace_hit_legacy;
+ALTER TABLE retrieval_trace RENAME TO retrieval_trace_legacy;
+ALTER INDEX IF EXISTS idx_retrieval_trace_created_at RENAME TO idx_retrieval_trace_legacy_created_at;
+ALTER INDEX IF EXISTS idx_retrieval_trace_hit_chunk RENAME TO idx_retrieval_trace_hit_legacy_chunk;
+
+CREATE TABLE retrieval_trace (
+  trace_id   BIGINT NOT NULL DEFAULT nextval('retrieval_trace_trace_id_seq'),
+  user_id    UUID REFERENCES app_user(user_id),
+  query_text TEXT NOT NULL,
+  top_k      INT  NOT NULL,
+  stage_timings JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  hit_chunk_ids UUID[],
+  hit_scores    DOUBLE PRECISION[],
+  PRIMARY KEY (trace_id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE retrieval_trace_trace_id_seq OWNED BY retrieval_trace.trace_id;
+
+CREATE TABLE retrieval_trace_hit (
+  trace_id   BIGINT NOT NULL,
+  rank       INT NOT NULL,
+  chunk_id   UUID REFERENCES chunk(chunk_id) ON DELETE CASCADE,
+  score      DOUBLE PRECISION NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (trace_id, rank, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE retrieval_trace_default PARTITION OF retrieval_trace DEFAULT;
+CREATE TABLE retrieval_trace_hit_default PARTITION OF retrieval_trace_hit DEFAULT;
+
+CREATE INDEX idx_retrieval_trace_created_at ON retrieval_trace(created_at DESC);
+CREATE INDEX idx_retrieval_trace_hit_chunk ON retrieval_trace_hit(chunk_id);
+
+INSERT INTO retrieval_trace (trace_id, user_id, query_text, top_k, stage_timings, created_at)
+SELECT trace_id, user_id, query_text, top_k, stage_timings, created_at
+FROM retrieval_trace_legacy;
+
+INSERT INTO retrieval_trace_hit (trace_id, rank, chunk_id, score, created_at)
+SELECT h.trace_id, h.rank, h.chunk_id, h.score, t.created_at
+FROM retrieval_trace_hit_legacy h
+JOIN retrieval_trace_legacy t ON t.trace_id = h.trace_id;
+
+DROP TABLE retrieval_trace_hit_legacy;
+DROP TABLE retrieval_trace_legacy;
+
+CREATE OR REPLACE VIEW retrieval_trace_hits AS
+SELECT h.trace_id, h.rank, h.chunk_id, h.score, h.created_at
+FROM retrieval_trace_hit h
+UNION ALL
+SELECT t.trace_id, a.rank::int, a.chunk_id, a.score, t.created_at
+FROM retrieval_trace t
+CROSS JOIN LATERAL unnest(t.hit_chunk_ids, t.hit_scores) WITH ORDINALITY AS a(chunk_id, score, rank)
+WHERE t.hit_chunk_ids IS NOT NULL;
+
+COMMIT;
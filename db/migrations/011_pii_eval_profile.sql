@@ -0,0 +1,6 @@
+-- 011_pii_eval_profile.sql
+
+-- redaction profile and throughput of each synthetic PII eval run
+ALTER TABLE pii_eval_run
+  ADD COLUMN IF NOT EXISTS profile TEXT,
+  ADD COLUMN IF NOT EXISTS docs_per_sec DOUBLE PRECISION;
@@ -0,0 +1,14 @@
+-- 012_pii_eval_intervals.sql
+
+-- span-level synthetic PII eval: sample count, per-entity confidence intervals and throughput
+ALTER TABLE pii_eval_run
+  ADD COLUMN IF NOT EXISTS n_samples INTEGER;
+
+ALTER TABLE pii_eval_entity_metrics
+  ADD COLUMN IF NOT EXISTS precision_lo DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS precision_hi DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS recall_lo DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS recall_hi DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS f1_lo DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS f1_hi DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS spans_per_sec DOUBLE PRECISION;
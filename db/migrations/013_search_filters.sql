@@ -0,0 +1,13 @@
+-- 013_search_filters.sql
+
+-- metadata filters on /search: indexes to find matching documents and their chunks
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_chunk_doc ON chunk(doc_id);
+CREATE INDEX IF NOT EXISTS idx_document_owner ON document(owner_user_id);
+CREATE INDEX IF NOT EXISTS idx_document_acl_user ON document_acl(user_id, doc_id);
+CREATE INDEX IF NOT EXISTS idx_document_created_at ON document(created_at);
+-- LIKE 'prefix%' on source_key (the UNIQUE index uses the collation's ordering)
+CREATE INDEX IF NOT EXISTS idx_document_source_key_prefix ON document(source_key text_pattern_ops);
+-- case-insensitive substring match on title
+CREATE INDEX IF NOT EXISTS idx_document_title_trgm ON document USING gin (title gin_trgm_ops);
@@ -0,0 +1,30 @@
+-- 014_vector_index_maintenance.sql
+
+-- log of ivfflat index checks, rebuilds and prewarms (scripts/index_maintenance.py)
+CREATE EXTENSION IF NOT EXISTS pg_prewarm;
+
+CREATE TABLE IF NOT EXISTS vector_index_maintenance (
+  id                BIGSERIAL PRIMARY KEY,
+  run_id            UUID NOT NULL,
+  index_name        TEXT NOT NULL,
+  action            TEXT NOT NULL CHECK (action IN ('check', 'rebuild', 'prewarm')),
+  reason            TEXT,
+  n_rows            BIGINT,
+  lists_before      INT,
+  lists_after       INT,
+  probes_before     INT,
+  probes_after      INT,
+  drift_recall      DOUBLE PRECISION,   -- self-recall@k on vectors added since the last rebuild
+  recall_before     DOUBLE PRECISION,   -- recall@k on held-out queries
+  recall_after      DOUBLE PRECISION,
+  p50_ms_before     DOUBLE PRECISION,
+  p50_ms_after      DOUBLE PRECISION,
+  p95_ms_before     DOUBLE PRECISION,
+  p95_ms_after      DOUBLE PRECISION,
+  seconds           DOUBLE PRECISION,
+  postmaster_start  TIMESTAMPTZ,        -- server start this ran under (prewarm is redone after a restart)
+  created_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_vector_index_maintenance_action
+  ON vector_index_maintenance(index_name, action, created_at DESC);
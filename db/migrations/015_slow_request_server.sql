@@ -0,0 +1,5 @@
+-- 015_slow_request_server.sql
+
+-- reads go to replicas: which server ran the slow search, and which one its EXPLAIN ran on
+ALTER TABLE slow_request_log ADD COLUMN IF NOT EXISTS served_by   TEXT;
+ALTER TABLE slow_request_log ADD COLUMN IF NOT EXISTS plan_server TEXT;
@@ -40,19 +40,25 @@ CREATE TABLE IF NOT EXISTS chunk_embedding (
   created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
--- Retrieval trace (UUID FKs)
+-- Retrieval trace (UUID FKs), partitioned by month (see 10_trace_partitions.sql)
 CREATE TABLE IF NOT EXISTS retrieval_trace (
-  trace_id   BIGSERIAL PRIMARY KEY,
+  trace_id   BIGSERIAL,
   user_id    UUID REFERENCES app_user(user_id),
   query_text TEXT NOT NULL,
   top_k      INT  NOT NULL,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
+  stage_timings JSONB,          -- per-stage latencies (ms) of the /search request
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  hit_chunk_ids UUID[],         -- compacted partitions only: hits ordered by rank
+  hit_scores    DOUBLE PRECISION[],
+  PRIMARY KEY (trace_id, created_at)
+) PARTITION BY RANGE (created_at);
 
+-- created_at is the trace's created_at (partition key; same transaction, same NOW())
 CREATE TABLE IF NOT EXISTS retrieval_trace_hit (
-  trace_id BIGINT REFERENCES retrieval_trace(trace_id) ON DELETE CASCADE,
-  rank     INT NOT NULL,
-  chunk_id UUID REFERENCES chunk(chunk_id) ON DELETE CASCADE,
-  score    DOUBLE PRECISION NOT NULL,
-  PRIMARY KEY (trace_id, rank)
-);
+  trace_id   BIGINT NOT NULL,
+  rank       INT NOT NULL,
+  chunk_id   UUID REFERENCES chunk(chunk_id) ON DELETE CASCADE,
+  score      DOUBLE PRECISION NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (trace_id, rank, created_at)
+) PARTITION BY RANGE (created_at);
@@ -1,6 +1,6 @@
 CREATE TABLE IF NOT EXISTS retrieval_eval (
   eval_id     BIGSERIAL PRIMARY KEY,
-  trace_id    BIGINT REFERENCES retrieval_trace(trace_id) ON DELETE CASCADE,
+  trace_id    BIGINT,  -- retrieval_trace row; kept after the trace's partition expires
   query_text  TEXT NOT NULL,
   gold_chunks UUID[] NOT NULL,
   top_k       INT NOT NULL,
@@ -14,9 +14,12 @@ CREATE INDEX IF NOT EXISTS redaction_log_type_idx  ON redaction_log(entity_type)
 
 -- Synthetic/benchmark PII evaluation runs (precision/recall/F1)
 CREATE TABLE IF NOT EXISTS pii_eval_run (
-  run_id     BIGSERIAL PRIMARY KEY,
-  notes      TEXT,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+  run_id       BIGSERIAL PRIMARY KEY,
+  notes        TEXT,
+  profile      TEXT,               -- redaction profile (ingest/pii.py PROFILES)
+  docs_per_sec DOUBLE PRECISION,   -- redaction throughput, model load excluded
+  n_samples    INTEGER,            -- synthetic sentences scored
+  created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
 -- Per-entity metrics for a run
@@ -29,6 +32,14 @@ CREATE TABLE IF NOT EXISTS pii_eval_entity_metrics (
   precision  DOUBLE PRECISION NOT NULL,
   recall     DOUBLE PRECISION NOT NULL,
   f1         DOUBLE PRECISION NOT NULL,
+  -- 95% intervals (Wilson for precision/recall, shard bootstrap for F1)
+  precision_lo  DOUBLE PRECISION,
+  precision_hi  DOUBLE PRECISION,
+  recall_lo     DOUBLE PRECISION,
+  recall_hi     DOUBLE PRECISION,
+  f1_lo         DOUBLE PRECISION,
+  f1_hi         DOUBLE PRECISION,
+  spans_per_sec DOUBLE PRECISION,  -- gold spans of this type scored per second
   PRIMARY KEY (run_id, entity_type)
 );
 
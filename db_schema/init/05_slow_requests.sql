@@ -0,0 +1,19 @@
+-- /search requests that exceeded SLOW_REQUEST_MS, with plan (+ profile when sampled)
+CREATE TABLE IF NOT EXISTS slow_request_log (
+  slow_id       BIGSERIAL PRIMARY KEY,
+  route         TEXT NOT NULL,
+  user_id       UUID REFERENCES app_user(user_id) ON DELETE SET NULL,
+  query_text    TEXT NOT NULL,
+  top_k         INT NOT NULL,
+  total_ms      DOUBLE PRECISION NOT NULL,
+  stage_timings JSONB NOT NULL,          -- {stage: ms}
+  plan          JSONB,                   -- EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) of the ANN/ACL query; NULL for cache hits
+  profile       JSONB,                   -- collapsed Python stacks from the sampling profiler (sampled requests only)
+  trace_id      BIGINT,                  -- retrieval_trace row of the same request
+  served_by     TEXT,                    -- server that ran the search: primary or replicaN
+  plan_server   TEXT,                    -- server the EXPLAIN ran on (primary if that replica was unreachable)
+  created_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS slow_request_log_created_idx ON slow_request_log(created_at DESC);
+CREATE INDEX IF NOT EXISTS slow_request_log_user_idx    ON slow_request_log(user_id, created_at DESC);
@@ -0,0 +1,7 @@
+-- Per-user corpus version; bumped whenever a document the user can see is
+-- (re)ingested or the user's ACL grants change. Used to validate cached /search results.
+CREATE TABLE IF NOT EXISTS user_corpus_version (
+  user_id    UUID PRIMARY KEY REFERENCES app_user(user_id) ON DELETE CASCADE,
+  version    BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,19 @@
+-- Checkpoints of scripts/reembed.py (background re-embedding into chunk_embedding_next)
+CREATE TABLE IF NOT EXISTS reembed_job (
+  job_id         BIGSERIAL PRIMARY KEY,
+  target_model   TEXT NOT NULL,
+  dim            INT NOT NULL,
+  status         TEXT NOT NULL DEFAULT 'running'
+                 CHECK (status IN ('running', 'indexed', 'cut_over', 'aborted')),
+  last_chunk_id  UUID,                 -- keyset cursor of the backfill pass
+  rows_done      BIGINT NOT NULL DEFAULT 0,
+  started_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- at most one unfinished job at a time
+CREATE UNIQUE INDEX IF NOT EXISTS reembed_job_active_idx
+  ON reembed_job ((true)) WHERE status IN ('running', 'indexed');
+
+-- coverage / status queries group embeddings by model
+CREATE INDEX IF NOT EXISTS idx_chunk_embedding_model ON chunk_embedding(model_name);
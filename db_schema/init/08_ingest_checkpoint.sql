@@ -0,0 +1,9 @@
+-- Per-file checkpoints of ingest/bulk_ingest.py; a file whose content hash
+-- matches the recorded one is skipped on the next run.
+CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+  source_key   TEXT PRIMARY KEY,
+  content_sha  TEXT NOT NULL,
+  doc_id       UUID REFERENCES document(doc_id) ON DELETE CASCADE,
+  chunks       INT NOT NULL DEFAULT 0,
+  updated_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
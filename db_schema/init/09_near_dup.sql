@@ -0,0 +1,23 @@
+-- Near-duplicate chunks (ingest/dedup.py). A duplicate points at its canonical
+-- chunk and has no chunk_embedding row; searches reach it via the canonical's vector.
+ALTER TABLE chunk ADD COLUMN IF NOT EXISTS dup_of UUID REFERENCES chunk(chunk_id);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_dup_of ON chunk(dup_of) WHERE dup_of IS NOT NULL;
+-- search joins every chunk to the vector it is served by
+CREATE INDEX IF NOT EXISTS idx_chunk_canonical ON chunk ((COALESCE(dup_of, chunk_id)));
+
+-- MinHash signature of each canonical chunk
+CREATE TABLE IF NOT EXISTS chunk_minhash (
+  chunk_id  UUID PRIMARY KEY REFERENCES chunk(chunk_id) ON DELETE CASCADE,
+  sig       BIGINT[] NOT NULL
+);
+
+-- LSH band buckets of canonical chunks
+CREATE TABLE IF NOT EXISTS chunk_lsh (
+  band      SMALLINT NOT NULL,
+  bucket    BIGINT NOT NULL,
+  chunk_id  UUID NOT NULL REFERENCES chunk(chunk_id) ON DELETE CASCADE,
+  PRIMARY KEY (band, bucket, chunk_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_lsh_chunk ON chunk_lsh(chunk_id);
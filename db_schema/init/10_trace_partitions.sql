@@ -0,0 +1,14 @@
+-- Catch-all partitions; monthly partitions are created (and rows moved out of
+-- these) by apps/trace_retention.py at API startup and by scripts/trace_maintenance.py.
+CREATE TABLE IF NOT EXISTS retrieval_trace_default PARTITION OF retrieval_trace DEFAULT;
+CREATE TABLE IF NOT EXISTS retrieval_trace_hit_default PARTITION OF retrieval_trace_hit DEFAULT;
+
+-- Hits of live (row per rank) and compacted (per-trace arrays) partitions alike
+CREATE OR REPLACE VIEW retrieval_trace_hits AS
+SELECT h.trace_id, h.rank, h.chunk_id, h.score, h.created_at
+FROM retrieval_trace_hit h
+UNION ALL
+SELECT t.trace_id, a.rank::int, a.chunk_id, a.score, t.created_at
+FROM retrieval_trace t
+CROSS JOIN LATERAL unnest(t.hit_chunk_ids, t.hit_scores) WITH ORDINALITY AS a(chunk_id, score, rank)
+WHERE t.hit_chunk_ids IS NOT NULL;
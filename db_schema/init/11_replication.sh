@@ -0,0 +1,4 @@
+#!/bin/bash
+# Let streaming replicas (docker compose --profile replica) connect with a password.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,61 +1,315 @@
+"""
+Pipelined bulk ingest of cleaned SEC filings (data/sec/clean/*.txt).
+
+    extract+chunk ──q──> redact (process pool) ──q──> dedup+embed (batched) ──q──> write (COPY)
+
+Stages run concurrently with bounded queues between them, so the CPU-bound
+redaction, the embedding model and Postgres are busy at the same time while
+memory stays bounded. Each file is written in one transaction keyed by its
+source_key ("sec/<file name>") together with its ingest_checkpoint row, so a
+crashed run can simply be restarted: finished files are skipped by content
+hash and a half-written file is replaced, never duplicated.
+
+Near-duplicate chunks (ingest/dedup.py) are detected before embedding, against
+the database and against files still in flight, and are stored without a
+vector of their own.
+
+Heavy imports (embedding model, Presidio) happen inside main(): worker
+processes are spawned and re-import this module, and must stay light.
+"""
+import argparse
+import hashlib
+import queue
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from apps import db
-from apps.embeddings import embed_texts, EMBEDDING_MODEL
-from ingest.pii import redact_text
-from ingest.min_ingest import simple_sent_chunk  # reuse existing chunker
+from ingest.dedup import NearDupIndex, DedupPlan, plan_chunks, write_chunks
 
 CLEAN_DIR = Path("data/sec/clean")
+SOURCE_PREFIX = "sec/"
+
+_DONE = object()  # end-of-stream marker passed down the queues
+
+
+class FileJob:
+    """One file flowing through the pipeline."""
+
+    def __init__(self, path: Path, source_key: str, content_sha: str, title: str, chunks: List[str]):
+        self.path = path
+        self.source_key = source_key
+        self.content_sha = content_sha
+        self.title = title
+        self.chunks = chunks
+        self.redacted: List[str] = []
+        self.counts: List[Dict[str, int]] = []
+        self.vectors: List[List[float]] = []
+        self.plan: Optional[DedupPlan] = None
+
+
+class Pipeline:
+    def __init__(self, paths: List[Path], args, embed_fn, model_name: str, chunk_fn, chunk_stats):
+        self.paths = paths
+        self.args = args
+        self.embed_fn = embed_fn
+        self.model_name = model_name
+        self.chunk_fn = chunk_fn
+        self.chunk_stats = chunk_stats
+        self.q_redact: "queue.Queue" = queue.Queue(maxsize=args.queue_size)
+        self.q_embed: "queue.Queue" = queue.Queue(maxsize=args.queue_size)
+        self.q_write: "queue.Queue" = queue.Queue(maxsize=args.queue_size)
+        self.stop = threading.Event()
+        self.errors: List[BaseException] = []
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+        self.files_skipped = 0
+        self.files_done = 0
+        self.chunks_done = 0
+        self.dups_done = 0
+        # canonical chunks of files planned but not yet committed
+        self.dedup_index = NearDupIndex()
+        # the writer may need to embed a few chunks whose canonical vanished
+        self.embed_lock = threading.Lock()
+        self.busy = {"extract": 0.0, "redact": 0.0, "embed": 0.0, "write": 0.0}
+
+    # ---------- plumbing ----------
+    def _put(self, q: "queue.Queue", item) -> bool:
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue"):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _stage(self, name: str, fn) -> threading.Thread:
+        def run():
+            try:
+                fn()
+            except BaseException as e:
+                self.errors.append(e)
+                self.stop.set()
+        t = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+        t.start()
+        return t
+
+    # ---------- stages ----------
+    def extract(self, done_shas: Dict[str, str]) -> None:
+        for path in self.paths:
+            t0 = time.perf_counter()
+            data = path.read_bytes()
+            sha = hashlib.sha256(data).hexdigest()
+            source_key = SOURCE_PREFIX + path.name
+            if not self.args.force and done_shas.get(source_key) == sha:
+                with self.lock:
+                    self.files_skipped += 1
+                continue
+            text = data.decode("utf-8", errors="ignore")
+            del data
+            chunks = self.chunk_fn(text, stats=self.chunk_stats)
+            job = FileJob(path, source_key, sha, path.stem.replace("_", " "), chunks)
+            self.busy["extract"] += time.perf_counter() - t0
+            if not self._put(self.q_redact, job):
+                return
+        self._put(self.q_redact, _DONE)
+
+    def redact(self, pool: ProcessPoolExecutor, redact_batch) -> None:
+        bs = self.args.redact_batch
+        while True:
+            job = self._get(self.q_redact)
+            if job is _DONE:
+                break
+            t0 = time.perf_counter()
+            futs = [pool.submit(redact_batch, job.chunks[i:i + bs], profile=self.args.redaction_profile)
+                    for i in range(0, len(job.chunks), bs)]
+            for fut in futs:
+                for red, counts in fut.result():
+                    job.redacted.append(red)
+                    job.counts.append(counts)
+            job.chunks = []
+            self.busy["redact"] += time.perf_counter() - t0
+            if not self._put(self.q_embed, job):
+                return
+        self._put(self.q_embed, _DONE)
+
+    def embed(self) -> None:
+        """Batch small files together so the model always sees full batches."""
+        pending: List[FileJob] = []
+        n_pending = 0
+        finished = False
+        with db.get_conn() as conn:
+            while not finished:
+                job = self._get(self.q_embed)
+                if job is _DONE:
+                    finished = True
+                else:
+                    t0 = time.perf_counter()
+                    job.plan = plan_chunks(conn, job.redacted, exclude_source_key=job.source_key,
+                                           index=self.dedup_index, group=job.source_key)
+                    conn.commit()
+                    self.busy["embed"] += time.perf_counter() - t0
+                    pending.append(job)
+                    n_pending += len(job.plan.canonical)
+                if pending and (finished or n_pending >= self.args.embed_batch):
+                    t0 = time.perf_counter()
+                    with self.embed_lock:
+                        vectors = self.embed_fn([j.redacted[i] for j in pending for i in j.plan.canonical])
+                    self.busy["embed"] += time.perf_counter() - t0
+                    pos = 0
+                    for j in pending:
+                        n = len(j.plan.canonical)
+                        j.vectors = vectors[pos:pos + n]
+                        pos += n
+                        if not self._put(self.q_write, j):
+                            return
+                    pending, n_pending = [], 0
+        self._put(self.q_write, _DONE)
+
+    def _embed_locked(self, texts: List[str]) -> List[List[float]]:
+        with self.embed_lock:
+            return self.embed_fn(texts)
+
+    def write(self, owner_email: str, owner_name: str) -> None:
+        with db.get_conn() as conn:
+            conn.execute("SET TIME ZONE 'UTC';")
+            user_id = db.ensure_user(conn, owner_email, owner_name)
+            conn.commit()
+            while True:
+                job = self._get(self.q_write)
+                if job is _DONE:
+                    break
+                t0 = time.perf_counter()
+                self._write_one(conn, user_id, job)
+                # committed: later files find these chunks in the database
+                self.dedup_index.discard_group(job.source_key)
+                self.busy["write"] += time.perf_counter() - t0
+                with self.lock:
+                    self.files_done += 1
+                    self.chunks_done += len(job.redacted)
+                    self.dups_done += job.plan.duplicates
+                print(f"{job.path.name}: {len(job.redacted)} chunks", flush=True)
+
+    def _write_one(self, conn, user_id, job: FileJob) -> None:
+        """Replace the document's content and record the checkpoint in one transaction."""
+        doc_id, _ = db.create_or_get_document(conn, user_id, job.title, job.source_key)
+        db.delete_document_chunks(conn, doc_id)
+        chunk_ids = write_chunks(conn, doc_id, job.redacted, job.plan, job.vectors, self.model_name,
+                                 self._embed_locked)
+        db.insert_redaction_logs(conn, doc_id, chunk_ids, job.counts)
+        db.grant_owner(conn, doc_id, user_id)
+        db.bump_corpus_versions(conn, doc_id)
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ingest_checkpoint (source_key, content_sha, doc_id, chunks, updated_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (source_key) DO UPDATE
+                  SET content_sha = EXCLUDED.content_sha, doc_id = EXCLUDED.doc_id,
+                      chunks = EXCLUDED.chunks, updated_at = NOW();
+            """, (job.source_key, job.content_sha, doc_id, len(chunk_ids)))
+        conn.commit()
+
+    # ---------- reporting ----------
+    def report(self) -> None:
+        while not self.stop.wait(self.args.report_every):
+            print(self._summary_line(), flush=True)
+
+    def _summary_line(self) -> str:
+        elapsed = time.perf_counter() - self.t0
+        with self.lock:
+            files, chunks, skipped, dups = self.files_done, self.chunks_done, self.files_skipped, self.dups_done
+        busy = " ".join(f"{k}={100.0 * v / elapsed:.0f}%" for k, v in self.busy.items()) if elapsed else ""
+        return (f"[{elapsed:7.1f}s] files {files + skipped}/{len(self.paths)} (skipped {skipped})  "
+                f"chunks {chunks} ({chunks / elapsed if elapsed else 0.0:.1f}/s, {dups} near-dup)  "
+                f"queues r={self.q_redact.qsize()} e={self.q_embed.qsize()} w={self.q_write.qsize()}  busy {busy}")
+
+
+def _done_checkpoints() -> Dict[str, str]:
+    with db.get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT source_key, content_sha FROM ingest_checkpoint WHERE source_key LIKE %s;",
+                        (SOURCE_PREFIX + "%",))
+            return dict(cur.fetchall())
 
-def ingest_one_file(conn, path: Path, owner_email="alice@example.com", owner_name="Alice"):
-    raw = path.read_text(encoding="utf-8", errors="ignore")
-    chunks = simple_sent_chunk(raw, max_len=800)
-    redacted = [redact_text(c) for c in chunks]
-
-    user_id = db.ensure_user(conn, owner_email, owner_name)
-    title = path.stem.replace("_", " ")
-    doc_id = db.create_document(conn, user_id, f"{title} ({int(time.time())})")
-    db.grant_owner(conn, doc_id, user_id)
-
-    chunk_ids = []
-    with conn.cursor() as cur:
-        for ord_i, txt in enumerate(redacted):
-            cur.execute(
-                "INSERT INTO chunk (doc_id, ord, redacted_text) VALUES (%s, %s, %s) RETURNING chunk_id;",
-                (doc_id, ord_i, txt),
-            )
-            chunk_ids.append(cur.fetchone()[0])
-    conn.commit()
-
-    vectors = embed_texts(redacted)
-    with conn.cursor() as cur:
-        for cid, vec in zip(chunk_ids, vectors):
-            placeholder = ",".join(["%s"] * len(vec))
-            cur.execute(
-                f"""
-                INSERT INTO chunk_embedding (chunk_id, embedding, model_name)
-                VALUES (%s, ARRAY[{placeholder}]::vector, %s)
-                ON CONFLICT (chunk_id) DO UPDATE
-                  SET embedding = EXCLUDED.embedding, model_name = EXCLUDED.model_name;
-                """,
-                (cid, *vec, EMBEDDING_MODEL),
-            )
-    conn.commit()
-    return doc_id, len(redacted)
 
 def main():
+    ap = argparse.ArgumentParser(description="Ingest cleaned SEC filings from data/sec/clean")
+    ap.add_argument("--owner-email", default="alice@example.com")
+    ap.add_argument("--owner-name", default="Alice")
+    ap.add_argument("--redact-workers", type=int, default=2, help="Presidio worker processes")
+    ap.add_argument("--redact-batch", type=int, default=64, help="chunks per redaction task")
+    ap.add_argument("--redaction-profile", default=None,
+                    help="fast | balanced | strict (default REDACTION_PROFILE)")
+    ap.add_argument("--embed-batch", type=int, default=512, help="texts per embedding call (across files)")
+    ap.add_argument("--embed-workers", type=int, default=None,
+                    help="embedding worker processes (0 = embed in this process; default EMBED_POOL_WORKERS)")
+    ap.add_argument("--embed-threads", type=int, default=None, help="torch threads per embedding worker")
+    ap.add_argument("--queue-size", type=int, default=4, help="files buffered between stages")
+    ap.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    ap.add_argument("--force", action="store_true", help="re-ingest files even if their checkpoint matches")
+    args = ap.parse_args()
+
     paths = sorted(CLEAN_DIR.glob("*.txt"))
     if not paths:
         raise SystemExit(f"No files found in {CLEAN_DIR}. Run scripts/clean_sec.py first.")
-    with db.get_conn() as conn:
-        conn.execute("SET TIME ZONE 'UTC';")
-        totals = []
-        for p in paths:
-            doc_id, n = ingest_one_file(conn, p)
-            print(f"{p.name}: {n} chunks → doc_id={doc_id}")
-            totals.append(n)
-        print(f"\nAll done. Files: {len(paths)}, total chunks: {sum(totals)}")
+
+    # heavy imports only in the parent process (see module docstring)
+    from ingest.chunking import chunk_text, ChunkStats
+    from ingest.pii import redact_batch, PROFILES, REDACTION_PROFILE
+    from apps.embed_pool import EmbeddingPool, EMBED_POOL_WORKERS, EMBED_POOL_THREADS
+    from apps.embed_scheduler import EmbedStats
+    from apps.embeddings import embed_texts, EMBEDDING_MODEL
+
+    args.redaction_profile = args.redaction_profile or REDACTION_PROFILE
+    if args.redaction_profile not in PROFILES:
+        raise SystemExit(f"Unknown redaction profile {args.redaction_profile!r}; expected one of {PROFILES}")
+    print(f"Redaction profile: {args.redaction_profile}")
+
+    embed_workers = EMBED_POOL_WORKERS if args.embed_workers is None else args.embed_workers
+    embed_threads = args.embed_threads or EMBED_POOL_THREADS
+    embed_stats = EmbedStats()
+    pool = EmbeddingPool(embed_workers, embed_threads) if embed_workers > 0 else None
+    embed_fn = pool.embed_texts if pool else (lambda texts: embed_texts(texts, stats=embed_stats))
+
+    chunk_stats = ChunkStats()
+    pipe = Pipeline(paths, args, embed_fn, EMBEDDING_MODEL, chunk_text, chunk_stats)
+    done_shas = {} if args.force else _done_checkpoints()
+    try:
+        with ProcessPoolExecutor(max_workers=args.redact_workers, mp_context=get_context("spawn")) as rpool:
+            threads = [
+                pipe._stage("extract", lambda: pipe.extract(done_shas)),
+                pipe._stage("redact", lambda: pipe.redact(rpool, redact_batch)),
+                pipe._stage("embed", pipe.embed),
+                pipe._stage("write", lambda: pipe.write(args.owner_email, args.owner_name)),
+            ]
+            reporter = threading.Thread(target=pipe.report, daemon=True)
+            reporter.start()
+            for t in threads:
+                t.join()
+            pipe.stop.set()
+    finally:
+        if pool is not None:
+            pool.close()
+
+    print(pipe._summary_line())
+    if pipe.errors:
+        raise pipe.errors[0]
+    print(f"\nAll done. Files: {len(paths)} ({pipe.files_skipped} unchanged), total chunks: {pipe.chunks_done}")
+    print(f"Chunk tokens: {chunk_stats.summary()}")
+    if pool is None:
+        print(f"Embedding: {embed_stats.summary()}")
+
 
 if __name__ == "__main__":
     main()
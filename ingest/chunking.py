@@ -0,0 +1,180 @@
+# ingest/chunking.py
+"""
+Token-aware sentence chunker shared by the API and the ingest scripts.
+
+Chunk budgets are measured with the embedding model's own tokenizer
+(apps.embeddings.count_tokens), so a chunk never exceeds the model's
+sequence limit and gets silently truncated by encode().
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from apps.embeddings import count_tokens, MAX_SEQ_TOKENS, SPECIAL_TOKENS
+
+# sentence ends, or paragraph breaks
+_SENT_SPLIT = re.compile(r"(?<=[\.!?])\s+|\n{2,}")
+_WS = re.compile(r"\s+")
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "32"))
+
+# sentences are tokenized in blocks of this size (one tokenizer call per block)
+_COUNT_BLOCK = 256
+
+
+def model_token_limit() -> int:
+    """Largest chunk (in tokens) the embedding model accepts without truncation."""
+    return max(1, MAX_SEQ_TOKENS - SPECIAL_TOKENS)
+
+
+@dataclass
+class ChunkStats:
+    """
+    Token-length distribution of emitted chunks (before redaction). Truncation
+    is counted by apps.embed_scheduler.EmbedStats on the text actually embedded.
+    """
+    limit: int = field(default_factory=model_token_limit)
+    lengths: List[int] = field(default_factory=list)
+    split_sentences: int = 0   # sentences longer than the budget, hard-split on words
+
+    def add(self, n_tokens: int) -> None:
+        self.lengths.append(n_tokens)
+
+    def summary(self) -> dict:
+        n = len(self.lengths)
+        if not n:
+            return {"chunks": 0, "tokens": 0, "split_sentences": self.split_sentences}
+        s = sorted(self.lengths)
+        pct = lambda q: s[min(n - 1, int(q * n))]
+        return {
+            "chunks": n,
+            "tokens": sum(s),
+            "min": s[0],
+            "mean": round(sum(s) / n, 1),
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": s[-1],
+            "limit": self.limit,
+            "split_sentences": self.split_sentences,
+        }
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """Yield non-empty sentences/paragraphs without materializing the whole split."""
+    start = 0
+    for m in _SENT_SPLIT.finditer(text):
+        part = text[start:m.start()].strip()
+        if part:
+            yield part
+        start = m.end()
+    tail = text[start:].strip()
+    if tail:
+        yield tail
+
+
+def _counted(sentences: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """Pair each sentence with its token count, tokenizing in blocks."""
+    block: List[str] = []
+    for s in sentences:
+        block.append(s)
+        if len(block) >= _COUNT_BLOCK:
+            yield from zip(block, count_tokens(block))
+            block = []
+    if block:
+        yield from zip(block, count_tokens(block))
+
+
+def _split_long(sentence: str, budget: int) -> List[Tuple[str, int]]:
+    """Hard-split one over-budget sentence into word windows that fit the budget."""
+    words = _WS.split(sentence)
+    counts = count_tokens(words)
+    out: List[Tuple[str, int]] = []
+    buf: List[str] = []
+    buf_n = 0
+    for w, n in zip(words, counts):
+        if buf and buf_n + n > budget:
+            out.append((" ".join(buf), buf_n))
+            buf, buf_n = [], 0
+        buf.append(w)
+        buf_n += n
+    if buf:
+        out.append((" ".join(buf), buf_n))
+    return out
+
+
+def iter_chunks(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+    min_tokens: Optional[int] = None,
+    stats: Optional[ChunkStats] = None,
+) -> Iterator[str]:
+    """
+    Stream chunks of whole sentences, each at most `max_tokens` model tokens.
+
+    - max_tokens is clamped to the model's sequence limit.
+    - overlap_tokens: trailing sentences (up to this many tokens) are repeated
+      at the start of the next chunk.
+    - min_tokens: a final chunk smaller than this is merged into the previous
+      one when the result still fits the budget.
+    """
+    budget = min(max_tokens or CHUNK_MAX_TOKENS, model_token_limit())
+    overlap = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap = max(0, min(overlap, budget // 2))
+    min_tok = CHUNK_MIN_TOKENS if min_tokens is None else min_tokens
+
+    # buf holds (sentence, n_tokens); the first `carried` entries are overlap
+    buf: List[Tuple[str, int]] = []
+    buf_n = 0
+    carried = 0
+    pending: Optional[List[Tuple[str, int]]] = None  # last full chunk, held back for tail merge
+
+    def _emit(parts: List[Tuple[str, int]]) -> str:
+        if stats is not None:
+            stats.add(sum(n for _, n in parts))
+        return " ".join(s for s, _ in parts)
+
+    def _pieces() -> Iterator[Tuple[str, int]]:
+        for sent, n in _counted(iter_sentences(text)):
+            if n > budget:
+                if stats is not None:
+                    stats.split_sentences += 1
+                yield from _split_long(sent, budget)
+            else:
+                yield sent, n
+
+    for sent, n in _pieces():
+        if buf and len(buf) > carried and buf_n + n > budget:
+            if pending is not None:
+                yield _emit(pending)
+            pending = buf
+            # seed the next chunk with the tail of this one
+            tail: List[Tuple[str, int]] = []
+            tail_n = 0
+            for s, sn in reversed(buf):
+                if tail_n + sn > overlap or tail_n + sn + n > budget:
+                    break
+                tail.insert(0, (s, sn))
+                tail_n += sn
+            buf, buf_n, carried = tail, tail_n, len(tail)
+        buf.append((sent, n))
+        buf_n += n
+
+    fresh = buf[carried:]
+    if pending is not None:
+        fresh_n = sum(n for _, n in fresh)
+        pending_n = sum(n for _, n in pending)
+        if fresh and fresh_n < min_tok and pending_n + fresh_n <= budget:
+            yield _emit(pending + fresh)
+            return
+        yield _emit(pending)
+    if fresh:
+        yield _emit(buf)
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, **kwargs) -> List[str]:
+    """List form of iter_chunks()."""
+    return list(iter_chunks(text, max_tokens=max_tokens, **kwargs))
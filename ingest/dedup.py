@@ -0,0 +1,215 @@
+# ingest/dedup.py
+"""
+Near-duplicate chunk detection (MinHash over word shingles + LSH banding).
+
+A chunk whose estimated Jaccard similarity to an already stored chunk is at
+least DEDUP_THRESHOLD is stored with chunk.dup_of pointing at that canonical
+chunk and gets no embedding of its own: it is neither embedded nor indexed,
+and /search reaches it through the canonical's vector. Search still applies
+the ACL to every member, so a user only ever sees text from documents they
+can read; a shared vector never exposes the canonical's document.
+
+Signatures are deterministic (fixed permutation seed, crc32 shingle hashes),
+so they stay comparable across processes and runs. Changing NUM_PERM/BANDS
+invalidates stored signatures.
+"""
+import os
+import re
+import threading
+import uuid
+import zlib
+from hashlib import blake2b
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from apps import db
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # candidate threshold ~ (1/BANDS) ** (1/ROWS) ~= 0.71
+
+_PRIME = np.uint64(4294967291)  # largest prime < 2**32: a*x + b stays below 2**64
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 32 - 5, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 5, size=NUM_PERM, dtype=np.uint64)
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint64 values < 2**32) of the text's word shingles."""
+    words = normalize(text).split()
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket per band (fits a BIGINT column)."""
+    keys = []
+    for i in range(BANDS):
+        digest = blake2b(sig[i * ROWS:(i + 1) * ROWS].tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+class NearDupIndex:
+    """
+    In-memory LSH index of canonical chunks that are not (yet) in the database:
+    earlier chunks of the same request, or files still in flight in bulk ingest.
+    Entries can be dropped per group once they are committed.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._entries: Dict[Hashable, Tuple[np.ndarray, List[int], Hashable]] = {}
+        self._groups: Dict[Hashable, List[Hashable]] = {}
+
+    def add(self, key: Hashable, sig: np.ndarray, keys: List[int], group: Hashable = None) -> None:
+        with self._lock:
+            self._entries[key] = (sig, keys, group)
+            self._groups.setdefault(group, []).append(key)
+            for band, bucket in enumerate(keys):
+                self._buckets.setdefault((band, bucket), []).append(key)
+
+    def query(self, sig: np.ndarray, keys: List[int]) -> Optional[Tuple[Hashable, float]]:
+        best = None
+        with self._lock:
+            seen = set()
+            for band, bucket in enumerate(keys):
+                for cand in self._buckets.get((band, bucket), ()):
+                    if cand in seen:
+                        continue
+                    seen.add(cand)
+                    sim = similarity(sig, self._entries[cand][0])
+                    if sim >= self.threshold and (best is None or sim > best[1]):
+                        best = (cand, sim)
+        return best
+
+    def discard_group(self, group: Hashable) -> None:
+        with self._lock:
+            for key in self._groups.pop(group, ()):
+                _, keys, _ = self._entries.pop(key)
+                for band, bucket in enumerate(keys):
+                    members = self._buckets.get((band, bucket))
+                    if members is not None:
+                        members.remove(key)
+                        if not members:
+                            del self._buckets[(band, bucket)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DedupPlan:
+    """Client-side chunk ids plus, per chunk, the canonical chunk it duplicates (or None)."""
+
+    def __init__(self, chunk_ids: List[uuid.UUID], sigs: Optional[List[np.ndarray]],
+                 keys: Optional[List[List[int]]], dup_of: List[Optional[uuid.UUID]]):
+        self.chunk_ids = chunk_ids
+        self.sigs = sigs
+        self.keys = keys
+        self.dup_of = dup_of
+
+    @property
+    def canonical(self) -> List[int]:
+        """Positions of chunks that need their own embedding."""
+        return [i for i, d in enumerate(self.dup_of) if d is None]
+
+    @property
+    def duplicates(self) -> int:
+        return sum(1 for d in self.dup_of if d is not None)
+
+
+def plan_chunks(conn, texts: Sequence[str], exclude_source_key: Optional[str] = None,
+                index: Optional[NearDupIndex] = None, group: Hashable = None) -> DedupPlan:
+    """
+    Decide which chunks are near-duplicates of stored chunks, of chunks in
+    `index`, or of earlier chunks in `texts`. Chunks of the document with
+    `exclude_source_key` are ignored (it is about to be replaced). Canonical
+    chunks of this batch are added to `index` under `group`.
+    """
+    ids = [uuid.uuid4() for _ in texts]
+    if not DEDUP_ENABLED or not texts:
+        return DedupPlan(ids, None, None, [None] * len(texts))
+
+    sigs = [minhash(t) for t in texts]
+    keys = [band_keys(s) for s in sigs]
+    stored = _stored_candidates(conn, keys, exclude_source_key)
+
+    local = index if index is not None else NearDupIndex()
+    dup_of: List[Optional[uuid.UUID]] = []
+    for cid, sig, k in zip(ids, sigs, keys):
+        best = local.query(sig, k)
+        for band, bucket in enumerate(k):
+            for cand, cand_sig in stored.get((band, bucket), ()):
+                sim = similarity(sig, cand_sig)
+                if sim >= DEDUP_THRESHOLD and (best is None or sim > best[1]):
+                    best = (cand, sim)
+        if best is None:
+            dup_of.append(None)
+            local.add(cid, sig, k, group)
+        else:
+            dup_of.append(best[0])
+    return DedupPlan(ids, sigs, keys, dup_of)
+
+
+def _stored_candidates(conn, keys: List[List[int]], exclude_source_key: Optional[str]):
+    bands = [b for k in keys for b in range(len(k))]
+    buckets = [x for k in keys for x in k]
+    rows, sigs = db.near_dup_candidates(conn, bands, buckets, exclude_source_key)
+    out: Dict[Tuple[int, int], List[Tuple[uuid.UUID, np.ndarray]]] = {}
+    arrays = {cid: np.asarray(sig, dtype=np.uint64) for cid, sig in sigs.items()}
+    for band, bucket, cid in rows:
+        out.setdefault((band, bucket), []).append((cid, arrays[cid]))
+    return out
+
+
+def write_chunks(conn, doc_id, texts: Sequence[str], plan: DedupPlan, vectors: Sequence[List[float]],
+                 model_name: str, embed_fn: Callable[[List[str]], List[List[float]]]) -> List[uuid.UUID]:
+    """
+    COPY the chunks, embeddings of canonical chunks and their LSH rows (no commit).
+    `vectors` are for plan.canonical, in order. Canonicals that vanished since
+    planning (concurrent re-ingest of their document) are locked out of the race
+    with FOR KEY SHARE; duplicates of a vanished one are embedded here instead.
+    """
+    vec_by_pos = dict(zip(plan.canonical, vectors))
+    referenced = {d for d in plan.dup_of if d is not None} - set(plan.chunk_ids)
+    if referenced:
+        alive = db.lock_chunks(conn, list(referenced))
+        lost = [i for i, d in enumerate(plan.dup_of) if d in referenced and d not in alive]
+        if lost:
+            for i in lost:
+                plan.dup_of[i] = None
+            vec_by_pos.update(zip(lost, embed_fn([texts[i] for i in lost])))
+
+    canonical = plan.canonical
+    db.copy_chunks(conn, doc_id, texts, ids=plan.chunk_ids, dup_of=plan.dup_of)
+    db.copy_embeddings(conn, [plan.chunk_ids[i] for i in canonical], [vec_by_pos[i] for i in canonical], model_name)
+    if plan.sigs is not None:
+        db.copy_minhash(
+            conn,
+            [plan.chunk_ids[i] for i in canonical],
+            [plan.sigs[i].tolist() for i in canonical],
+            [plan.keys[i] for i in canonical],
+        )
+    return plan.chunk_ids
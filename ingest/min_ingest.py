@@ -3,7 +3,7 @@ ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
-import re, time
+import time
 from pathlib import Path
 from typing import List, Optional
 
@@ -11,39 +11,28 @@ from dotenv import load_dotenv
 import psycopg
 
 from ingest.pii import redact_text
+from ingest.chunking import chunk_text, ChunkStats
 
 from apps import db
 from apps.embeddings import embed_texts, EMBEDDING_MODEL, EMBEDDING_DIM
+from apps.embed_scheduler import EmbedStats
 
 
 load_dotenv()
 
 
-def simple_sent_chunk(text: str, max_len: int = 500):
-    """Split into rough sentence chunks of ~max_len chars."""
-    parts = re.split(r'(?<=[\.\!\?])\s+', text.strip())
-    chunks, buf = [], ""
-    for p in parts:
-        if not p:
-            continue
-        if len(buf) + 1 + len(p) <= max_len:
-            buf = (buf + " " + p).strip()
-        else:
-            if buf: chunks.append(buf)
-            buf = p
-    if buf: chunks.append(buf)
-    return [c.strip() for c in chunks if c.strip()]
-
 def main():
     src = Path("samples/sample_policy.txt")
     if not src.exists():
         raise SystemExit(f"Missing file: {src}")
 
     text = src.read_text(encoding="utf-8")
-    chunks = simple_sent_chunk(text)
+    stats = ChunkStats()
+    chunks = chunk_text(text, stats=stats)
     redacted = [redact_text(c) for c in chunks]
 
     print(f"Read {len(chunks)} chunks; after redaction: {len(redacted)}")
+    print(f"Chunk tokens: {stats.summary()}")
 
     with db.get_conn() as conn:
         conn.execute("SET TIME ZONE 'UTC';")
@@ -52,8 +41,13 @@ def main():
         db.grant_owner(conn, doc_id, user_id)
 
         chunk_ids = db.insert_chunks(conn, doc_id, redacted)
-        vectors = embed_texts(redacted)
+        embed_stats = EmbedStats()
+        vectors = embed_texts(redacted, stats=embed_stats)
         db.insert_embeddings(conn, chunk_ids, vectors, EMBEDDING_MODEL)
+        db.bump_corpus_versions(conn, doc_id)
+        conn.commit()
+
+    print(f"Embedding: {embed_stats.summary()}")
 
     print("Ingestion complete")
 
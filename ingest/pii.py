@@ -2,20 +2,17 @@ import warnings
 from urllib3.exceptions import NotOpenSSLWarning
 warnings.filterwarnings("ignore", category=NotOpenSSLWarning)
 
-from typing import List, Dict, Tuple
-from presidio_analyzer import AnalyzerEngine, RecognizerResult
+import os
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
+from presidio_analyzer import AnalyzerEngine, EntityRecognizer, RecognizerRegistry, RecognizerResult
 from presidio_analyzer.nlp_engine import NlpEngineProvider
+from presidio_analyzer.predefined_recognizers import (
+    EmailRecognizer, PhoneRecognizer, SpacyRecognizer, UsSsnRecognizer,
+)
 from presidio_anonymizer import AnonymizerEngine
 from presidio_anonymizer.entities import OperatorConfig
 
-# Build an NLP engine using spaCy small English model
-provider = NlpEngineProvider(nlp_configuration={
-    "nlp_engine_name": "spacy",
-    "models": [{"lang_code": "en", "model_name": "en_core_web_sm"}],
-})
-nlp_engine = provider.create_engine()
-
-analyzer = AnalyzerEngine(nlp_engine=nlp_engine, supported_languages=["en"])
 anonymizer = AnonymizerEngine()
 
 # Entities we care about right now
@@ -26,11 +23,107 @@ SUPPORTED_ENTITIES = [
     "US_SSN",
 ]
 
-def redact_text(text: str, entities: List[str] = SUPPORTED_ENTITIES) -> str:
+# Redaction profiles, cheapest first:
+#   fast      regex/checksum recognizers only (email, phone, SSN); no spaCy, names are NOT redacted
+#   balanced  the four recognizers we need; spaCy runs tokenizer + NER only, for PERSON
+#   strict    every default Presidio recognizer over the full spaCy pipeline (original behaviour)
+PROFILES = ("fast", "balanced", "strict")
+PROFILE_ENTITIES = {
+    "fast": ["EMAIL_ADDRESS", "PHONE_NUMBER", "US_SSN"],
+    "balanced": SUPPORTED_ENTITIES,
+    "strict": SUPPORTED_ENTITIES,
+}
+REDACTION_PROFILE = os.getenv("REDACTION_PROFILE", "strict")
+
+SPACY_MODEL = "en_core_web_sm"
+
+Analyze = Callable[[str, List[str]], List[RecognizerResult]]
+
+
+def _spacy_engine(ner_only: bool):
+    provider = NlpEngineProvider(nlp_configuration={
+        "nlp_engine_name": "spacy",
+        "models": [{"lang_code": "en", "model_name": SPACY_MODEL}],
+    })
+    nlp_engine = provider.create_engine()
+    if ner_only:
+        # tagger/parser/lemmatizer only feed context enhancement, which PERSON doesn't need
+        nlp = nlp_engine.nlp["en"]
+        nlp.select_pipes(enable=[p for p in ("tok2vec", "ner") if p in nlp.pipe_names])
+    return nlp_engine
+
+
+def _pattern_recognizers():
+    return [EmailRecognizer(), PhoneRecognizer(), UsSsnRecognizer()]
+
+
+def _build_fast() -> Analyze:
+    recognizers = _pattern_recognizers()
+
+    def analyze(text: str, entities: List[str]) -> List[RecognizerResult]:
+        results: List[RecognizerResult] = []
+        for rec in recognizers:
+            wanted = [e for e in rec.supported_entities if e in entities]
+            if wanted:
+                results.extend(rec.analyze(text=text, entities=wanted, nlp_artifacts=None) or [])
+        return EntityRecognizer.remove_duplicates(results)
+
+    return analyze
+
+
+def _build_balanced() -> Analyze:
+    registry = RecognizerRegistry(
+        recognizers=_pattern_recognizers() + [SpacyRecognizer(supported_entities=["PERSON"])]
+    )
+    engine = AnalyzerEngine(nlp_engine=_spacy_engine(ner_only=True), registry=registry,
+                            supported_languages=["en"])
+    return lambda text, entities: engine.analyze(text=text, entities=entities, language="en")
+
+
+def _build_strict() -> Analyze:
+    engine = AnalyzerEngine(nlp_engine=_spacy_engine(ner_only=False), supported_languages=["en"])
+    return lambda text, entities: engine.analyze(text=text, entities=entities, language="en")
+
+
+_BUILDERS = {"fast": _build_fast, "balanced": _build_balanced, "strict": _build_strict}
+_analyzers: Dict[str, Analyze] = {}
+_build_lock = threading.Lock()
+
+
+def get_analyzer(profile: Optional[str] = None) -> Analyze:
+    """Analyzer for a profile (default REDACTION_PROFILE), built on first use."""
+    profile = profile or REDACTION_PROFILE
+    if profile not in _BUILDERS:
+        raise ValueError(f"Unknown redaction profile {profile!r}; expected one of {', '.join(PROFILES)}")
+    fn = _analyzers.get(profile)
+    if fn is None:
+        with _build_lock:
+            fn = _analyzers.get(profile)
+            if fn is None:
+                fn = _analyzers[profile] = _BUILDERS[profile]()
+    return fn
+
+
+def _analyze(text: str, entities: List[str], profile: Optional[str]) -> List[RecognizerResult]:
+    profile = profile or REDACTION_PROFILE
+    entities = [e for e in entities if e in PROFILE_ENTITIES.get(profile, entities)]
+    return get_analyzer(profile)(text, entities)
+
+
+def analyze_spans(text: str, entities: List[str] = SUPPORTED_ENTITIES,
+                  profile: Optional[str] = None) -> List[Tuple[str, int, int]]:
+    """
+    Detected (entity_type, start, end) character spans, as redaction would
+    replace them; used for span-level evaluation.
+    """
+    return [(r.entity_type, r.start, r.end) for r in _analyze(text, entities, profile)]
+
+
+def redact_text(text: str, entities: List[str] = SUPPORTED_ENTITIES, profile: Optional[str] = None) -> str:
     """
     Detect PII entities and replace each with a typed tag like <EMAIL_ADDRESS>.
     """
-    results = analyzer.analyze(text=text, entities=entities, language="en")
+    results = _analyze(text, entities, profile)
     if not results:
         return text
 
@@ -40,12 +133,13 @@ def redact_text(text: str, entities: List[str] = SUPPORTED_ENTITIES) -> str:
     }
     return anonymizer.anonymize(text=text, analyzer_results=results, operators=ops).text
 
-def redact_and_report(text: str, entities: List[str] = SUPPORTED_ENTITIES) -> Tuple[str, Dict[str, int]]:
+def redact_and_report(text: str, entities: List[str] = SUPPORTED_ENTITIES,
+                      profile: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
     """
     Return (redacted_text, counts_by_entity).
     counts_by_entity includes only the SUPPORTED_ENTITIES with non-zero counts.
     """
-    results: List[RecognizerResult] = analyzer.analyze(text=text, entities=entities, language="en")
+    results: List[RecognizerResult] = _analyze(text, entities, profile)
     if not results:
         return text, {}
 
@@ -60,3 +154,11 @@ def redact_and_report(text: str, entities: List[str] = SUPPORTED_ENTITIES) -> Tu
         counts[r.entity_type] = counts.get(r.entity_type, 0) + 1
 
     return redacted, counts
+
+def redact_batch(texts: List[str], entities: List[str] = SUPPORTED_ENTITIES,
+                 profile: Optional[str] = None) -> List[Tuple[str, Dict[str, int]]]:
+    """
+    redact_and_report over a list of texts; used as the unit of work in
+    process pools so each round trip carries a whole batch.
+    """
+    return [redact_and_report(t, entities, profile) for t in texts]
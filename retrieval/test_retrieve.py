@@ -22,6 +22,7 @@ def search(query: str, k: int = 5) -> List[Tuple[str, float, str]]:
     JOIN chunk_embedding ce ON true
     JOIN chunk c ON c.chunk_id = ce.chunk_id
     JOIN document d ON d.doc_id = c.doc_id
+    WHERE ce.model_name = %s
     ORDER BY ce.embedding <-> q.v
     LIMIT %s;
     """
@@ -31,7 +32,7 @@ def search(query: str, k: int = 5) -> List[Tuple[str, float, str]]:
     with db.get_conn() as conn:
         with conn.cursor() as cur:
             # flatten qvec into params
-            params = (*qvec, k)
+            params = (*qvec, EMBEDDING_MODEL, k)
             # build placeholder list for vector dims
             ph = ",".join(["%s"] * len(qvec))
             cur.execute(sql.replace("%s", ph, 1), params)  # replace first %s with dim placeholders
@@ -1,11 +1,26 @@
+import argparse
+import os
 import re
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html.parser import HTMLParser
 from pathlib import Path
+from typing import Iterator, Optional, TextIO
+
 from bs4 import BeautifulSoup
 
+try:  # fast C parser; the stdlib HTMLParser is the fallback
+    from lxml import etree
+except ImportError:
+    etree = None
+
 RAW_DIR = Path("data/sec")
 OUT_DIR = RAW_DIR / "clean"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+READ_BLOCK = 1 << 20  # chars per read in the streaming cleaner
+
+# ---------- legacy (whole-file) cleaner, kept for --bench ----------
 def pick_10k_document(txt: str) -> str:
     docs = re.split(r"(?i)(?=<DOCUMENT>)", txt)
     best = None
@@ -47,17 +62,337 @@ def clean_sec_file(raw: str) -> str:
     text = html_to_text(body)
     return normalize_whitespace(text)
 
+# ---------- streaming cleaner ----------
+_DOC_START = re.compile(r"<DOCUMENT>", re.I)
+_DOC_END = re.compile(r"</DOCUMENT>", re.I)
+_TEXT_START = re.compile(r"<TEXT>", re.I)
+_TEXT_END = re.compile(r"</TEXT>", re.I)
+_TYPE = re.compile(r"(?im)^<TYPE>\s*([^\r\n<]+)")
+_PAGE_LINE = re.compile(r"(?im)^<PAGE>[^\n]*$")
+_HTML_SNIFF = re.compile(r"<(html|div|p|table)\b", re.I)
+_SNIFF_CHARS = 1 << 16  # body read before deciding HTML vs plain text
+_HSPACE = re.compile(r"[ \t]+")
+_MANY_NL = re.compile(r"\n{3,}")
+_TRAILING_WS = re.compile(r"[ \t\r\n]+$")
+
+_MAX_MARKER = len("</DOCUMENT>")
+
+def iter_document_text(fp: TextIO, want_type: Optional[str] = "10-K",
+                       block_size: int = READ_BLOCK) -> Iterator[str]:
+    """
+    Stream the <TEXT> body of the first <DOCUMENT> whose <TYPE> is want_type
+    (or of the first document when want_type is None), without reading the
+    whole submission into memory. <SEC-HEADER> lives outside any document and
+    is skipped naturally.
+    """
+    buf = ""
+    state = "seek"  # seek -> header -> (body | skip) -> seek
+    while True:
+        block = fp.read(block_size)
+        eof = not block
+        buf += block
+        while True:
+            if state == "seek":
+                m = _DOC_START.search(buf)
+                if not m:
+                    buf = buf[-_MAX_MARKER:]
+                    break
+                buf, state = buf[m.end():], "header"
+            elif state == "header":
+                m = _TEXT_START.search(buf)
+                if not m:
+                    break  # document headers are a few lines; wait for more
+                t = _TYPE.search(buf, 0, m.start())
+                doc_type = t.group(1).strip().upper() if t else ""
+                keep = want_type is None or doc_type == want_type
+                buf, state = buf[m.end():], ("body" if keep else "skip")
+            elif state == "skip":
+                m = _DOC_END.search(buf)
+                if not m:
+                    buf = buf[-_MAX_MARKER:]
+                    break
+                buf, state = buf[m.end():], "seek"
+            else:  # body
+                m = _TEXT_END.search(buf)
+                if m:
+                    if m.start():
+                        yield buf[:m.start()]
+                    return
+                # hold back enough to catch a marker split across reads, and
+                # emit whole lines when possible so ^<PAGE> stripping stays exact
+                cut = max(0, len(buf) - _MAX_MARKER)
+                nl = buf.rfind("\n", 0, cut)
+                if nl >= 0:
+                    cut = nl + 1
+                if cut:
+                    yield buf[:cut]
+                    buf = buf[cut:]
+                break
+        if eof:
+            if state == "body" and buf:
+                yield buf
+            return
+
+
+class _TextSink:
+    """
+    Incremental equivalent of normalize_whitespace(). Pieces are buffered and
+    normalized in ~64K batches; the trailing whitespace run of each batch is
+    held back and normalized together with the next one.
+    """
+
+    FLUSH_AT = 1 << 16
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.pending = []
+        self.pending_len = 0
+        self.carry = ""
+        self.started = False
+        self.chars = 0
+
+    def write(self, piece: str) -> None:
+        self.pending.append(piece)
+        self.pending_len += len(piece)
+        if self.pending_len >= self.FLUSH_AT:
+            self._flush()
+
+    def _flush(self) -> None:
+        txt = self.carry + "".join(self.pending).replace("\r", "\n")
+        self.pending, self.pending_len = [], 0
+        txt = _MANY_NL.sub("\n\n", _HSPACE.sub(" ", txt))
+        m = _TRAILING_WS.search(txt)
+        self.carry = txt[m.start():] if m else ""
+        txt = txt[:m.start()] if m else txt
+        if not self.started:
+            txt = txt.lstrip()
+            if not txt:
+                return
+            self.started = True
+        self.out.write(txt)
+        self.chars += len(txt)
+
+    def close(self) -> None:
+        self._flush()
+        self.carry = ""  # trailing whitespace is stripped
+
+
+_BLOCK_TAGS = {
+    "p", "div", "br", "tr", "td", "th", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "title", "section", "article", "ul", "ol", "hr", "pre", "center",
+}
+_SKIP_TAGS = {"script", "style", "head"}
+
+
+def _local(tag) -> str:
+    tag = tag if isinstance(tag, str) else ""
+    return tag.rsplit("}", 1)[-1].rsplit(":", 1)[-1].lower()
+
+
+class _HtmlTextTarget:
+    """lxml parser target: text nodes -> sink, newlines around block elements."""
+
+    def __init__(self, sink: _TextSink):
+        self.sink = sink
+        self.skip = 0
+
+    def start(self, tag, attrib):
+        name = _local(tag)
+        if name in _SKIP_TAGS:
+            self.skip += 1
+        elif name in _BLOCK_TAGS:
+            self.sink.write("\n")
+
+    def end(self, tag):
+        name = _local(tag)
+        if name in _SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+        elif name in _BLOCK_TAGS:
+            self.sink.write("\n")
+
+    def data(self, data):
+        if not self.skip:
+            self.sink.write(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return None
+
+
+class _StdlibHtmlText(HTMLParser):
+    """Same as _HtmlTextTarget on the stdlib parser (used when lxml is missing)."""
+
+    def __init__(self, sink: _TextSink):
+        super().__init__(convert_charrefs=True)
+        self.target = _HtmlTextTarget(sink)
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+def _html_feeder(sink: _TextSink):
+    if etree is not None:
+        parser = etree.HTMLParser(target=_HtmlTextTarget(sink), recover=True, encoding="utf-8")
+        return (lambda s: parser.feed(s.encode("utf-8"))), parser.close
+    parser = _StdlibHtmlText(sink)
+    return parser.feed, parser.close
+
+
+def _read_head(pieces: Iterator[str]) -> str:
+    """At least _SNIFF_CHARS of the body (or all of it), however the reads fell."""
+    head, n = [], 0
+    for piece in pieces:
+        head.append(piece)
+        n += len(piece)
+        if n >= _SNIFF_CHARS:
+            break
+    return "".join(head)
+
+
+def clean_stream(fp: TextIO, out: TextIO, block_size: int = READ_BLOCK) -> int:
+    """Stream-clean one submission from fp into out; returns chars written."""
+    sink = _TextSink(out)
+    pieces = iter_document_text(fp, "10-K", block_size)
+    head = _read_head(pieces)
+    if not head:
+        # no 10-K document: fall back to the first document, like pick_10k_document()
+        fp.seek(0)
+        pieces = iter_document_text(fp, None, block_size)
+        head = _read_head(pieces)
+    if not head:
+        return 0
+
+    if _HTML_SNIFF.search(head):
+        feed, close = _html_feeder(sink)
+    else:
+        feed, close = sink.write, (lambda: None)
+    feed(_PAGE_LINE.sub(" ", head))
+    for piece in pieces:
+        feed(_PAGE_LINE.sub(" ", piece))
+    close()
+    sink.close()
+    return sink.chars
+
+
+def clean_file(in_path: Path, out_path: Path) -> dict:
+    """Worker entry point: stream in_path -> out_path (atomically renamed)."""
+    t0 = time.perf_counter()
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    with open(in_path, "r", encoding="utf-8", errors="ignore") as fp, \
+            open(tmp, "w", encoding="utf-8") as out:
+        chars = clean_stream(fp, out)
+    os.replace(tmp, out_path)
+    return {
+        "file": in_path.name,
+        "mb_in": in_path.stat().st_size / 1e6,
+        "chars_out": chars,
+        "seconds": time.perf_counter() - t0,
+    }
+
+# ---------- benchmark ----------
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _bench_one(mode: str, in_path: str) -> dict:
+    """Runs in a fresh process so peak RSS belongs to a single cleaner run."""
+    p = Path(in_path)
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        chars = len(clean_sec_file(p.read_text(encoding="utf-8", errors="ignore")))
+    else:
+        with open(p, "r", encoding="utf-8", errors="ignore") as fp, open(os.devnull, "w") as out:
+            chars = clean_stream(fp, out)
+    return {"seconds": time.perf_counter() - t0, "peak_rss_mb": _peak_rss_mb(), "chars": chars}
+
+def bench(paths) -> None:
+    from multiprocessing import get_context
+    ctx = get_context("spawn")
+    print(f"{'file':32s} {'MB':>7s} | {'legacy MB/s':>11s} {'RSS MB':>7s} | {'stream MB/s':>11s} {'RSS MB':>7s} | chars ratio")
+    totals = {"legacy": [0.0, 0.0], "stream": [0.0, 0.0]}
+    for p in paths:
+        mb = p.stat().st_size / 1e6
+        row = {}
+        for mode in ("legacy", "stream"):
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as ex:
+                row[mode] = ex.submit(_bench_one, mode, str(p)).result()
+            totals[mode][0] += row[mode]["seconds"]
+            totals[mode][1] = max(totals[mode][1], row[mode]["peak_rss_mb"])
+        ratio = row["stream"]["chars"] / row["legacy"]["chars"] if row["legacy"]["chars"] else 0.0
+        print(f"{p.name:32s} {mb:7.1f} | {mb / row['legacy']['seconds']:11.1f} {row['legacy']['peak_rss_mb']:7.0f} | "
+              f"{mb / row['stream']['seconds']:11.1f} {row['stream']['peak_rss_mb']:7.0f} | {ratio:.3f}")
+    total_mb = sum(p.stat().st_size for p in paths) / 1e6
+    for mode, (secs, rss) in totals.items():
+        print(f"{mode:>6s}: {total_mb / secs if secs else 0.0:.1f} MB/s overall, peak RSS {rss:.0f} MB")
+
+# ---------- regression checks ----------
+_CHECK_SUBMISSION = (
+    "<SEC-DOCUMENT>\n<SEC-HEADER>ACCESSION NUMBER: 0000000000-00-000000\n</SEC-HEADER>\n"
+    "<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>1\n"
+    "<TEXT><html><head><style>p {{ margin: 0 }}</style></head><body>"
+    "<p>Item&nbsp;1. Business</p>{filler}<div>Revenue &amp; costs</div><table><tr><td>2023</td></tr></table>"
+    "</body></html></TEXT>\n</DOCUMENT>\n</SEC-DOCUMENT>\n"
+)
+
+
+def check() -> None:
+    """
+    The HTML/plain-text decision must not depend on where reads split the
+    body: clean the same submission with <TEXT><html> landing on every offset
+    of a read boundary and expect identical, tag-free output.
+    """
+    from io import StringIO
+    raw = _CHECK_SUBMISSION.format(filler="<p>filler text</p>" * 50)
+    html_at = raw.index("<TEXT>") + len("<TEXT>")
+    expected = None
+    sizes = sorted(set(range(1, 64)) | {html_at + d for d in range(-12, 13) if html_at + d > 0} | {READ_BLOCK})
+    for size in sizes:
+        out = StringIO()
+        clean_stream(StringIO(raw), out, block_size=size)
+        text = out.getvalue()
+        assert "<" not in text and "Revenue & costs" in text, f"block_size={size}: {text[:80]!r}"
+        assert expected is None or text == expected, f"block_size={size}: output differs"
+        expected = text
+    print(f"clean_stream: {len(sizes)} read-boundary placements OK")
+
+
 def main():
+    ap = argparse.ArgumentParser(description="Extract plain text of 10-K filings in data/sec")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel files")
+    ap.add_argument("--bench", action="store_true", help="compare legacy vs streaming cleaner (no output written)")
+    ap.add_argument("--check", action="store_true", help="run the streaming cleaner's regression checks")
+    args = ap.parse_args()
+    if args.check:
+        check()
+        return
+
     in_paths = sorted(RAW_DIR.glob("*.txt"))
     if not in_paths:
         print("No .txt files in data/sec — run scripts/download_sec.py first.")
         return
-    for p in in_paths:
-        outp = OUT_DIR / p.name
-        raw = p.read_text(encoding="utf-8", errors="ignore")
-        cleaned = clean_sec_file(raw)
-        outp.write_text(cleaned, encoding="utf-8")
-        print(f"Cleaned -> {outp}")
+    if args.bench:
+        bench(in_paths)
+        return
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    mb = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(in_paths)))) as ex:
+        futs = [ex.submit(clean_file, p, OUT_DIR / p.name) for p in in_paths]
+        for fut in as_completed(futs):
+            r = fut.result()
+            mb += r["mb_in"]
+            print(f"Cleaned -> {OUT_DIR / r['file']} ({r['mb_in']:.1f} MB in {r['seconds']:.1f}s)")
+    elapsed = time.perf_counter() - t0
+    print(f"{len(in_paths)} files, {mb:.1f} MB in {elapsed:.1f}s ({mb / elapsed if elapsed else 0.0:.1f} MB/s)")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,15 @@
-import sys
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
 import json
+import time
 import requests
 import psycopg
-import os
+
+from apps.bench import percentile
 
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
 USER_EMAIL = os.getenv("USER_EMAIL")
@@ -20,65 +27,108 @@ def get_dsn():
         )
     return dsn
 
-def eval_recall(gold_path):
+def _load_gold(conn, gold):
+    """(query, top_k, gold chunk ids) per item; gold_doc_ids expand to all their chunks."""
+    items = []
+    for item in gold:
+        gold_chunks = {str(gc).lower() for gc in item.get("gold_chunks", [])}
+        gold_doc_ids = {str(d).lower() for d in item.get("gold_doc_ids", [])}
+
+        if gold_doc_ids and not gold_chunks:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.chunk_id
+                    FROM chunk c
+                    WHERE c.doc_id = ANY(%s)
+                """, (list(gold_doc_ids),))
+                gold_chunks = {str(row[0]).lower() for row in cur.fetchall()}
+        items.append((item["query"], item.get("top_k", 5), gold_chunks))
+    return items
+
+def run_queries(items, rerank=None):
+    """Search every gold query; returns [(query, top_k, gold, hits, trace_id, latency_ms)]."""
+    out = []
+    for query, top_k, gold_chunks in items:
+        body = {"query": query, "top_k": top_k}
+        if rerank is not None:
+            body["rerank"] = rerank
+        t0 = time.perf_counter()
+        r = requests.post(
+            f"{API_URL}/search",
+            headers={"Authorization": f"Bearer {USER_EMAIL}", "Content-Type": "application/json"},
+            json=body,
+            timeout=60,
+        )
+        latency_ms = (time.perf_counter() - t0) * 1000.0
+        r.raise_for_status()
+        data = r.json()
+        hits = [str(h["chunk_id"]).lower() for h in data.get("hits", [])]
+        out.append((query, top_k, gold_chunks, hits, data.get("trace_id"), latency_ms))
+    return out
+
+def summarize(results):
+    """recall@k (any gold chunk retrieved), precision@k, latency p50/p95 in ms"""
+    recall = [1.0 if (gold & set(hits)) else 0.0 for _, _, gold, hits, _, _ in results]
+    precision = [len(gold & set(hits)) / max(1, k) for _, k, gold, hits, _, _ in results]
+    lat = [r[5] for r in results]
+    n = max(1, len(results))
+    return sum(recall) / n, sum(precision) / n, percentile(lat, 0.5), percentile(lat, 0.95)
+
+def eval_recall(gold_path, rerank=None):
     DSN = get_dsn()
 
     with open(gold_path, "r") as f:
         gold = json.load(f)
 
-    results = []
-
     with psycopg.connect(DSN) as conn:
-        for item in gold:
-            query = item["query"]
-            top_k = item.get("top_k", 5)
-
-            # Normalize golds
-            gold_chunks = {str(gc).lower() for gc in item.get("gold_chunks", [])}
-            gold_doc_ids = {str(d).lower() for d in item.get("gold_doc_ids", [])}
-
-            if gold_doc_ids and not gold_chunks:
-                with conn.cursor() as cur:
-                    cur.execute("""
-                        SELECT c.chunk_id
-                        FROM chunk c
-                        WHERE c.doc_id = ANY(%s)
-                    """, (list(gold_doc_ids),))
-                    gold_chunks = {str(row[0]).lower() for row in cur.fetchall()}
-
-            # Run search
-            r = requests.post(
-                f"{API_URL}/search",
-                headers={"Authorization": f"Bearer {USER_EMAIL}", "Content-Type": "application/json"},
-                json={"query": query, "top_k": top_k},
-                timeout=60,
-            )
-            r.raise_for_status()
-            data = r.json()
-            trace_id = data.get("trace_id")
-            hits = [str(h["chunk_id"]).lower() for h in data.get("hits", [])]
-
-            # Compute recall@k
-            hit_set = set(hits)
-            recall = 1.0 if (gold_chunks & hit_set) else 0.0
-
-            results.append((query, recall))
-
-            # Persist in retrieval_eval
-            with conn.cursor() as cur:
+        items = _load_gold(conn, gold)
+        results = run_queries(items, rerank)
+
+        # Persist in retrieval_eval
+        with conn.cursor() as cur:
+            for query, top_k, gold_chunks, hits, trace_id, _ in results:
+                recall = 1.0 if (gold_chunks & set(hits)) else 0.0
                 cur.execute("""
                     INSERT INTO retrieval_eval (trace_id, query_text, gold_chunks, top_k, hits, recall_at_k)
                     VALUES (%s, %s, %s, %s, %s, %s);
                 """, (trace_id, query, list(gold_chunks), top_k, hits, recall))
         conn.commit()
 
-    avg = sum(r for _, r in results) / max(1, len(results))
-    print(f"Recall@K: {avg:.2f}")
-    for q, r in results:
-        print(f"{q:40s} {r}")
+    recall, precision, p50, p95 = summarize(results)
+    print(f"Recall@K: {recall:.2f}  Precision@K: {precision:.3f}  latency p50 {p50:.0f} ms, p95 {p95:.0f} ms")
+    for query, _, gold_chunks, hits, _, _ in results:
+        print(f"{query:40s} {1.0 if (gold_chunks & set(hits)) else 0.0}")
+
+def compare_rerank(gold_path):
+    """
+    Run the gold set without and with reranking (same API, rerank on/off per
+    request) and print quality and latency side by side. Nothing is persisted.
+    For latency numbers run the API with SEARCH_CACHE_ENABLED=0, otherwise
+    repeated runs are served from the result cache.
+    """
+    with open(gold_path, "r") as f:
+        gold = json.load(f)
+    with psycopg.connect(get_dsn()) as conn:
+        items = _load_gold(conn, gold)
+
+    rows = {}
+    for name, flag in (("ann", False), ("rerank", True)):
+        rows[name] = summarize(run_queries(items, flag))
+    print(f"{'variant':8s} {'recall@k':>9s} {'prec@k':>8s} {'p50 ms':>8s} {'p95 ms':>8s}")
+    for name, (recall, precision, p50, p95) in rows.items():
+        print(f"{name:8s} {recall:9.3f} {precision:8.3f} {p50:8.0f} {p95:8.0f}")
+    (r0, pr0, l0, t0), (r1, pr1, l1, t1) = rows["ann"], rows["rerank"]
+    print(f"rerank delta: recall {r1 - r0:+.3f}, precision {pr1 - pr0:+.3f}, "
+          f"p50 {l1 - l0:+.0f} ms, p95 {t1 - t0:+.0f} ms")
+    print("(the rerank row matches ann if the API runs with RERANK_ENABLED=0)")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/eval_recall.py samples/gold.json")
-        sys.exit(1)
-    eval_recall(sys.argv[1])
+    ap = argparse.ArgumentParser(description="Recall@K / precision@K of /search against a gold file")
+    ap.add_argument("gold", help="e.g. samples/gold.json")
+    ap.add_argument("--rerank", choices=("default", "on", "off", "compare"), default="default",
+                    help="force reranking per request, or compare both without persisting")
+    args = ap.parse_args()
+    if args.rerank == "compare":
+        compare_rerank(args.gold)
+    else:
+        eval_recall(args.gold, {"default": None, "on": True, "off": False}[args.rerank])
@@ -0,0 +1,181 @@
+"""
+Maintenance of the ivfflat index on chunk_embedding (run hourly from cron, or
+keep it running with --every).
+
+  python scripts/index_maintenance.py                 # check, rebuild if needed, prewarm after restart
+  python scripts/index_maintenance.py --every 3600    # same, in a loop
+  python scripts/index_maintenance.py run --force     # rebuild now
+  python scripts/index_maintenance.py status          # lists, rows, drift and recent runs
+  python scripts/index_maintenance.py prewarm         # load the index into shared buffers
+
+A rebuild is due when the index's lists are off from ivfflat_lists(rows) by
+INDEX_LISTS_TOLERANCE, rows grew INDEX_GROWTH_FACTOR since the last rebuild,
+or self-recall@k on vectors added since then fell below INDEX_MIN_RECALL (see
+apps/vector_index.py). Recall@k and latency on held-out queries (BEIR
+queries.jsonl / gold files, or stored vectors with --self-sample) are logged
+before and after each rebuild in vector_index_maintenance.
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
+import time
+import traceback
+import uuid
+
+from apps import db
+from apps.bench import DEFAULT_QUERIES, load_queries
+from apps.db import vector_literal
+from apps import vector_index as vi
+
+INDEX_MAINTENANCE_INTERVAL_S = int(os.getenv("INDEX_MAINTENANCE_INTERVAL_S", "3600"))
+
+
+def held_out(conn, args, model: str):
+    """Query vectors and their exact top-k."""
+    vectors = None
+    if args.queries and not args.self_sample:
+        # loads the embedding model; only needed when a rebuild is actually due
+        from apps.embeddings import embed_texts, EMBEDDING_MODEL
+        if EMBEDDING_MODEL == model:
+            vectors = [vector_literal(v) for v in embed_texts(load_queries(args.queries, args.sample))]
+        else:
+            print(f"  index holds {model} vectors but {EMBEDDING_MODEL} is configured; "
+                  "using stored vectors as queries", flush=True)
+    if vectors is None:
+        vectors = vi.sample_vectors(conn, model, args.sample)
+    return vectors, vi.exact_neighbours(conn, model, vectors, args.k)
+
+
+def _fmt(m) -> str:
+    return f"recall@k={m['recall']:.3f} p50={m['p50_ms']:.1f}ms p95={m['p95_ms']:.1f}ms"
+
+
+def run_once(conn, args) -> None:
+    run_id = uuid.uuid4()
+    name = vi.find_index(conn)[0]
+    for leftover in ([] if args.dry_run else vi.drop_invalid(conn, name)):
+        print(f"  dropped {leftover} left by a failed rebuild", flush=True)
+    model = vi.live_model(conn)
+    stats = vi.index_stats(conn, model)
+    drift = vi.drift_recall(conn, stats, model, args.sample, args.k)
+    reason = "forced" if args.force else vi.needs_rebuild(stats, drift)
+    started = vi.postmaster_start(conn)
+    drift_s = f"{drift:.3f}" if drift is not None else "n/a"
+    print(f"{stats.name}: rows={stats.rows} lists={stats.lists} (target {stats.target_lists}) "
+          f"probes={stats.probes} drift recall={drift_s}", flush=True)
+
+    rebuilt = False
+    if reason is None or args.dry_run:
+        print(f"  rebuild due ({reason}); dry run" if reason else "  rebuild not needed")
+        vi.log_run(conn, run_id=run_id, index_name=stats.name, action="check", reason=reason,
+                   n_rows=stats.rows, lists_before=stats.lists, probes_before=stats.probes,
+                   drift_recall=drift, postmaster_start=started)
+    else:
+        lists = stats.target_lists
+        probes = vi.probes_for(lists) if vi.INDEX_SET_PROBES else stats.probes
+        vectors, truth = held_out(conn, args, model)
+        before = vi.recall_at_k(conn, model, vectors, truth, args.k)
+        print(f"  rebuilding ({reason}): lists {stats.lists} -> {lists}, probes {stats.probes} -> {probes}", flush=True)
+        print(f"  before: {_fmt(before)}", flush=True)
+        t0 = time.perf_counter()
+        vi.rebuild(conn, stats.name, lists, stats.lists)
+        if vi.INDEX_SET_PROBES:
+            vi.set_database_probes(conn, probes)
+        seconds = time.perf_counter() - t0
+        after = vi.recall_at_k(conn, model, vectors, truth, args.k, probes)
+        print(f"  after:  {_fmt(after)} ({seconds:.1f}s)")
+        vi.log_run(conn, run_id=run_id, index_name=stats.name, action="rebuild", reason=reason,
+                   n_rows=stats.rows, lists_before=stats.lists, lists_after=lists,
+                   probes_before=stats.probes, probes_after=probes, drift_recall=drift,
+                   recall_before=before["recall"], recall_after=after["recall"],
+                   p50_ms_before=before["p50_ms"], p50_ms_after=after["p50_ms"],
+                   p95_ms_before=before["p95_ms"], p95_ms_after=after["p95_ms"],
+                   seconds=seconds, postmaster_start=started)
+        rebuilt = True
+
+    if vi.INDEX_PREWARM and not args.dry_run and (rebuilt or vi.needs_prewarm(conn, stats.name)):
+        do_prewarm(conn, stats.name, run_id)
+
+
+def do_prewarm(conn, name: str, run_id=None) -> None:
+    t0 = time.perf_counter()
+    blocks = vi.prewarm(conn, name)
+    seconds = time.perf_counter() - t0
+    print(f"  prewarmed {name}: {blocks} blocks in {seconds:.1f}s")
+    vi.log_run(conn, run_id=run_id or uuid.uuid4(), index_name=name, action="prewarm",
+               reason=f"{blocks} blocks", seconds=seconds, postmaster_start=vi.postmaster_start(conn))
+
+
+def status(conn, args) -> None:
+    model = vi.live_model(conn)
+    stats = vi.index_stats(conn, model)
+    drift = vi.drift_recall(conn, stats, model, args.sample, args.k)
+    print(f"{stats.name}: model={model} rows={stats.rows} lists={stats.lists} "
+          f"(target {stats.target_lists}) probes={stats.probes}")
+    print(f"  rows at last rebuild: {stats.rows_at_build or 'never rebuilt'}  drift recall: "
+          f"{f'{drift:.3f}' if drift is not None else 'n/a'}")
+    print(f"  rebuild: {vi.needs_rebuild(stats, drift) or 'not needed'}")
+    print(f"  prewarm: {'due' if vi.needs_prewarm(conn, stats.name) else 'done since restart'}")
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT created_at, action, COALESCE(reason, ''), lists_before, lists_after,
+                   recall_before, recall_after, seconds
+            FROM vector_index_maintenance WHERE action <> 'check'
+            ORDER BY created_at DESC LIMIT 10;
+        """)
+        for ts, action, reason, lb, la, rb, ra, secs in cur.fetchall():
+            detail = ""
+            if action == "rebuild":
+                detail = f"lists {lb}->{la}"
+                if rb is not None and ra is not None:
+                    detail += f" recall {rb:.3f}->{ra:.3f}"
+            print(f"  {ts:%Y-%m-%d %H:%M} {action:8s} {detail:34s} {secs or 0:7.1f}s  {reason}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", nargs="?", default="run", choices=("run", "status", "prewarm"))
+    ap.add_argument("--force", action="store_true", help="rebuild even if no threshold is crossed")
+    ap.add_argument("--dry-run", action="store_true", help="check and log only")
+    ap.add_argument("--every", type=int, nargs="?", const=INDEX_MAINTENANCE_INTERVAL_S, default=0,
+                    help=f"repeat every N seconds (default {INDEX_MAINTENANCE_INTERVAL_S})")
+    ap.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES, help="held-out BEIR queries.jsonl / gold .json")
+    ap.add_argument("--self-sample", action="store_true", help="use stored vectors as held-out queries")
+    ap.add_argument("--sample", type=int, default=vi.INDEX_SAMPLE, help="queries / vectors per measurement")
+    ap.add_argument("--k", type=int, default=vi.INDEX_EVAL_K)
+    args = ap.parse_args()
+
+    repeat = bool(args.every) and args.command == "run"
+    while True:
+        try:
+            # REINDEX CONCURRENTLY cannot run inside a transaction block
+            with db.get_conn() as conn:
+                conn.autocommit = True
+                if not vi.try_lock(conn):
+                    print("Another index maintenance run holds the lock; skipping.")
+                else:
+                    try:
+                        if args.command == "run":
+                            run_once(conn, args)
+                        elif args.command == "status":
+                            status(conn, args)
+                        else:
+                            do_prewarm(conn, vi.find_index(conn)[0])
+                    finally:
+                        vi.unlock(conn)
+        except Exception:
+            if not repeat:
+                raise
+            # a failed run (database restart, lock timeout, failed REINDEX) must not end the loop
+            print(f"Index maintenance run failed; retrying in {args.every}s", flush=True)
+            traceback.print_exc()
+        if not repeat:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
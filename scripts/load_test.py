@@ -0,0 +1,300 @@
+"""
+Open-loop HTTP load generator for a running API (uvicorn api.main:app).
+
+  python scripts/load_test.py --rates 5,10,20,40 --duration 60 --label v1.4 --out runs/load-v1.4.json
+
+Traffic is a weighted mix of /search, /ingest and /ingest_file (--mix) from
+--users synthetic users. Queries come from BEIR queries.jsonl files and gold
+files (--queries). Before the run every user ingests --seed-docs documents,
+and each seeded document is shared with k other users, k drawn from --fanout,
+so ACL filtering sees a spread of visible corpus sizes (the grants are written
+straight to Postgres and need POSTGRES_DSN; without it fan-out is skipped).
+
+Each target rate is one step of --duration seconds. Requests are sent at
+Poisson arrival times whether or not earlier ones have finished, and latency
+is measured from the scheduled send time, so a slow server shows up as
+latency instead of as a lower request rate. Requests that would exceed
+--max-inflight are dropped and counted as errors. A step is saturated when
+successful throughput falls below --min-throughput of the target, the error
+rate exceeds --max-error-rate, or p99 exceeds --slo-p99-ms. Later steps are
+skipped after the first saturated step unless --keep-going is given.
+
+The report (stdout, or --out) is JSON with per-step, per-endpoint throughput,
+p50/p95/p99 latency and error counts, plus the highest sustained rate.
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import httpx
+
+from apps.bench import DEFAULT_QUERIES, load_queries, percentile
+
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+ENDPOINTS = ("search", "ingest", "ingest_file")
+
+_NAMES = ["Alice Johnson", "Bob Smith", "Carla Gomez", "David Lee", "Erin Walsh", "Farah Khan"]
+
+
+def _csv(kind):
+    return lambda s: [kind(x) for x in s.split(",") if x.strip()]
+
+
+def parse_mix(s: str) -> Dict[str, float]:
+    mix = {}
+    for part in s.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; expected {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix weights must sum to > 0")
+    return mix
+
+
+def make_document(rng: random.Random, queries: List[str], sentences: int = 40) -> str:
+    """Filler text from real queries, with PII sprinkled in so redaction does real work."""
+    lines = []
+    for i in range(sentences):
+        lines.append(rng.choice(queries).capitalize() + ".")
+        if i % 8 == 0:
+            lines.append(f"Contact {rng.choice(_NAMES)} at user{rng.randrange(10**6)}@example.com "
+                         f"or 555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}.")
+    return " ".join(lines)
+
+
+class LoadTest:
+    def __init__(self, args, queries: List[str]):
+        self.args = args
+        self.queries = queries
+        self.rng = random.Random(args.seed)
+        self.users = [f"loadtest-{i:04d}@example.test" for i in range(args.users)]
+        kinds, weights = zip(*args.mix.items())
+        self.kinds, self.weights = list(kinds), list(weights)
+        self.inflight = 0
+
+    @staticmethod
+    def _auth(email: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {email}"}
+
+    def _ingest_body(self, email: str, key: str) -> dict:
+        body = {"title": f"loadtest {key}", "text": make_document(self.rng, self.queries),
+                "source_key": f"loadtest/{email}/{key}"}
+        if self.args.redaction_profile:
+            body["redaction_profile"] = self.args.redaction_profile
+        return body
+
+    def request(self, kind: str) -> Tuple[str, str, dict]:
+        """(method, path, httpx kwargs) for one request of the given kind."""
+        email = self.rng.choice(self.users)
+        headers = self._auth(email)
+        if kind == "search":
+            body = {"query": self.rng.choice(self.queries), "top_k": self.rng.choice((3, 5, 10))}
+            return "POST", "/search", {"json": body, "headers": headers}
+        # re-ingest a bounded set of keys per user so the corpus doesn't grow without limit
+        key = f"live-{self.rng.randrange(self.args.ingest_keys)}"
+        if kind == "ingest":
+            return "POST", "/ingest", {"json": self._ingest_body(email, key), "headers": headers}
+        data = make_document(self.rng, self.queries).encode("utf-8")
+        params = {"redaction_profile": self.args.redaction_profile} if self.args.redaction_profile else None
+        return "POST", "/ingest_file", {
+            "files": {"file": (f"loadtest-{key}.txt", data, "text/plain")},
+            "params": params, "headers": headers,
+        }
+
+    # ---------- setup ----------
+    async def seed(self, client: httpx.AsyncClient) -> List[Tuple[str, str]]:
+        """Ingest seed documents for every user; returns [(owner email, doc_id)]."""
+        sem = asyncio.Semaphore(self.args.seed_concurrency)
+
+        async def one(email: str, j: int):
+            async with sem:
+                r = await client.post("/ingest", json=self._ingest_body(email, f"seed-{j}"), headers=self._auth(email))
+                r.raise_for_status()
+                return email, r.json()["doc_id"]
+
+        return await asyncio.gather(*(one(u, j) for u in self.users for j in range(self.args.seed_docs)))
+
+    def grant_fanout(self, docs: List[Tuple[str, str]]) -> Counter:
+        """Share each seeded document with k other users, k drawn from --fanout."""
+        from apps.db import get_conn, ensure_user, grant_viewers
+
+        fanout = Counter()
+        with get_conn() as conn:
+            user_ids = {u: ensure_user(conn, email=u, display_name=u) for u in self.users}
+            for owner, doc_id in docs:
+                k = min(self.rng.choice(self.args.fanout), len(self.users) - 1)
+                viewers = self.rng.sample([u for u in self.users if u != owner], k)
+                grant_viewers(conn, doc_id, [user_ids[u] for u in viewers])
+                fanout[k] += 1
+            conn.commit()
+        return fanout
+
+    # ---------- load ----------
+    async def _fire(self, client: httpx.AsyncClient, kind: str, scheduled: float, results: list) -> None:
+        loop = asyncio.get_running_loop()
+        method, path, kwargs = self.request(kind)
+        self.inflight += 1
+        try:
+            r = await client.request(method, path, **kwargs)
+            outcome = str(r.status_code)
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        finally:
+            self.inflight -= 1
+        results.append((kind, outcome, (loop.time() - scheduled) * 1000.0))
+
+    async def run_step(self, client: httpx.AsyncClient, rate: float) -> dict:
+        loop = asyncio.get_running_loop()
+        results: List[Tuple[str, str, float]] = []
+        dropped = Counter()
+        tasks = []
+        start = loop.time()
+        t = 0.0
+        while True:
+            t += self.rng.expovariate(rate)
+            if t >= self.args.duration:
+                break
+            delay = start + t - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = self.rng.choices(self.kinds, weights=self.weights)[0]
+            if self.inflight >= self.args.max_inflight:
+                dropped[kind] += 1
+                continue
+            tasks.append(asyncio.ensure_future(self._fire(client, kind, start + t, results)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+
+        endpoints = {k: _summarize([r for r in results if r[0] == k], dropped[k], elapsed)
+                     for k in self.kinds}
+        overall = _summarize(results, sum(dropped.values()), elapsed)
+        reasons = []
+        if overall["throughput_rps"] < self.args.min_throughput * rate:
+            reasons.append("throughput")
+        if overall["error_rate"] > self.args.max_error_rate:
+            reasons.append("errors")
+        if self.args.slo_p99_ms and overall["p99_ms"] > self.args.slo_p99_ms:
+            reasons.append("p99")
+        return {"target_rps": rate, "duration_s": round(elapsed, 3), "saturated": bool(reasons),
+                "saturation_reasons": reasons, "overall": overall, "endpoints": endpoints}
+
+
+def _summarize(results: List[Tuple[str, str, float]], dropped: int, elapsed: float) -> dict:
+    ok = [ms for _, outcome, ms in results if outcome.startswith("2")]
+    errors = Counter(outcome for _, outcome, _ in results if not outcome.startswith("2"))
+    if dropped:
+        errors["dropped"] = dropped
+    attempted = len(results) + dropped
+    return {
+        "attempted": attempted,
+        "ok": len(ok),
+        "errors": dict(errors),
+        "error_rate": round(sum(errors.values()) / attempted, 4) if attempted else 0.0,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(ok, 0.50), 1),
+        "p95_ms": round(percentile(ok, 0.95), 1),
+        "p99_ms": round(percentile(ok, 0.99), 1),
+        "max_ms": round(max(ok), 1) if ok else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    queries = load_queries(args.queries)
+    if not queries:
+        raise SystemExit("No queries loaded; pass --queries")
+    lt = LoadTest(args, queries)
+    report = {
+        "label": args.label,
+        "api_url": args.api_url,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "api_url", "label")},
+        "n_queries": len(queries),
+    }
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout, limits=limits) as client:
+        r = await client.get("/healthz")
+        r.raise_for_status()
+        report["server"] = r.json()
+
+        if args.seed_docs:
+            t0 = time.perf_counter()
+            docs = await lt.seed(client)
+            report["seed"] = {"documents": len(docs), "seconds": round(time.perf_counter() - t0, 1)}
+            if any(args.fanout):
+                if os.getenv("POSTGRES_DSN"):
+                    report["seed"]["fanout"] = dict(lt.grant_fanout(docs))
+                else:
+                    print("WARN: POSTGRES_DSN not set; seeded documents are not shared (no ACL fan-out)",
+                          file=sys.stderr)
+
+        steps = []
+        for rate in args.rates:
+            step = await lt.run_step(client, rate)
+            steps.append(step)
+            o = step["overall"]
+            print(f"{rate:8.1f} rps -> {o['throughput_rps']:8.1f} ok/s  p50 {o['p50_ms']:7.1f}  "
+                  f"p95 {o['p95_ms']:7.1f}  p99 {o['p99_ms']:7.1f} ms  errors {o['error_rate']:.2%}"
+                  + ("  SATURATED (" + ",".join(step["saturation_reasons"]) + ")" if step["saturated"] else ""),
+                  file=sys.stderr)
+            if step["saturated"] and not args.keep_going:
+                break
+
+    report["steps"] = steps
+    sustained = [s["target_rps"] for s in steps if not s["saturated"]]
+    report["max_sustained_rps"] = max(sustained) if sustained else None
+    report["saturated_at_rps"] = next((s["target_rps"] for s in steps if s["saturated"]), None)
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--api-url", default=API_URL)
+    ap.add_argument("--rates", type=_csv(float), default=[5.0, 10.0, 20.0, 40.0], help="target requests/sec per step")
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds per step")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix("search=0.9,ingest=0.07,ingest_file=0.03"))
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--fanout", type=_csv(int), default=[0, 1, 5, 20],
+                    help="viewers per seeded document, drawn uniformly from this list")
+    ap.add_argument("--seed-docs", type=int, default=2, help="documents each user ingests before the run (0 = none)")
+    ap.add_argument("--seed-concurrency", type=int, default=4)
+    ap.add_argument("--ingest-keys", type=int, default=3, help="distinct source_keys per user for live ingests")
+    ap.add_argument("--redaction-profile", default=None)
+    ap.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES, help="BEIR queries.jsonl and/or gold .json files")
+    ap.add_argument("--max-inflight", type=int, default=256)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--min-throughput", type=float, default=0.9, help="saturated below this fraction of target")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--slo-p99-ms", type=float, default=0.0, help="0 = no latency SLO")
+    ap.add_argument("--keep-going", action="store_true", help="run every rate even after saturation")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--label", default=os.getenv("LOADTEST_LABEL"), help="release/build label stored in the report")
+    ap.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    args = ap.parse_args()
+    if args.users < 1 or not args.rates or min(args.rates) <= 0:
+        raise SystemExit("--users and --rates must be positive")
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
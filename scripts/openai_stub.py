@@ -0,0 +1,124 @@
+"""
+Local stand-in for the OpenAI embeddings endpoint, for exercising
+apps/openai_embed.py without a key or network.
+
+  python scripts/openai_stub.py --port 8089 --fail-rate 0.05 --rate-limit-rate 0.05 --shuffle
+  export EMBEDDING_PROVIDER=openai OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+
+POST /v1/embeddings returns deterministic unit vectors (the same text always
+gets the same vector). It enforces the per-request input and token caps,
+injects 500s and 429s at the given rates, and with --shuffle returns data out
+of order, so clients must sort by index. GET /stats reports counters.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def vector(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).standard_normal(dim)
+    return (v / np.linalg.norm(v)).round(6).tolist()
+
+
+class Handler(BaseHTTPRequestHandler):
+    args = None
+    stats = {"requests": 0, "inputs": 0, "tokens": 0, "errors_500": 0, "errors_429": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def _send(self, status: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += n
+
+    def _error(self, status: int, message: str, kind: str, headers: dict = None) -> None:
+        self._send(status, {"error": {"message": message, "type": kind, "code": None}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.lock:
+                return self._send(200, dict(self.stats))
+        self._error(404, "not found", "invalid_request_error")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/embeddings":
+            return self._error(404, "not found", "invalid_request_error")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._count("requests")
+
+        if self.args.latency_ms:
+            time.sleep(self.args.latency_ms / 1000.0)
+        r = random.random()
+        if r < self.args.fail_rate:
+            self._count("errors_500")
+            return self._error(500, "injected server error", "server_error")
+        if r < self.args.fail_rate + self.args.rate_limit_rate:
+            self._count("errors_429")
+            return self._error(429, "injected rate limit", "rate_limit_exceeded",
+                               {"retry-after": str(self.args.retry_after)})
+
+        tokens = [max(1, len(t) // 4) for t in inputs or []]
+        if not inputs or len(inputs) > self.args.max_inputs or sum(tokens) > self.args.max_request_tokens \
+                or max(tokens) > self.args.max_input_tokens:
+            self._count("rejected")
+            return self._error(400, f"{len(inputs or [])} inputs / {sum(tokens)} tokens exceed the limits",
+                               "invalid_request_error")
+
+        data = [{"object": "embedding", "index": i, "embedding": vector(t, self.args.dim)}
+                for i, t in enumerate(inputs)]
+        if self.args.shuffle:
+            random.shuffle(data)
+        self._count("inputs", len(inputs))
+        self._count("tokens", sum(tokens))
+        self._send(200, {"object": "list", "data": data, "model": body.get("model"),
+                         "usage": {"prompt_tokens": sum(tokens), "total_tokens": sum(tokens)}})
+
+    def log_message(self, fmt, *args):
+        if self.args.verbose:
+            super().log_message(fmt, *args)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--max-inputs", type=int, default=2048)
+    ap.add_argument("--max-request-tokens", type=int, default=300000)
+    ap.add_argument("--max-input-tokens", type=int, default=8191)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    ap.add_argument("--retry-after", type=float, default=0.2, help="Retry-After seconds on 429")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--shuffle", action="store_true", help="return data out of index order")
+    ap.add_argument("--verbose", action="store_true")
+    Handler.args = ap.parse_args()
+
+    server = ThreadingHTTPServer((Handler.args.host, Handler.args.port), Handler)
+    print(f"OpenAI embeddings stub on http://{Handler.args.host}:{Handler.args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Zero-downtime re-embedding / embedding-model migration.
+
+Point the environment at the *new* model (EMBEDDING_PROVIDER, HF_MODEL, HF_DIM, ...)
+and run:
+
+  python scripts/reembed.py run [--cutover]   # resumable backfill into chunk_embedding_next
+  python scripts/reembed.py status            # coverage, throughput, ETA
+  python scripts/reembed.py cutover           # atomic table swap once coverage is 100%
+  python scripts/reembed.py catch-up          # embed chunks old-model API instances ingest after the swap
+  python scripts/reembed.py drop-prev         # final catch-up, then drop the old vectors
+
+Each API instance searches and ingests through the table that holds its own
+model's vectors (apps.db.embedding_table): the old model's in chunk_embedding
+and then chunk_embedding_prev, the new model's in chunk_embedding_next and then
+chunk_embedding. Instances can therefore be rolled at any time, before or after
+the swap, without losing results. Chunks ingested by old-model instances are
+picked up by the catch-up passes: during the backfill, under a lock that blocks
+new chunks at the swap (coverage is exactly 100% there), and after the swap
+until drop-prev, which refuses while the old model is still being written.
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
+import time
+from typing import Callable, List, Optional
+
+from apps import db
+from apps.db import vector_literal, ivfflat_lists
+from apps.embeddings import embed_texts, EMBEDDING_MODEL, EMBEDDING_DIM
+from apps.embed_pool import EmbeddingPool
+
+SHADOW = "chunk_embedding_next"
+PREV = "chunk_embedding_prev"
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+
+
+# ---------- schema ----------
+def ensure_shadow(conn, dim: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SHADOW} (
+              chunk_id    UUID PRIMARY KEY REFERENCES chunk(chunk_id) ON DELETE CASCADE,
+              embedding   vector({int(dim)}) NOT NULL,
+              model_name  TEXT NOT NULL,
+              created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{SHADOW}_model ON {SHADOW}(model_name);")
+    conn.commit()
+
+
+def table_exists(conn, name: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"public.{name}",))
+        return cur.fetchone()[0]
+
+
+# ---------- job / checkpoint ----------
+def active_job(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT job_id, target_model, dim, status, last_chunk_id, rows_done, started_at
+            FROM reembed_job WHERE status IN ('running', 'indexed');
+        """)
+        return cur.fetchone()
+
+
+def get_or_create_job(conn, model: str, dim: int):
+    job = active_job(conn)
+    if job:
+        if job[1] != model or job[2] != dim:
+            raise SystemExit(
+                f"Job {job[0]} is migrating to {job[1]} (dim {job[2]}), not {model} (dim {dim}). "
+                f"Finish it or mark it aborted first."
+            )
+        return job
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO reembed_job (target_model, dim) VALUES (%s, %s)
+            RETURNING job_id, target_model, dim, status, last_chunk_id, rows_done, started_at;
+        """, (model, dim))
+        job = cur.fetchone()
+    conn.commit()
+    return job
+
+
+def coverage(conn, model: str):
+    """(canonical chunks total, chunks with a target-model vector in the shadow table)"""
+    with conn.cursor() as cur:
+        # near-duplicates (dup_of) share their canonical's vector
+        cur.execute("SELECT COUNT(*) FROM chunk WHERE dup_of IS NULL;")
+        total = cur.fetchone()[0]
+        cur.execute(f"SELECT COUNT(*) FROM {SHADOW} WHERE model_name = %s;", (model,))
+        done = cur.fetchone()[0]
+    return total, done
+
+
+# ---------- backfill ----------
+def _write_batch(cur, ids, vectors, model: str, table: str = SHADOW) -> None:
+    cur.execute(f"""
+        INSERT INTO {table} (chunk_id, embedding, model_name)
+        SELECT t.chunk_id, t.v::vector, %s
+        FROM unnest(%s::uuid[], %s::text[]) AS t(chunk_id, v)
+        -- the chunk may have been re-ingested (deleted) since we read it
+        WHERE EXISTS (SELECT 1 FROM chunk c WHERE c.chunk_id = t.chunk_id)
+        ON CONFLICT (chunk_id) DO UPDATE
+          SET embedding = EXCLUDED.embedding, model_name = EXCLUDED.model_name, created_at = NOW();
+    """, (model, list(ids), [vector_literal(v) for v in vectors]))
+
+
+class Progress:
+    def __init__(self, total: int, done: int):
+        self.total, self.done = total, done
+        self.t0 = time.perf_counter()
+        self.rows = 0
+
+    def add(self, n: int) -> None:
+        self.rows += n
+        self.done += n
+        elapsed = time.perf_counter() - self.t0
+        rate = self.rows / elapsed if elapsed else 0.0
+        remaining = max(0, self.total - self.done)
+        eta = remaining / rate if rate else float("inf")
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        print(f"  {self.done}/{self.total} ({pct:.1f}%)  {rate:.1f} rows/s  ETA {eta:.0f}s", flush=True)
+
+
+def _throttle(batch_t0: float, n: int, max_rows_per_sec: float) -> None:
+    if max_rows_per_sec > 0:
+        min_dt = n / max_rows_per_sec
+        dt = time.perf_counter() - batch_t0
+        if dt < min_dt:
+            time.sleep(min_dt - dt)
+
+
+def backfill(conn, job, embed: EmbedFn, batch_size: int, max_rows_per_sec: float, progress: Progress) -> None:
+    """Keyset pass over all chunks; the checkpoint commits together with each batch."""
+    job_id, model, last = job[0], job[1], job[4]
+    while True:
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT chunk_id, redacted_text FROM chunk
+                WHERE (%s::uuid IS NULL OR chunk_id > %s::uuid) AND dup_of IS NULL
+                ORDER BY chunk_id
+                LIMIT %s;
+            """, (last, last, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                conn.commit()
+                return
+            ids = [r[0] for r in rows]
+            vectors = embed([r[1] for r in rows])
+            _write_batch(cur, ids, vectors, model)
+            last = ids[-1]
+            cur.execute("""
+                UPDATE reembed_job
+                SET last_chunk_id = %s, rows_done = rows_done + %s, updated_at = NOW()
+                WHERE job_id = %s;
+            """, (last, len(rows), job_id))
+        conn.commit()
+        progress.add(len(rows))
+        _throttle(t0, len(rows), max_rows_per_sec)
+
+
+def catch_up(conn, model: str, embed: EmbedFn, batch_size: int, max_rows_per_sec: float = 0.0,
+             progress: Optional[Progress] = None, commit: bool = True, table: str = SHADOW) -> int:
+    """Embed chunks that have no target-model vector in `table` yet (e.g. ingested mid-migration)."""
+    n_total = 0
+    while True:
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT c.chunk_id, c.redacted_text
+                FROM chunk c
+                LEFT JOIN {table} s ON s.chunk_id = c.chunk_id AND s.model_name = %s
+                WHERE s.chunk_id IS NULL AND c.dup_of IS NULL
+                ORDER BY c.chunk_id
+                LIMIT %s;
+            """, (model, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            _write_batch(cur, [r[0] for r in rows], embed([r[1] for r in rows]), model, table)
+        if commit:
+            conn.commit()
+        n_total += len(rows)
+        if progress:
+            progress.add(len(rows))
+        _throttle(t0, len(rows), max_rows_per_sec)
+    return n_total
+
+
+def build_index(conn, job) -> None:
+    total, _ = coverage(conn, job[1])
+    lists = ivfflat_lists(total)
+    print(f"Building ivfflat index on {SHADOW} (lists={lists}) ...", flush=True)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS idx_{SHADOW}_vec;")
+        cur.execute(f"""
+            CREATE INDEX idx_{SHADOW}_vec ON {SHADOW}
+            USING ivfflat (embedding vector_l2_ops) WITH (lists = {lists});
+        """)
+        cur.execute("UPDATE reembed_job SET status = 'indexed', updated_at = NOW() WHERE job_id = %s;", (job[0],))
+    conn.commit()
+
+
+# ---------- cutover ----------
+def _rename_indexes(cur, table: str, old: str, new: str) -> None:
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s;", (table,))
+    for (name,) in cur.fetchall():
+        renamed = name.replace(old, new) if old in name else f"{name}_{new}"
+        cur.execute(f'ALTER INDEX "{name}" RENAME TO "{renamed}";')
+
+
+def cutover(conn, job, embed: EmbedFn, batch_size: int, lock_timeout: str = "5s") -> None:
+    if table_exists(conn, PREV):
+        raise SystemExit(f"{PREV} still exists from an earlier migration; run drop-prev first.")
+    model = job[1]
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{lock_timeout}';")
+        # SHARE blocks new chunks (ingest) but not searches; coverage cannot move under us
+        cur.execute("LOCK TABLE chunk IN SHARE MODE;")
+        late = catch_up(conn, model, embed, batch_size, commit=False)
+        cur.execute("""
+            SELECT COUNT(*) FROM chunk c
+            LEFT JOIN chunk_embedding_next s ON s.chunk_id = c.chunk_id AND s.model_name = %s
+            WHERE s.chunk_id IS NULL AND c.dup_of IS NULL;
+        """, (model,))
+        missing = cur.fetchone()[0]
+        if missing:
+            conn.rollback()
+            raise SystemExit(f"Coverage is not 100% ({missing} chunks missing); not cutting over.")
+
+        cur.execute("ALTER TABLE chunk_embedding RENAME TO chunk_embedding_prev;")
+        _rename_indexes(cur, PREV, "chunk_embedding", PREV)
+        cur.execute("ALTER TABLE chunk_embedding_next RENAME TO chunk_embedding;")
+        _rename_indexes(cur, "chunk_embedding", SHADOW, "chunk_embedding")
+        cur.execute("UPDATE reembed_job SET status = 'cut_over', updated_at = NOW() WHERE job_id = %s;", (job[0],))
+    conn.commit()
+    print(f"Cut over to {model} ({late} late chunks embedded under lock). Old vectors are in {PREV}; "
+          f"API instances still on the old model keep using them. Roll them, then run "
+          f"`reembed.py catch-up` and `reembed.py drop-prev`.")
+
+
+# ---------- commands ----------
+def _embed_fn(workers: int, threads: int):
+    if workers > 0:
+        pool = EmbeddingPool(workers, threads)
+        return pool.embed_texts, pool
+    return embed_texts, None
+
+
+def cmd_status(conn, args) -> None:
+    job = active_job(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT model_name, COUNT(*) FROM chunk_embedding GROUP BY model_name ORDER BY 2 DESC;")
+        live = cur.fetchall()
+    print(f"Configured model: {EMBEDDING_MODEL} (dim {EMBEDDING_DIM})")
+    print(f"Live chunk_embedding models: {live}")
+    if not job:
+        print("No active re-embedding job.")
+        return
+    total, done = coverage(conn, job[1]) if table_exists(conn, SHADOW) else (0, 0)
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXTRACT(EPOCH FROM (NOW() - %s));", (job[6],))
+        elapsed = float(cur.fetchone()[0])
+    rate = job[5] / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else float("inf")
+    print(f"Job {job[0]} -> {job[1]} [{job[3]}]: {done}/{total} chunks "
+          f"({100.0 * done / total if total else 100.0:.1f}%), {rate:.1f} rows/s avg, ETA {eta:.0f}s")
+
+
+def cmd_run(conn, args) -> None:
+    job = get_or_create_job(conn, EMBEDDING_MODEL, EMBEDDING_DIM)
+    ensure_shadow(conn, EMBEDDING_DIM)
+    embed, pool = _embed_fn(args.workers, args.threads)
+    try:
+        total, done = coverage(conn, job[1])
+        print(f"Job {job[0]}: re-embedding {total} chunks with {job[1]} ({done} already done)")
+        progress = Progress(total, done)
+        if job[3] == "running":
+            backfill(conn, job, embed, args.batch_size, args.max_rows_per_sec, progress)
+        catch_up(conn, job[1], embed, args.batch_size, args.max_rows_per_sec, progress)
+        total, done = coverage(conn, job[1])
+        if job[3] == "running" or args.reindex:
+            build_index(conn, job)
+        print(f"Coverage {done}/{total}.")
+        if args.cutover:
+            cutover(conn, active_job(conn), embed, args.batch_size)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def cmd_cutover(conn, args) -> None:
+    job = active_job(conn)
+    if not job or job[3] != "indexed":
+        raise SystemExit("No indexed re-embedding job; run `reembed.py run` first.")
+    cutover(conn, job, embed_texts, args.batch_size)
+
+
+def cut_over_job(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT job_id, target_model, dim, status, last_chunk_id, rows_done, updated_at
+            FROM reembed_job WHERE status = 'cut_over' ORDER BY job_id DESC LIMIT 1;
+        """)
+        return cur.fetchone()
+
+
+def cmd_catch_up(conn, args) -> None:
+    job = cut_over_job(conn)
+    if not job or not table_exists(conn, PREV):
+        raise SystemExit(f"No cut-over job with {PREV} in place; nothing to catch up.")
+    embed, pool = _embed_fn(args.workers, args.threads)
+    try:
+        while True:
+            n = catch_up(conn, job[1], embed, args.batch_size, args.max_rows_per_sec, table="chunk_embedding")
+            print(f"Embedded {n} chunks ingested by old-model instances.", flush=True)
+            if not args.every:
+                break
+            time.sleep(args.every)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def cmd_drop_prev(conn, args) -> None:
+    job = cut_over_job(conn)
+    if job and table_exists(conn, PREV):
+        # old-model instances write to PREV until they are rolled
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT COUNT(*) FROM {PREV}
+                WHERE created_at > GREATEST(%s, NOW() - make_interval(mins => %s));
+            """, (job[6], args.quiet_minutes))
+            recent = cur.fetchone()[0]
+        if recent and not args.force:
+            raise SystemExit(f"{recent} old-model vectors written to {PREV} in the last {args.quiet_minutes} "
+                             f"minutes; some API instances are still on the old model. Roll them first "
+                             f"(or pass --force).")
+        n = catch_up(conn, job[1], embed_texts, args.batch_size, table="chunk_embedding")
+        print(f"Embedded {n} chunks ingested by old-model instances.")
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {PREV};")
+    conn.commit()
+    print(f"Dropped {PREV}.")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Resumable background re-embedding and model cutover")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="backfill/catch up the shadow table and build its index")
+    run.add_argument("--batch-size", type=int, default=256)
+    run.add_argument("--max-rows-per-sec", type=float, default=0.0, help="throttle (0 = unthrottled)")
+    run.add_argument("--workers", type=int, default=0, help="embedding worker processes (0 = in-process)")
+    run.add_argument("--threads", type=int, default=2, help="torch threads per worker")
+    run.add_argument("--reindex", action="store_true", help="rebuild the shadow index even if already built")
+    run.add_argument("--cutover", action="store_true", help="swap tables when done")
+
+    cut = sub.add_parser("cutover", help="atomically swap chunk_embedding_next in")
+    cut.add_argument("--batch-size", type=int, default=256)
+    sub.add_parser("status", help="coverage, throughput and ETA")
+    cu = sub.add_parser("catch-up", help="after cutover: embed chunks ingested by old-model API instances")
+    cu.add_argument("--batch-size", type=int, default=256)
+    cu.add_argument("--max-rows-per-sec", type=float, default=0.0, help="throttle (0 = unthrottled)")
+    cu.add_argument("--workers", type=int, default=0, help="embedding worker processes (0 = in-process)")
+    cu.add_argument("--threads", type=int, default=2, help="torch threads per worker")
+    cu.add_argument("--every", type=int, default=0, help="repeat every N seconds (0 = once)")
+    drop = sub.add_parser("drop-prev", help="final catch-up, then drop chunk_embedding_prev")
+    drop.add_argument("--batch-size", type=int, default=256)
+    drop.add_argument("--quiet-minutes", type=int, default=10,
+                      help="refuse if the old model was written to within this many minutes")
+    drop.add_argument("--force", action="store_true", help="drop even if the old model is still written")
+    args = ap.parse_args()
+
+    with db.get_conn() as conn:
+        conn.execute("SET TIME ZONE 'UTC';")
+        {"run": cmd_run, "cutover": cmd_cutover, "status": cmd_status, "catch-up": cmd_catch_up,
+         "drop-prev": cmd_drop_prev}[args.cmd](conn, args)
+
+
+if __name__ == "__main__":
+    main()
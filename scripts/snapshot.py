@@ -0,0 +1,114 @@
+"""
+Export the corpus (users, documents, ACLs, redacted chunks, embeddings, near-dup
+and ingest bookkeeping) to a snapshot directory, and restore it elsewhere
+without re-running download/clean/redact/embed.
+
+  python scripts/snapshot.py export snapshots/sec-2026-10 [--dtype float16]
+  python scripts/snapshot.py import snapshots/sec-2026-10 [--replace] [--verify]
+  python scripts/snapshot.py info snapshots/sec-2026-10
+
+The format is described in apps/snapshot.py; every column is a .npy (or
+.bin + offsets) file, so offline evaluation can memory-map it directly, e.g.
+np.load(".../chunk_embedding/embedding.npy", mmap_mode="r").
+Import needs a database with the same schema (db_schema/init + migrations)
+and restores everything in one transaction.
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
+import time
+import uuid
+from pathlib import Path
+
+from apps import db
+from apps import vector_index as vi
+from apps.snapshot import (
+    SnapshotError, export_snapshot, import_snapshot, read_manifest, EMBEDDING_TABLE,
+)
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def _size(manifest) -> int:
+    return sum(f["bytes"] for f in manifest["files"].values())
+
+
+def _default_model(conn) -> str:
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT model_name FROM chunk_embedding;")
+        models = [r[0] for r in cur.fetchall()]
+    conn.rollback()
+    if len(models) != 1:
+        raise SnapshotError(f"chunk_embedding holds {len(models)} models {models}; pick one with --model")
+    return models[0]
+
+
+def cmd_export(args) -> None:
+    t0 = time.perf_counter()
+    with db.get_conn() as conn:
+        model = args.model or _default_model(conn)
+        manifest = export_snapshot(conn, args.path, model, args.dtype)
+    secs = time.perf_counter() - t0
+    size = _size(manifest)
+    print(f"Exported {_mb(size)} in {secs:.1f}s ({_mb(size / secs)}/s) to {args.path}")
+
+
+def cmd_import(args) -> None:
+    t0 = time.perf_counter()
+    manifest = read_manifest(args.path)
+    with db.get_conn() as conn:
+        lists = import_snapshot(conn, args.path, replace=args.replace, verify=args.verify,
+                                maintenance_work_mem=vi.INDEX_MAINTENANCE_WORK_MEM)
+        secs = time.perf_counter() - t0
+        # record the rebuilt ivfflat index as scripts/index_maintenance.py's new baseline
+        conn.autocommit = True
+        n_rows = manifest["tables"][EMBEDDING_TABLE]["rows"]
+        for name, n_lists in lists.items():
+            probes = vi.probes_for(n_lists) if vi.INDEX_SET_PROBES else None
+            if probes:
+                vi.set_database_probes(conn, probes)
+            vi.log_run(conn, run_id=uuid.uuid4(), index_name=name, action="rebuild",
+                       reason=f"snapshot import {Path(args.path).name}", n_rows=n_rows,
+                       lists_after=n_lists, probes_after=probes, seconds=secs,
+                       postmaster_start=vi.postmaster_start(conn))
+    size = _size(manifest)
+    print(f"Imported {_mb(size)} in {secs:.1f}s ({_mb(size / secs)}/s) from {args.path}")
+    print(f"Embedding model: {manifest['model_name']} ({manifest['dim']}-d); the API must be configured for it.")
+
+
+def cmd_info(args) -> None:
+    manifest = read_manifest(args.path)
+    print(f"{args.path}: {manifest['format']} v{manifest['version']}, created {manifest['created_at']}")
+    print(f"  model {manifest['model_name']} ({manifest['dim']}-d, stored as {manifest['dtype']}), "
+          f"Postgres {manifest['source']['server_version']}, pgvector {manifest['source']['pgvector']}")
+    for table, meta in manifest["tables"].items():
+        size = sum(f["bytes"] for rel, f in manifest["files"].items() if rel.startswith(table + "/"))
+        print(f"  {table:18s} {meta['rows']:>12,d} rows {_mb(size):>12s}")
+    print(f"Total: {_mb(_size(manifest))}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=("export", "import", "info"))
+    ap.add_argument("path", help="snapshot directory")
+    ap.add_argument("--model", help="export: embedding model_name (default: the only one present)")
+    ap.add_argument("--dtype", choices=("float32", "float16"), default="float32",
+                    help="export: embedding storage; float16 halves the size")
+    ap.add_argument("--replace", action="store_true",
+                    help="import: overwrite a non-empty corpus (also empties traces and slow request logs)")
+    ap.add_argument("--verify", action="store_true", help="import: check sha256 of every file first")
+    args = ap.parse_args()
+
+    try:
+        {"export": cmd_export, "import": cmd_import, "info": cmd_info}[args.command](args)
+    except SnapshotError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
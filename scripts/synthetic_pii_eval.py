@@ -1,36 +1,53 @@
+"""
+Synthetic PII redaction eval: span-level precision / recall / F1 per entity,
+with 95% confidence intervals and throughput, for each redaction profile.
+
+  python -m scripts.synthetic_pii_eval --samples 500000 --workers 8
+
+Samples are generated lazily in shards of --shard-size sentences. Shard i is
+seeded with SEED + i, so each worker regenerates its own shards (nothing but
+counts crosses process boundaries) and results do not depend on --workers.
+A detection is a true positive only if its (entity_type, start, end) equals a
+gold span exactly; a partial or mistyped span is one FP plus one FN.
+"""
+import argparse
 import os
 import random
-import re
-from typing import Dict, List, Tuple
-from uuid import uuid4
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import psycopg
 from faker import Faker
 
-from ingest.pii import redact_and_report, SUPPORTED_ENTITIES
+from ingest.pii import analyze_spans, get_analyzer, SUPPORTED_ENTITIES, PROFILES
 
 # Config
-N_SAMPLES = int(os.getenv("PII_EVAL_SAMPLES", "100"))
+N_SAMPLES = int(os.getenv("PII_EVAL_SAMPLES", "200000"))
+SHARD_SIZE = int(os.getenv("PII_EVAL_SHARD_SIZE", "2000"))
 SEED = 42
+Z = 1.96            # 95% intervals
+BOOTSTRAP = 1000    # shard resamples for the F1 interval
 
-fake = Faker()
-random.seed(SEED)
-Faker.seed(SEED)
+Span = Tuple[str, int, int]
+Counts = Dict[str, List[int]]  # entity_type -> [tp, fp, fn]
 
 # Simple generators for our four entities
-def gen_person():
+def gen_person(fake: Faker, rng: random.Random) -> str:
     return fake.name()
 
-def gen_email():
+def gen_email(fake: Faker, rng: random.Random) -> str:
     return fake.email()
 
-def gen_phone():
+def gen_phone(fake: Faker, rng: random.Random) -> str:
     # Keep simple US-like; Presidio PHONE_NUMBER handles formats
     return fake.phone_number()
 
-def gen_ssn():
+def gen_ssn(fake: Faker, rng: random.Random) -> str:
     # 3-2-4 digits; not real
-    return f"{random.randint(100,999)}-{random.randint(10,99)}-{random.randint(1000,9999)}"
+    return f"{rng.randint(100,999)}-{rng.randint(10,99)}-{rng.randint(1000,9999)}"
 
 GEN_MAP = {
     "PERSON": gen_person,
@@ -39,42 +56,61 @@ GEN_MAP = {
     "US_SSN": gen_ssn,
 }
 
-def make_sentence() -> Tuple[str, List[Tuple[str, str]]]:
+def make_sentence(fake: Faker, rng: random.Random) -> Tuple[str, List[Span]]:
     """
-    Returns: (text, gold) where gold is list of (entity_type, surface_text).
+    Returns: (text, gold) where gold is list of (entity_type, start, end).
     We keep it simple: embed 1-3 entities per sentence.
     """
-    ents = random.sample(SUPPORTED_ENTITIES, k=random.randint(1, min(3, len(SUPPORTED_ENTITIES))))
-    parts = []
-    gold = []
-    for et in ents:
-        val = GEN_MAP[et]()
-        gold.append((et, val))
-        parts.append({
-            "et": et,
-            "val": val
-        })
+    ents = rng.sample(SUPPORTED_ENTITIES, k=rng.randint(1, min(3, len(SUPPORTED_ENTITIES))))
+    parts = [(et, GEN_MAP[et](fake, rng)) for et in ents]
     # Simple template shuffle
-    random.shuffle(parts)
-    # Construct a sentence
-    s = f"{parts[0]['val']} reached out to us."
-    for p in parts[1:]:
-        s += f" Their {p['et'].replace('_',' ').lower()} is {p['val']}."
+    rng.shuffle(parts)
+    # Construct a sentence, recording where each value lands
+    et, val = parts[0]
+    gold = [(et, 0, len(val))]
+    s = f"{val} reached out to us."
+    for et, val in parts[1:]:
+        s += f" Their {et.replace('_',' ').lower()} is "
+        gold.append((et, len(s), len(s) + len(val)))
+        s += f"{val}."
     return s, gold
 
-def span_match(gold_text: str, detected_count: int, text: str) -> Tuple[int, int, int]:
-    """
-    Best-effort matching by string containment count.
-    For synthetic data this is reliable because we know exact surfaces.
-    Returns tp, fp, fn for this entity instance type on a single sentence.
-    """
-    # Count exact surface occurrences
-    gold_occ = len([m for m in re.finditer(re.escape(gold_text), text)])
-    # If Presidio found N instances for that type in this sentence, we approximate TP as min(gold_occ, detected_count).
-    tp = min(gold_occ, detected_count)
-    fn = max(0, gold_occ - tp)
-    fp = max(0, detected_count - tp)
-    return tp, fp, fn
+# Per-process state, set up by _init_worker
+_fake: Optional[Faker] = None
+_profile: Optional[str] = None
+
+def _init_worker(profile: str) -> None:
+    global _fake, _profile
+    _fake = Faker()
+    _profile = profile
+    get_analyzer(profile)  # model loading stays out of the scoring time
+
+def iter_shard(fake: Faker, shard: int, size: int) -> Iterator[Tuple[str, List[Span]]]:
+    """The samples of one shard, deterministic in (SEED, shard)."""
+    fake.seed_instance(SEED + shard)
+    rng = random.Random(SEED + shard)
+    for _ in range(size):
+        yield make_sentence(fake, rng)
+
+def score_shard(shard: int, size: int) -> Tuple[Counts, Dict[str, int], int, float, float]:
+    """Score one shard; returns (counts, gold spans per entity, docs, start, end wall-clock)."""
+    counts: Counts = {et: [0, 0, 0] for et in SUPPORTED_ENTITIES}
+    gold_n = {et: 0 for et in SUPPORTED_ENTITIES}
+    docs = 0
+    t0 = time.time()
+    for text, gold in iter_shard(_fake, shard, size):
+        gold_set = set(gold)
+        detected = set(analyze_spans(text, profile=_profile))
+        for et, _, _ in gold_set & detected:
+            counts[et][0] += 1
+        for et, _, _ in detected - gold_set:
+            counts.setdefault(et, [0, 0, 0])[1] += 1
+        for et, _, _ in gold_set - detected:
+            counts[et][2] += 1
+        for et, _, _ in gold:
+            gold_n[et] += 1
+        docs += 1
+    return counts, gold_n, docs, t0, time.time()
 
 def micro_compute(total_tp, total_fp, total_fn):
     prec = (total_tp / (total_tp + total_fp)) if (total_tp + total_fp) else 0.0
@@ -82,66 +118,130 @@ def micro_compute(total_tp, total_fp, total_fn):
     f1   = (2*prec*rec / (prec + rec)) if (prec + rec) else 0.0
     return prec, rec, f1
 
-def main():
-    DSN = os.getenv("POSTGRES_DSN")
-    if not DSN:
-        raise RuntimeError("POSTGRES_DSN not set.")
-
-    # Accumulators
-    per_entity = {et: {"tp":0,"fp":0,"fn":0} for et in SUPPORTED_ENTITIES}
-
-    samples = [make_sentence() for _ in range(N_SAMPLES)]
-
-    for text, gold in samples:
-        redacted, counts = redact_and_report(text)  # counts = {entity_type: n}
-
-        # For each entity type present in gold for this sentence, compute tp/fp/fn
-        # Based on surface occurrences & detected counts for that type in this sentence
-        # (Synthetic → exact surface; for real corpora you’d match spans.)
-        per_type_seen = {}
-        for et, surface in gold:
-            det_count = counts.get(et, 0)
-            tp, fp, fn = span_match(surface, det_count, text)
-            per_entity[et]["tp"] += tp
-            per_entity[et]["fp"] += fp
-            per_entity[et]["fn"] += fn
-            per_type_seen[et] = True
-
-        # Count false positives for types not in gold but detected
-        for et, det_count in counts.items():
-            if et not in per_type_seen and det_count > 0:
-                per_entity[et]["fp"] += det_count
+def wilson(k: int, n: int, z: float = Z) -> Tuple[float, float]:
+    """Wilson score interval for a proportion k/n (well behaved near 0 and 1)."""
+    if n == 0:
+        return 0.0, 0.0
+    p = k / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * ((p * (1 - p) / n + z * z / (4 * n * n)) ** 0.5) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def f1_interval(per_shard: np.ndarray, rounds: int = BOOTSTRAP) -> Tuple[float, float]:
+    """Percentile bootstrap over shards; per_shard is an (n_shards, 3) array of tp/fp/fn."""
+    if len(per_shard) < 2:
+        f1 = micro_compute(*per_shard.sum(axis=0))[2] if len(per_shard) else 0.0
+        return f1, f1
+    rng = np.random.default_rng(SEED)
+    idx = rng.integers(0, len(per_shard), size=(rounds, len(per_shard)))
+    tp, fp, fn = per_shard[idx].sum(axis=1).T.astype(float)
+    denom = 2 * tp + fp + fn
+    f1 = np.divide(2 * tp, denom, out=np.zeros_like(tp), where=denom > 0)
+    lo, hi = np.percentile(f1, [2.5, 97.5])
+    return float(lo), float(hi)
+
+def evaluate(profile: str, n_samples: int, workers: int, shard_size: int):
+    """
+    Score n_samples sentences with one profile across worker processes.
+    Returns (metrics_rows, micro p/r/f1, docs/sec).
+    """
+    shards = [(i, min(shard_size, n_samples - i * shard_size))
+              for i in range((n_samples + shard_size - 1) // shard_size)]
+    per_shard: Dict[str, List[List[int]]] = {}
+    gold_n = {et: 0 for et in SUPPORTED_ENTITIES}
+    docs, first, last = 0, None, None
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(profile,)) as pool:
+        futures = [pool.submit(score_shard, i, size) for i, size in shards]
+        for done, fut in enumerate(as_completed(futures), start=1):
+            counts, shard_gold, n, t0, t1 = fut.result()
+            for et, c in counts.items():
+                per_shard.setdefault(et, []).append(c)
+            for et, g in shard_gold.items():
+                gold_n[et] += g
+            docs += n
+            first = t0 if first is None else min(first, t0)
+            last = t1 if last is None else max(last, t1)
+            if done % max(1, len(shards) // 10) == 0 or done == len(shards):
+                print(f"[{profile}] {docs}/{n_samples} docs scored")
+
+    # throughput over the scoring window; worker start-up and model load are outside it
+    elapsed = max(1e-9, last - first)
+    docs_per_sec = docs / elapsed
 
-    # Compute per-entity metrics + micro-average
     overall_tp = overall_fp = overall_fn = 0
     metrics_rows = []
-    for et, agg in per_entity.items():
-        tp, fp, fn = agg["tp"], agg["fp"], agg["fn"]
+    for et in sorted(per_shard):
+        arr = np.array(per_shard[et], dtype=np.int64)
+        tp, fp, fn = (int(x) for x in arr.sum(axis=0))
         overall_tp += tp; overall_fp += fp; overall_fn += fn
         p, r, f1 = micro_compute(tp, fp, fn)
-        metrics_rows.append((et, tp, fp, fn, p, r, f1))
-
-    mp, mr, mf1 = micro_compute(overall_tp, overall_fp, overall_fn)
+        metrics_rows.append((et, tp, fp, fn, p, r, f1,
+                             *wilson(tp, tp + fp), *wilson(tp, tp + fn), *f1_interval(arr),
+                             gold_n.get(et, 0) / elapsed))
 
-    # Persist to DB
-    with psycopg.connect(DSN) as conn:
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO pii_eval_run (notes) VALUES (%s) RETURNING run_id;", ("synthetic PII eval",))
-            run_id = cur.fetchone()[0]
+    return metrics_rows, micro_compute(overall_tp, overall_fp, overall_fn), docs_per_sec
 
-            cur.executemany("""
-                INSERT INTO pii_eval_entity_metrics (run_id, entity_type, tp, fp, fn, precision, recall, f1)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-            """, [(run_id, et, tp, fp, fn, p, r, f1) for (et, tp, fp, fn, p, r, f1) in metrics_rows])
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profiles", default=",".join(PROFILES),
+                    help=f"comma-separated redaction profiles to compare (default: {','.join(PROFILES)})")
+    ap.add_argument("--samples", type=int, default=N_SAMPLES, help="sentences per profile (PII_EVAL_SAMPLES)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="sentences per unit of work")
+    args = ap.parse_args()
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        raise SystemExit(f"Unknown profile(s) {unknown}; expected {PROFILES}")
+    if args.samples < 1 or args.workers < 1 or args.shard_size < 1:
+        raise SystemExit("--samples, --workers and --shard-size must be positive")
 
-            cur.execute("""
-                INSERT INTO pii_eval_overall (run_id, micro_precision, micro_recall, micro_f1)
-                VALUES (%s, %s, %s, %s);
-            """, (run_id, mp, mr, mf1))
-        conn.commit()
+    DSN = os.getenv("POSTGRES_DSN")
+    if not DSN:
+        raise RuntimeError("POSTGRES_DSN not set.")
 
-    print("Synthetic PII eval complete.")
-    print(f"Micro-Precision: {mp:.3f}  Micro-Recall: {mr:.3f}  Micro-F1: {mf1:.3f}")
+    summary = []
+    for profile in profiles:
+        metrics_rows, (mp, mr, mf1), docs_per_sec = evaluate(profile, args.samples, args.workers, args.shard_size)
+        summary.append((profile, metrics_rows, mp, mr, mf1, docs_per_sec))
+
+        # Persist to DB; per-entity rows go in as one INSERT ... SELECT FROM unnest
+        cols = list(zip(*metrics_rows))
+        with psycopg.connect(DSN) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO pii_eval_run (notes, profile, docs_per_sec, n_samples)
+                    VALUES (%s, %s, %s, %s) RETURNING run_id;
+                """, (f"synthetic PII eval ({profile}, span-level)", profile, docs_per_sec, args.samples))
+                run_id = cur.fetchone()[0]
+
+                cur.execute("""
+                    INSERT INTO pii_eval_entity_metrics
+                      (run_id, entity_type, tp, fp, fn, precision, recall, f1,
+                       precision_lo, precision_hi, recall_lo, recall_hi, f1_lo, f1_hi, spans_per_sec)
+                    SELECT %s, m.*
+                    FROM unnest(%s::text[], %s::int[], %s::int[], %s::int[],
+                                %s::float8[], %s::float8[], %s::float8[],
+                                %s::float8[], %s::float8[], %s::float8[], %s::float8[],
+                                %s::float8[], %s::float8[], %s::float8[]) AS m;
+                """, (run_id, *[list(c) for c in cols]))
+
+                cur.execute("""
+                    INSERT INTO pii_eval_overall (run_id, micro_precision, micro_recall, micro_f1)
+                    VALUES (%s, %s, %s, %s);
+                """, (run_id, mp, mr, mf1))
+            conn.commit()
+
+    print(f"Synthetic PII eval complete ({args.samples} docs per profile, {args.workers} workers).")
+    print(f"{'profile':10s} {'entity':14s} {'precision':>19s} {'recall':>19s} {'f1':>19s} {'spans/s':>9s}")
+    for profile, metrics_rows, mp, mr, mf1, dps in summary:
+        for et, tp, fp, fn, p, r, f1, p_lo, p_hi, r_lo, r_hi, f_lo, f_hi, sps in metrics_rows:
+            print(f"{profile:10s} {et:14s} {p:.3f} [{p_lo:.3f},{p_hi:.3f}] {r:.3f} [{r_lo:.3f},{r_hi:.3f}] "
+                  f"{f1:.3f} [{f_lo:.3f},{f_hi:.3f}] {sps:9.1f}")
+        print(f"{profile:10s} {'(micro)':14s} {mp:19.3f} {mr:19.3f} {mf1:19.3f}   {dps:.1f} docs/s")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,53 @@
+"""
+Retention and compaction of retrieval traces (run daily, e.g. from cron).
+
+  python scripts/trace_maintenance.py            # ensure partitions, drop expired, compact
+  python scripts/trace_maintenance.py status     # partitions, layout and size
+
+Policy comes from TRACE_RETENTION_DAYS, TRACE_COMPACT_AFTER_DAYS and
+TRACE_PARTITIONS_AHEAD (see apps/trace_retention.py); flags override them.
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import argparse
+
+from apps import db
+from apps.trace_retention import (
+    ensure_partitions, drop_expired, compact, partition_stats,
+    TRACE_RETENTION_DAYS, TRACE_COMPACT_AFTER_DAYS, TRACE_PARTITIONS_AHEAD,
+)
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", nargs="?", default="run", choices=("run", "status"))
+    ap.add_argument("--retention-days", type=int, default=TRACE_RETENTION_DAYS, help="0 = keep forever")
+    ap.add_argument("--compact-after-days", type=int, default=TRACE_COMPACT_AFTER_DAYS, help="0 = never")
+    ap.add_argument("--ahead", type=int, default=TRACE_PARTITIONS_AHEAD, help="months of partitions to pre-create")
+    args = ap.parse_args()
+
+    with db.get_conn() as conn:
+        if args.command == "run":
+            for name in ensure_partitions(conn, args.ahead):
+                print(f"created   {name}")
+            for name in drop_expired(conn, args.retention_days):
+                print(f"dropped   {name}")
+            for name in compact(conn, args.compact_after_days):
+                print(f"compacted {name}")
+
+        total = 0
+        for name, layout, size in partition_stats(conn):
+            total += size
+            print(f"  {name:40s} {layout:10s} {_mb(size):>10s}")
+        print(f"Total: {_mb(total)}")
+
+
+if __name__ == "__main__":
+    main()